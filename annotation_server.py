@@ -0,0 +1,830 @@
+import argparse
+import getpass
+import hashlib
+import http.client
+import json
+import os
+import posixpath
+import queue
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from annotations import TXT_EXTENSION, decode_sidecar, encode_sidecar, find_sidecar, read_sidecar_content
+from convert import batched, iter_images
+from dataset_index import MISSING, sidecar_signature
+from image_headers import IMAGE_EXTENSIONS
+from persistence import atomic_write
+
+SERVER_VAR = "ANNOTATION_TOOL_SERVER"
+ANNOTATOR_VAR = "ANNOTATION_TOOL_ANNOTATOR"
+DEFAULT_PORT = 8765
+LEASE_SECONDS = 300
+# Requests made on the GUI thread give up after INTERACTIVE_TIMEOUT seconds,
+# and are not tried again for OFFLINE_SECONDS once the server stopped
+# answering, so moving between images never waits long on a server that is
+# down. The sync thread keeps retrying with the normal timeout.
+INTERACTIVE_TIMEOUT = 2
+OFFLINE_SECONDS = 15
+
+
+def server_cache_root() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "image-annotation-tool", "server")
+
+
+def relative_path(root, image_path) -> str:
+    # Images are named by their path under the dataset root, with "/" separators,
+    # so clients that mount the share in different places agree on names.
+    return os.path.relpath(image_path, root).replace(os.sep, "/")
+
+
+def checked_path(root, path) -> str:
+    # Normalizes an image path sent by a client. Raises ValueError unless it
+    # names an image file inside `root`: the mirror writes a sidecar next to
+    # every path it is given, and the server has no authentication.
+    if not isinstance(path, str):
+        raise ValueError(f"image path must be a string, not {type(path).__name__}")
+    normalized = posixpath.normpath(path)
+    if (not normalized.lower().endswith(IMAGE_EXTENSIONS) or normalized.startswith(("/", "../"))
+            or normalized == ".." or "\\" in normalized or os.path.isabs(normalized)):
+        raise ValueError(f"{path!r} is not an image path under the dataset root")
+    real_root = os.path.realpath(root)
+    real_path = os.path.realpath(os.path.join(real_root, *normalized.split("/")))
+    if os.path.commonpath([real_root, real_path]) != real_root:
+        raise ValueError(f"{path!r} is not an image path under the dataset root")
+    return normalized
+
+###############################################################################
+#                              Annotation Database                            #
+###############################################################################
+# Shared annotation state of one dataset, owned by the server. Nothing here
+# imports Qt. Every box has a client-chosen 63-bit id and a version that goes
+# up with every change; a change names the version it was based on and is
+# refused when the box moved on since, so two annotators never silently
+# overwrite each other's boxes. Images carry the lease of the annotator
+# working on them and a done flag. The TXT (or .box) sidecars are a mirror of
+# this database, written by the server only.
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE images (
+    path TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    expires REAL,
+    mtime_ns INTEGER,
+    size INTEGER
+);
+CREATE INDEX images_open ON images(done, path);
+CREATE INDEX images_owner ON images(owner);
+CREATE TABLE boxes (
+    path TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    cx REAL NOT NULL, cy REAL NOT NULL, w REAL NOT NULL, h REAL NOT NULL,
+    PRIMARY KEY (path, id)
+);
+"""
+
+
+class AnnotationDatabase:
+    # One SQLite connection shared by the request threads; every call is one
+    # short transaction under the lock, so batches from different annotators
+    # are applied one after another and never interleave.
+    def __init__(self, filename):
+        self.filename = filename
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        # Unlike the index, this is the only copy of edits not mirrored yet.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with self._db:
+                for table in ("boxes", "images"):
+                    self._db.execute(f"DROP TABLE IF EXISTS {table}")
+                self._db.executescript(SCHEMA)
+                self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._ids = np.random.default_rng()
+
+    @classmethod
+    def for_dataset(cls, root, cache_root=None):
+        key = os.path.abspath(root)
+        directory = cache_root or server_cache_root()
+        return cls(os.path.join(directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".sqlite"))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def import_sidecars(self, root) -> dict:
+        # Brings in images and sidecars added or edited while the server was not
+        # running. A sidecar is read only when its signature differs from the
+        # one recorded when it was last imported or mirrored.
+        stats = {"images": 0, "imported": 0, "errors": 0}
+        with self._lock:
+            known = {path: (mtime_ns, size) for path, mtime_ns, size in
+                     self._db.execute("SELECT path, mtime_ns, size FROM images")}
+        for batch in batched(iter_images(root), 512):
+            changed = []
+            for image_path in batch:
+                path = relative_path(root, image_path)
+                signature = sidecar_signature(image_path)
+                if known.get(path) != signature:
+                    changed.append((image_path, path, signature))
+            stats["images"] += len(batch)
+            rows = []
+            for image_path, path, signature in changed:
+                labels, normalized = [], []
+                sidecar = find_sidecar(image_path) if signature != MISSING else None
+                if sidecar is not None:
+                    try:
+                        labels, normalized = decode_sidecar(read_sidecar_content(sidecar))
+                    except (OSError, UnicodeDecodeError, ValueError) as e:
+                        print(f"Skipping {sidecar}: {e}", file=sys.stderr)
+                        stats["errors"] += 1
+                        continue
+                    stats["imported"] += 1
+                rows.append((path, signature, labels, np.asarray(normalized, dtype=np.float64).reshape(-1, 4)))
+            with self._lock, self._db:
+                for path, signature, labels, normalized in rows:
+                    self._ensure(path)
+                    self._db.execute("DELETE FROM boxes WHERE path = ?", (path,))
+                    self._db.executemany(
+                        "INSERT INTO boxes (path, id, version, label, cx, cy, w, h) VALUES (?, ?, 1, ?, ?, ?, ?, ?)",
+                        [(path, box_id, label, *box) for box_id, label, box in
+                         zip(self._ids.integers(1, 2 ** 63 - 1, size=len(labels)).tolist(), labels, normalized.tolist())]
+                    )
+                    self._db.execute("UPDATE images SET version = version + 1, done = ?, mtime_ns = ?, size = ? "
+                                     "WHERE path = ?", (int(signature != MISSING), *signature, path))
+        return stats
+
+    def _ensure(self, path):
+        # Caller must hold the lock.
+        self._db.execute("INSERT OR IGNORE INTO images (path) VALUES (?)", (path,))
+
+    def fetch(self, paths) -> list:
+        # [{"path", "version", "done", "owner", "boxes": [[id, version, label, cx, cy, w, h], ...]}, ...]
+        images = []
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                row = self._db.execute("SELECT version, done, owner, expires FROM images WHERE path = ?",
+                                       (path,)).fetchone()
+                version, done, owner, expires = row or (0, 0, None, None)
+                boxes = self._db.execute("SELECT id, version, label, cx, cy, w, h FROM boxes WHERE path = ? "
+                                         "ORDER BY rowid", (path,)).fetchall()
+                images.append({
+                    "path": path, "version": version, "done": bool(done),
+                    "owner": owner if owner is not None and expires > now else None,
+                    "boxes": [list(box) for box in boxes],
+                })
+        return images
+
+    def lease(self, client, path, seconds) -> str:
+        # Leases `path` to `client` unless someone else holds a live lease, and
+        # drops the client's other leases. Returns the holder of the lease.
+        now = time.time()
+        with self._lock, self._db:
+            self._ensure(path)
+            owner, expires = self._db.execute("SELECT owner, expires FROM images WHERE path = ?", (path,)).fetchone()
+            if owner is not None and owner != client and expires > now:
+                return owner
+            self._db.execute("UPDATE images SET owner = NULL, expires = NULL WHERE owner = ? AND path != ?",
+                             (client, path))
+            self._db.execute("UPDATE images SET owner = ?, expires = ? WHERE path = ?", (client, now + seconds, path))
+        return client
+
+    def lease_next(self, client, after, seconds):
+        # Leases the first image after `after` (wrapping around) that is not done
+        # and not leased by someone else. Returns its path, or None.
+        now = time.time()
+        query = ("SELECT path FROM images WHERE done = 0 AND path {} ? AND path != ? "
+                 "AND (owner IS NULL OR owner = ? OR expires <= ?) ORDER BY path LIMIT 1")
+        with self._lock, self._db:
+            row = (self._db.execute(query.format(">"), (after, after, client, now)).fetchone()
+                   or self._db.execute(query.format("<"), (after, after, client, now)).fetchone())
+            if row is None:
+                return None
+            self._db.execute("UPDATE images SET owner = NULL, expires = NULL WHERE owner = ?", (client,))
+            self._db.execute("UPDATE images SET owner = ?, expires = ? WHERE path = ?", (client, now + seconds, row[0]))
+        return row[0]
+
+    def release(self, client, paths=None, done=None):
+        # Gives up the client's leases on `paths` (all of them when None) and optionally sets their done flag.
+        with self._lock, self._db:
+            if paths is None:
+                self._db.execute("UPDATE images SET owner = NULL, expires = NULL WHERE owner = ?", (client,))
+                return
+            for path in paths:
+                self._ensure(path)
+                self._db.execute("UPDATE images SET owner = NULL, expires = NULL WHERE owner = ? AND path = ?",
+                                 (client, path))
+                if done is not None:
+                    self._db.execute("UPDATE images SET done = ? WHERE path = ?", (int(done), path))
+
+    def apply(self, client, ops, seconds):
+        # Applies a batch of box changes in one transaction. An op is
+        #   {"path", "id", "base", "label", "box": [cx, cy, w, h]}  (create or update)
+        #   {"path", "id", "base", "delete": true}
+        # and applies only if the box is still at version `base` (0 = absent).
+        # Returns (results, changed paths); a result is {"version": new version}
+        # or {"conflict": current box or None}. Applying renews the client's lease.
+        results = []
+        changed = set()
+        now = time.time()
+        with self._lock, self._db:
+            for op in ops:
+                path, box_id, base = op["path"], int(op["id"]), int(op["base"])
+                row = self._db.execute("SELECT id, version, label, cx, cy, w, h FROM boxes WHERE path = ? AND id = ?",
+                                       (path, box_id)).fetchone()
+                version = row[1] if row is not None else 0
+                if version != base:
+                    results.append({"conflict": list(row) if row is not None else None})
+                    continue
+                self._ensure(path)
+                if op.get("delete"):
+                    self._db.execute("DELETE FROM boxes WHERE path = ? AND id = ?", (path, box_id))
+                    results.append({"version": 0})
+                else:
+                    cx, cy, w, h = (float(v) for v in op["box"])
+                    # An upsert keeps the rowid, so boxes keep their order when edited.
+                    self._db.execute(
+                        "INSERT INTO boxes (path, id, version, label, cx, cy, w, h) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (path, id) DO UPDATE SET version = excluded.version, label = excluded.label, "
+                        "cx = excluded.cx, cy = excluded.cy, w = excluded.w, h = excluded.h",
+                        (path, box_id, version + 1, str(op["label"]), cx, cy, w, h)
+                    )
+                    results.append({"version": version + 1})
+                changed.add(path)
+            for path in changed:
+                self._db.execute("UPDATE images SET version = version + 1 WHERE path = ?", (path,))
+                self._db.execute("UPDATE images SET expires = ? WHERE path = ? AND owner = ?",
+                                 (now + seconds, path, client))
+        return results, changed
+
+    def boxes(self, path):
+        # (labels, (n, 4) normalized geometry) of an image, in a stable order.
+        with self._lock:
+            rows = self._db.execute("SELECT label, cx, cy, w, h FROM boxes WHERE path = ? ORDER BY rowid",
+                                    (path,)).fetchall()
+        return [row[0] for row in rows], np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, 4)
+
+    def mirrored(self, path, signature):
+        # Records the signature of a sidecar the server wrote, so the next start does not import it back.
+        with self._lock, self._db:
+            self._db.execute("UPDATE images SET mtime_ns = ?, size = ? WHERE path = ?", (*signature, path))
+
+    def counts(self) -> dict:
+        now = time.time()
+        with self._lock:
+            images, done = self._db.execute("SELECT COUNT(*), COALESCE(SUM(done), 0) FROM images").fetchone()
+            leased = self._db.execute("SELECT owner, COUNT(*) FROM images WHERE owner IS NOT NULL AND expires > ? "
+                                      "GROUP BY owner", (now,)).fetchall()
+            boxes = self._db.execute("SELECT COUNT(*) FROM boxes").fetchone()[0]
+        return {"images": images, "done": done, "boxes": boxes, "leases": dict(leased)}
+
+###############################################################################
+#                              SidecarMirror Class                            #
+###############################################################################
+class SidecarMirror:
+    # Writes the boxes of changed images back to their sidecars on a background
+    # thread, at most once per `delay` seconds per image. Only this thread
+    # writes sidecars, and it always renders the latest database state, so
+    # files never go backwards. Existing .box sidecars stay binary.
+    def __init__(self, root, database, delay=0.5):
+        self.root = root
+        self.database = database
+        self.delay = delay
+        self.writes = 0
+        self._dirty = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sidecar-mirror", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, paths):
+        with self._cond:
+            for path in paths:
+                self._dirty.setdefault(path, time.monotonic() + self.delay)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._write(list(self._dirty))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = [path for path, deadline in self._dirty.items() if deadline <= now]
+                    if due:
+                        break
+                    timeout = min(self._dirty.values()) - now if self._dirty else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                for path in due:
+                    del self._dirty[path]
+            self._write(due)
+
+    def _write(self, paths):
+        for path in paths:
+            image_path = os.path.join(self.root, *path.split("/"))
+            if not os.path.exists(image_path):
+                # A client whose dataset root does not match the server's.
+                print(f"Not mirroring {path}: no such image under {self.root}", file=sys.stderr)
+                continue
+            target = find_sidecar(image_path) or os.path.splitext(image_path)[0] + TXT_EXTENSION
+            try:
+                atomic_write(target, encode_sidecar(target, *self.database.boxes(path)))
+                self.database.mirrored(path, sidecar_signature(image_path))
+                self.writes += 1
+            except (OSError, sqlite3.Error) as e:
+                print(f"Could not mirror {target}: {e}", file=sys.stderr)
+
+###############################################################################
+#                                 HTTP Server                                 #
+###############################################################################
+# JSON over HTTP/1.1 with keep-alive, on a TCP port or a Unix socket. Every
+# endpoint takes a POST body naming the client:
+#   /fetch    {"paths": [...]}                 -> {"images": [...]}
+#   /lease    {"path": p} or {"after": p}      -> {"owner": ...} or {"path": ... or null}
+#   /release  {"paths": [...] or null, "done"} -> {}
+#   /deltas   {"ops": [...]}                   -> {"results": [...]}
+# GET /status returns image, done and box counts and the live leases.
+ENDPOINTS = ("/fetch", "/lease", "/release", "/deltas")
+
+
+class AnnotationService:
+    def __init__(self, root, database, lease_seconds=LEASE_SECONDS):
+        self.root = root
+        self.database = database
+        self.lease_seconds = lease_seconds
+        self.mirror = SidecarMirror(root, database)
+
+    def handle(self, endpoint, request) -> dict:
+        # Every path is checked before it reaches the database, so a bad request
+        # neither adds rows nor makes the mirror write outside the root.
+        client = str(request["client"])
+        check = self.checked
+        if endpoint == "/fetch":
+            return {"images": self.database.fetch([check(path) for path in request["paths"]])}
+        if endpoint == "/lease":
+            if "after" in request:
+                return {"path": self.database.lease_next(client, check(request["after"]), self.lease_seconds)}
+            return {"owner": self.database.lease(client, check(request["path"]), self.lease_seconds)}
+        if endpoint == "/release":
+            paths = request.get("paths")
+            self.database.release(client, None if paths is None else [check(path) for path in paths],
+                                  request.get("done"))
+            return {}
+        if endpoint == "/deltas":
+            ops = [dict(op, path=check(op["path"])) for op in request["ops"]]
+            results, changed = self.database.apply(client, ops, self.lease_seconds)
+            self.mirror.mark_dirty(changed)
+            return {"results": results}
+        raise ValueError(f"unknown endpoint {endpoint}")
+
+    def checked(self, path) -> str:
+        return checked_path(self.root, path)
+
+    def close(self):
+        self.mirror.close()
+        self.database.close()
+
+
+class AnnotationRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ImageAnnotationTool"
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._reply(200, self.server.service.database.counts())
+        else:
+            self._reply(404, {"error": f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        request = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path not in ENDPOINTS:
+            self._reply(404, {"error": f"unknown endpoint {self.path}"})
+            return
+        try:
+            self._reply(200, self.server.service.handle(self.path, json.loads(request or b"{}")))
+        except (KeyError, TypeError, ValueError) as e:
+            self._reply(400, {"error": f"bad request: {e!r}"})
+        except sqlite3.Error as e:
+            self._reply(500, {"error": str(e)})
+
+    def _reply(self, status, result):
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class AnnotationHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    verbose = False
+
+
+class AnnotationUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    verbose = False
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects an (address, port) client address.
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+
+def make_server(service, address):
+    # `address` is "unix:/path/to/socket" or "host:port".
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = AnnotationUnixServer(path, AnnotationRequestHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = AnnotationHTTPServer((host or "127.0.0.1", int(port or DEFAULT_PORT)), AnnotationRequestHandler)
+    server.service = service
+    return server
+
+###############################################################################
+#                                    Client                                   #
+###############################################################################
+class ServerError(OSError):
+    pass
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=10):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ConnectionPool:
+    # Keep-alive connections to one server, shared by threads. A request takes
+    # an idle connection (or opens one) and hands it back afterwards; an idle
+    # connection the server closed is reopened once.
+    def __init__(self, url, size=4, timeout=10):
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        if self.url.startswith("unix:"):
+            return UnixHTTPConnection(self.url[len("unix:"):], self.timeout)
+        address = self.url[len("http://"):] if self.url.startswith("http://") else self.url
+        host, _, port = address.rstrip("/").rpartition(":")
+        return http.client.HTTPConnection(host or "127.0.0.1", int(port or DEFAULT_PORT), timeout=self.timeout)
+
+    def request(self, method, endpoint, payload=None) -> dict:
+        try:
+            connection = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            connection = self._connect()
+            reused = False
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        while True:
+            try:
+                connection.request(method, endpoint, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if not reused:
+                    raise
+                connection = self._connect()
+                reused = False
+        if self._idle.qsize() < self.size:
+            self._idle.put(connection)
+        else:
+            connection.close()
+        result = json.loads(data or b"{}")
+        if response.status != 200:
+            raise ServerError(f"{self.url}{endpoint}: {result.get('error', response.status)}")
+        return result
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def default_annotator() -> str:
+    try:
+        user = getpass.getuser()
+    except (KeyError, OSError):
+        user = "annotator"
+    return f"{user}@{socket.gethostname()}"
+
+
+class SyncClient:
+    # Client side of a shared dataset. Edits are queued like AnnotationWriter
+    # queues files: only the latest boxes of each image are kept, and a
+    # background thread sends every image that is due in one /deltas batch.
+    # The batch holds one op per box that changed since the server last
+    # confirmed it, based on the version the client saw. Refused ops (another
+    # annotator changed the box first) take the server's box and call
+    # `on_conflict(image_path)` so the editor can reload the image.
+    def __init__(self, url, root, name=None, delay=0.5, on_conflict=None):
+        self.url = url
+        self.root = root
+        self.name = name or default_annotator()
+        self.delay = delay
+        self.on_conflict = on_conflict
+        self.pool = ConnectionPool(url)
+        self.interactive = ConnectionPool(url, timeout=INTERACTIVE_TIMEOUT)
+        self._offline_until = 0.0
+        self.batches = 0
+        self.conflicts = 0
+        self.last_error = None
+        self._base = {}
+        self._dirty = {}
+        self._deadlines = {}
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="annotation-sync", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_environment(cls, root, on_conflict=None):
+        # ANNOTATION_TOOL_SERVER (http://host:port or unix:/path) turns shared mode on;
+        # ANNOTATION_TOOL_ANNOTATOR names this annotator (default user@host).
+        url = os.environ.get(SERVER_VAR)
+        if not url:
+            return None
+        return cls(url, root, os.environ.get(ANNOTATOR_VAR), on_conflict=on_conflict)
+
+    def relative(self, image_path) -> str:
+        return relative_path(self.root, image_path)
+
+    def _call(self, endpoint, **payload) -> dict:
+        # A request on the caller's (GUI) thread; see INTERACTIVE_TIMEOUT.
+        if time.monotonic() < self._offline_until:
+            raise ConnectionError(f"{self.url} is not answering")
+        payload["client"] = self.name
+        try:
+            return self.interactive.request("POST", endpoint, payload)
+        except ServerError:
+            raise
+        except OSError:
+            self._offline_until = time.monotonic() + OFFLINE_SECONDS
+            raise
+
+    def _post(self, endpoint, **payload) -> dict:
+        # A request from the sync thread, or on close.
+        payload["client"] = self.name
+        result = self.pool.request("POST", endpoint, payload)
+        self._offline_until = 0.0
+        return result
+
+    def fetch(self, image_path):
+        # (labels, normalized (n, 4) boxes, int64 ids) of an image, edits not sent yet included.
+        # Raises OSError if the server cannot be reached; edits not sent stay queued.
+        path = self.relative(image_path)
+        conflicted = ()
+        try:
+            with self._io_lock:
+                with self._cond:
+                    batch = self._take([path])
+                try:
+                    conflicted = self._send(batch)
+                except OSError:
+                    self._requeue(batch)
+                    raise
+                image = self._call("/fetch", paths=[path])["images"][0]
+                with self._cond:
+                    self._base[path] = {box[0]: tuple(box[1:]) for box in image["boxes"]}
+                    pending = self._dirty.get(path)
+        finally:
+            self._report(conflicted)
+        if pending is not None:
+            return pending
+        boxes = image["boxes"]
+        return ([box[2] for box in boxes], np.array([box[3:] for box in boxes], dtype=np.float64).reshape(-1, 4),
+                np.array([box[0] for box in boxes], dtype=np.int64))
+
+    def lease(self, image_path) -> str:
+        # Leases the image to this annotator; returns who holds it (this annotator or another).
+        return self._call("/lease", path=self.relative(image_path))["owner"]
+
+    def lease_next(self, image_path):
+        # Leases the next image nobody else is working on and that is not done; returns its path or None.
+        path = self._call("/lease", after=self.relative(image_path))["path"]
+        return os.path.join(self.root, *path.split("/")) if path is not None else None
+
+    def release(self, image_path, done=None):
+        self._call("/release", paths=[self.relative(image_path)], done=done)
+
+    def mark_dirty(self, image_path, labels, normalized, ids):
+        # Records the current boxes of an image; replaces any edit still pending.
+        path = self.relative(image_path)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("SyncClient is closed")
+            self._dirty[path] = (list(labels), np.array(normalized, dtype=np.float64), np.array(ids, dtype=np.int64))
+            self._deadlines.setdefault(path, time.monotonic() + self.delay)
+            self._cond.notify()
+
+    def pending(self, image_path, ids=False):
+        # (labels, normalized) waiting to be sent for `image_path`, or None;
+        # (labels, normalized, ids) with `ids`.
+        with self._cond:
+            pending = self._dirty.get(self.relative(image_path))
+        return pending if pending is None or ids else pending[:2]
+
+    def flush(self, background=False):
+        # Sends every pending edit now; on OSError they stay queued.
+        with self._io_lock:
+            with self._cond:
+                batch = self._take(list(self._dirty))
+            try:
+                conflicted = self._send(batch, background)
+            except OSError:
+                self._requeue(batch)
+                raise
+        self._report(conflicted)
+
+    def close(self):
+        # Sends what is pending, gives up this annotator's leases and stops the thread.
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        try:
+            self.flush(background=True)
+            self._post("/release", paths=None)
+        except OSError as e:
+            print(f"Annotation server unreachable: {e}", file=sys.stderr)
+        self.pool.close()
+        self.interactive.close()
+
+    def _take(self, paths):
+        # Caller must hold the condition lock.
+        batch = []
+        for path in paths:
+            if path in self._dirty:
+                batch.append((path, self._dirty.pop(path)))
+                del self._deadlines[path]
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = [path for path, deadline in self._deadlines.items() if deadline <= now]
+                    if due:
+                        break
+                    timeout = min(self._deadlines.values()) - now if self._deadlines else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+            conflicted = ()
+            with self._io_lock:
+                with self._cond:
+                    batch = self._take(due)
+                try:
+                    conflicted = self._send(batch, background=True)
+                except OSError as e:
+                    if self.last_error is None:
+                        print(f"Annotation server unreachable, will retry: {e}", file=sys.stderr)
+                    self.last_error = str(e)
+                    self._requeue(batch)
+                    time.sleep(min(5.0, 4 * self.delay))
+                else:
+                    self.last_error = None
+            self._report(conflicted)
+
+    def _requeue(self, batch):
+        # Puts back edits that could not be sent, unless newer ones arrived meanwhile.
+        with self._cond:
+            for path, boxes in batch:
+                if path not in self._dirty:
+                    self._dirty[path] = boxes
+                    self._deadlines[path] = time.monotonic()
+            self._cond.notify()
+
+    def _diff(self, path, labels, normalized, ids) -> list:
+        # Caller must hold the condition lock.
+        base = self._base.setdefault(path, {})
+        ops = []
+        for box_id, label, box in zip(ids.tolist(), labels, normalized.tolist()):
+            seen = base.get(box_id)
+            if seen is None:
+                ops.append({"path": path, "id": box_id, "base": 0, "label": label, "box": box})
+            elif seen[1] != label or max(abs(a - b) for a, b in zip(seen[2:], box)) > 1e-9:
+                ops.append({"path": path, "id": box_id, "base": seen[0], "label": label, "box": box})
+        current = set(ids.tolist())
+        for box_id, seen in base.items():
+            if box_id not in current:
+                ops.append({"path": path, "id": box_id, "base": seen[0], "delete": True})
+        return ops
+
+    def _send(self, batch, background=False) -> set:
+        # Caller must hold the I/O lock, so batches reach the server in order.
+        # Returns the paths with refused ops; the caller passes them to
+        # _report() once the lock is released.
+        if not batch:
+            return set()
+        with self._cond:
+            ops = [op for path, boxes in batch for op in self._diff(path, *boxes)]
+        if not ops:
+            return set()
+        results = (self._post if background else self._call)("/deltas", ops=ops)["results"]
+        self.batches += 1
+        conflicted = set()
+        with self._cond:
+            for op, result in zip(ops, results):
+                base = self._base.setdefault(op["path"], {})
+                if "conflict" in result:
+                    box = result["conflict"]
+                    if box is None:
+                        base.pop(op["id"], None)
+                    else:
+                        base[op["id"]] = tuple(box[1:])
+                    conflicted.add(op["path"])
+                elif op.get("delete"):
+                    base.pop(op["id"], None)
+                else:
+                    base[op["id"]] = (result["version"], op["label"], *op["box"])
+        self.conflicts += len(conflicted)
+        return conflicted
+
+    def _report(self, conflicted):
+        # Must not hold the I/O lock: `on_conflict` may reload the image, which fetches again.
+        if self.on_conflict is not None:
+            for path in conflicted:
+                self.on_conflict(os.path.join(self.root, *path.split("/")))
+
+###############################################################################
+#                                Command Line                                 #
+###############################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="serve",
+        description="Serve one dataset to several annotators: images are leased to one annotator at a "
+                    "time, edits are merged box by box, and the sidecars are written by the server only."
+    )
+    parser.add_argument("root", help="dataset folder (as seen by the server)")
+    parser.add_argument("--listen", default=f"127.0.0.1:{DEFAULT_PORT}",
+                        help=f"host:port or unix:/path/to/socket (default: 127.0.0.1:{DEFAULT_PORT})")
+    parser.add_argument("--db", default=None, help="SQLite database (default: one per dataset in the cache folder)")
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS,
+                        help=f"seconds an untouched lease lasts (default: {LEASE_SECONDS})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(args.root)
+    database = AnnotationDatabase(args.db) if args.db else AnnotationDatabase.for_dataset(root)
+    stats = database.import_sidecars(root)
+    print(f"{stats['images']} images, {stats['imported']} sidecars imported ({stats['errors']} unreadable)",
+          file=sys.stderr)
+    service = AnnotationService(root, database, args.lease)
+    server = make_server(service, args.listen)
+    server.verbose = args.verbose
+    print(f"Serving {root} on {args.listen}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
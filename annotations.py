@@ -0,0 +1,356 @@
+import os
+
+import numpy as np
+
+from telemetry import timed
+
+###############################################################################
+#                               Coordinate Helpers                            #
+###############################################################################
+def normalized_to_pixels(normalized, width, height) -> np.ndarray:
+    # Converts (x_center, y_center, width, height) rows in [0..1] to pixel (x, y, w, h) rows.
+    normalized = np.asarray(normalized, dtype=np.float64).reshape(-1, 4)
+    boxes = np.empty_like(normalized)
+    w = normalized[:, 2] * width
+    h = normalized[:, 3] * height
+    boxes[:, 0] = normalized[:, 0] * width - w/2
+    boxes[:, 1] = normalized[:, 1] * height - h/2
+    boxes[:, 2] = w
+    boxes[:, 3] = h
+    return boxes
+
+
+def pixels_to_normalized(boxes, width, height) -> np.ndarray:
+    # Converts pixel (x, y, w, h) rows to normalized (x_center, y_center, width, height) rows.
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    normalized = np.empty_like(boxes)
+    normalized[:, 0] = (boxes[:, 0] + boxes[:, 2]/2) / width
+    normalized[:, 1] = (boxes[:, 1] + boxes[:, 3]/2) / height
+    normalized[:, 2] = boxes[:, 2] / width
+    normalized[:, 3] = boxes[:, 3] / height
+    return normalized
+
+###############################################################################
+#                                 TXT Format                                  #
+###############################################################################
+@timed("annotations.parse")
+def parse_txt(text):
+    # Parses label-first TXT lines into (labels, normalized geometry array).
+    # Lines with fewer than five tokens are skipped, extra tokens are ignored.
+    labels = []
+    values = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 5:
+            labels.append(parts[0])
+            values.append(parts[1:5])
+    return labels, np.array(values, dtype=np.float64).reshape(-1, 4)
+
+
+def format_txt(labels, normalized) -> str:
+    # Serializes labels and normalized geometry back to the TXT format.
+    # float32 geometry (from binary sidecars) is written with the shortest
+    # digits that read back to the same float32 values.
+    normalized = np.asarray(normalized)
+    rows = normalized.astype(str).tolist() if normalized.dtype == np.float32 else normalized.tolist()
+    return "".join(
+        f"{label} {cx} {cy} {w} {h}\n"
+        for label, (cx, cy, w, h) in zip(labels, rows)
+    )
+
+###############################################################################
+#                                Binary Format                                #
+###############################################################################
+# Binary sidecars (.box) hold the same boxes as a TXT file without any text
+# to parse. All fields are little-endian:
+#   header   16 bytes: b"IATB", version (u2), flags (u2), box count (u4), label count (u4)
+#   records  box count x 20 bytes: cx, cy, w, h (f4, normalized), label id (u4)
+#   labels   label count + 1 offsets (u4) into the UTF-8 label bytes that follow
+# Records start at a fixed offset, so they can be viewed with np.frombuffer or
+# a memory map without copying.
+BOX_MAGIC = b"IATB"
+BOX_VERSION = 1
+BOX_HEADER = np.dtype([("magic", "S4"), ("version", "<u2"), ("flags", "<u2"), ("count", "<u4"), ("labels", "<u4")])
+BOX_RECORD = np.dtype([("cx", "<f4"), ("cy", "<f4"), ("w", "<f4"), ("h", "<f4"), ("label", "<u4")])
+
+
+def pack_string_table(names, offset_dtype="<u4") -> bytes:
+    # Offsets (one more than there are names) followed by the UTF-8 bytes of every name.
+    encoded = [name.encode("utf-8") for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=offset_dtype)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets.tobytes() + b"".join(encoded)
+
+
+def unpack_string_table(buffer, count, offset=0, offset_dtype="<u4") -> list:
+    offsets = np.frombuffer(buffer, dtype=offset_dtype, count=count + 1, offset=offset).tolist()
+    start = offset + (count + 1) * np.dtype(offset_dtype).itemsize
+    blob = bytes(buffer[start:start + offsets[-1]])
+    if len(blob) != offsets[-1]:
+        raise ValueError("truncated string table")
+    return [blob[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+
+
+def fits_float32(normalized) -> bool:
+    # True if the geometry survives the float32 records of the binary formats
+    # unchanged; TXT files written by hand or by other tools often carry more digits.
+    normalized = np.asarray(normalized, dtype=np.float64)
+    return bool(np.array_equal(normalized.astype(np.float32).astype(np.float64), normalized, equal_nan=True))
+
+
+def pack_records(labels, normalized, label_ids) -> np.ndarray:
+    # BOX_RECORD array of normalized geometry, with label ids from the `label_ids` dict
+    # (label -> id), which is extended with labels it does not know yet.
+    normalized = np.asarray(normalized, dtype=np.float64).reshape(-1, 4)
+    records = np.empty(len(normalized), dtype=BOX_RECORD)
+    for column, field in enumerate(("cx", "cy", "w", "h")):
+        records[field] = normalized[:, column]
+    records["label"] = [label_ids.setdefault(label, len(label_ids)) for label in labels]
+    return records
+
+
+def pack_boxes(labels, normalized) -> bytes:
+    # Serializes labels and normalized geometry to the binary sidecar format.
+    label_ids = {}
+    records = pack_records(labels, normalized, label_ids)
+    header = np.array([(BOX_MAGIC, BOX_VERSION, 0, len(records), len(label_ids))], dtype=BOX_HEADER)
+    return header.tobytes() + records.tobytes() + pack_string_table(label_ids)
+
+
+def box_records(data):
+    # Zero-copy view of a binary sidecar: (BOX_RECORD array, label table).
+    # Raises ValueError for anything that is not a complete sidecar.
+    if len(data) < BOX_HEADER.itemsize:
+        raise ValueError("binary sidecar is truncated")
+    header = np.frombuffer(data, dtype=BOX_HEADER, count=1)[0]
+    if header["magic"] != BOX_MAGIC or header["version"] != BOX_VERSION:
+        raise ValueError("not a binary sidecar (or an unsupported version)")
+    count = int(header["count"])
+    end = BOX_HEADER.itemsize + count * BOX_RECORD.itemsize
+    if len(data) < end + (int(header["labels"]) + 1) * 4:
+        raise ValueError("binary sidecar is truncated")
+    records = np.frombuffer(data, dtype=BOX_RECORD, count=count, offset=BOX_HEADER.itemsize)
+    label_table = unpack_string_table(data, int(header["labels"]), end)
+    if count and int(records["label"].max()) >= len(label_table):
+        raise ValueError("binary sidecar refers to a missing label")
+    return records, label_table
+
+
+@timed("annotations.unpack")
+def unpack_boxes(data):
+    # Parses a binary sidecar into (labels, float32 normalized geometry array).
+    records, label_table = box_records(data)
+    normalized = np.empty((len(records), 4), dtype=np.float32)
+    for column, field in enumerate(("cx", "cy", "w", "h")):
+        normalized[:, column] = records[field]
+    return [label_table[i] for i in records["label"].tolist()], normalized
+
+###############################################################################
+#                                Sidecar Files                                #
+###############################################################################
+# Every image may have a TXT or a binary sidecar next to it; when both exist
+# the binary one wins. Sidecar content is a str for TXT and bytes for binary.
+TXT_EXTENSION = ".txt"
+BINARY_EXTENSION = ".box"
+SIDECAR_EXTENSIONS = (BINARY_EXTENSION, TXT_EXTENSION)
+# Set to "box" to create binary sidecars for images that have none yet.
+SIDECAR_FORMAT_VAR = "ANNOTATION_TOOL_SIDECAR"
+
+
+def sidecar_paths(image_path) -> list:
+    # Candidate sidecars of an image, in order of precedence.
+    base = os.path.splitext(image_path)[0]
+    return [base + extension for extension in SIDECAR_EXTENSIONS]
+
+
+def find_sidecar(image_path):
+    # Path of the image's sidecar, or None.
+    for path in sidecar_paths(image_path):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_sidecar_content(path):
+    if path.endswith(BINARY_EXTENSION):
+        with open(path, "rb") as f:
+            return f.read()
+    with open(path, "r") as f:
+        return f.read()
+
+
+def decode_sidecar(content):
+    # (labels, normalized geometry) of TXT (str) or binary (bytes) sidecar content.
+    if isinstance(content, str):
+        return parse_txt(content)
+    return unpack_boxes(content)
+
+
+def encode_sidecar(path, labels, normalized):
+    # Sidecar content for `path` in the format its extension calls for.
+    if path.endswith(BINARY_EXTENSION):
+        return pack_boxes(labels, normalized)
+    return format_txt(labels, normalized)
+
+###############################################################################
+#                               LabelTable Class                              #
+###############################################################################
+class LabelTable:
+    # Interns label strings as small integer ids shared by every store.
+    def __init__(self):
+        self.names = []
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, label) -> int:
+        label_id = self._ids.get(label)
+        if label_id is None:
+            label_id = len(self.names)
+            self._ids[label] = label_id
+            self.names.append(label)
+        return label_id
+
+    def intern_many(self, labels) -> np.ndarray:
+        return np.fromiter((self.intern(label) for label in labels), dtype=np.int32, count=len(labels))
+
+    def name(self, label_id) -> str:
+        return self.names[label_id]
+
+    def lookup(self, label_ids) -> list:
+        names = self.names
+        return [names[i] for i in np.asarray(label_ids).tolist()]
+
+###############################################################################
+#                             AnnotationStore Class                           #
+###############################################################################
+class AnnotationStore:
+    # Headless, columnar storage for the boxes of one image. Geometry is kept
+    # in pixels as (x, y, w, h) rows; labels and colors are integer ids. Every
+    # box also gets a random 63-bit id that stays with it through edits and
+    # removals of other rows, so a shared session can tell boxes apart.
+    _id_generator = np.random.default_rng()
+
+    def __init__(self, width=1, height=1, labels=None, capacity=16):
+        self.width = width
+        self.height = height
+        self.labels = labels if labels is not None else LabelTable()
+        self._boxes = np.empty((capacity, 4), dtype=np.float64)
+        self._label_ids = np.empty(capacity, dtype=np.int32)
+        self._color_ids = np.empty(capacity, dtype=np.int16)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def boxes(self) -> np.ndarray:
+        return self._boxes[:self._count]
+
+    @property
+    def label_ids(self) -> np.ndarray:
+        return self._label_ids[:self._count]
+
+    @property
+    def color_ids(self) -> np.ndarray:
+        return self._color_ids[:self._count]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._count]
+
+    def set_ids(self, rows, ids):
+        # Replaces the ids of boxes loaded from somewhere that already named them.
+        self._ids[np.asarray(rows, dtype=np.intp)] = ids
+
+    def _new_ids(self, n) -> np.ndarray:
+        return self._id_generator.integers(1, 2 ** 63 - 1, size=n, dtype=np.int64)
+
+    def _reserve(self, extra):
+        needed = self._count + extra
+        capacity = len(self._boxes)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._boxes = np.resize(self._boxes, (capacity, 4))
+        self._label_ids = np.resize(self._label_ids, capacity)
+        self._color_ids = np.resize(self._color_ids, capacity)
+        self._ids = np.resize(self._ids, capacity)
+
+    def add(self, x, y, w, h, label="", color_id=0) -> int:
+        # Appends one box and returns its row.
+        self._reserve(1)
+        row = self._count
+        self._boxes[row] = (x, y, w, h)
+        self._label_ids[row] = self.labels.intern(label)
+        self._color_ids[row] = color_id
+        self._ids[row] = self._new_ids(1)[0]
+        self._count += 1
+        return row
+
+    def extend(self, boxes, labels, color_ids) -> range:
+        # Appends pixel boxes with their labels and color ids; returns the new rows.
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        n = len(boxes)
+        self._reserve(n)
+        start = self._count
+        self._boxes[start:start + n] = boxes
+        self._label_ids[start:start + n] = self.labels.intern_many(labels)
+        self._color_ids[start:start + n] = color_ids
+        self._ids[start:start + n] = self._new_ids(n)
+        self._count += n
+        return range(start, start + n)
+
+    def remove(self, rows):
+        # Removes the given rows, keeping the remaining boxes in order.
+        keep = np.ones(self._count, dtype=bool)
+        keep[np.asarray(rows, dtype=np.intp)] = False
+        n = int(keep.sum())
+        self._boxes[:n] = self.boxes[keep]
+        self._label_ids[:n] = self.label_ids[keep]
+        self._color_ids[:n] = self.color_ids[keep]
+        self._ids[:n] = self.ids[keep]
+        self._count = n
+
+    def clear(self):
+        self._count = 0
+
+    def rect(self, row) -> tuple:
+        return tuple(self._boxes[row].tolist())
+
+    def set_rect(self, row, x, y, w, h):
+        self._boxes[row] = (x, y, w, h)
+
+    def label(self, row) -> str:
+        return self.labels.name(self._label_ids[row])
+
+    def label_names(self) -> list:
+        return self.labels.lookup(self.label_ids)
+
+    def set_labels(self, rows, label):
+        self._label_ids[np.asarray(rows, dtype=np.intp)] = self.labels.intern(label)
+
+    def centers(self) -> np.ndarray:
+        # Pixel (x_center, y_center) of every box.
+        boxes = self.boxes
+        return boxes[:, :2] + boxes[:, 2:] / 2
+
+    def normalized(self) -> np.ndarray:
+        return pixels_to_normalized(self.boxes, self.width, self.height)
+
+    def load_txt(self, text, first_color=0, palette_size=1) -> range:
+        # Appends every box of a TXT file, cycling color ids from `first_color`.
+        labels, normalized = parse_txt(text)
+        return self.load_normalized(labels, normalized, first_color, palette_size)
+
+    def load_normalized(self, labels, normalized, first_color=0, palette_size=1) -> range:
+        # Appends labelled normalized boxes, cycling color ids from `first_color`.
+        boxes = normalized_to_pixels(normalized, self.width, self.height)
+        color_ids = (first_color + np.arange(len(labels))) % palette_size
+        return self.extend(boxes, labels, color_ids)
+
+    def to_txt(self) -> str:
+        return format_txt(self.label_names(), self.normalized())
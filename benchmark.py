@@ -0,0 +1,328 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QImage, QColor, QPainter, QMouseEvent
+from PyQt5.QtCore import Qt, QEvent, QPoint, QPointF, QRectF, QT_VERSION_STR, PYQT_VERSION_STR
+
+###############################################################################
+#                             Synthetic Datasets                              #
+###############################################################################
+# Offscreen benchmarks for the GUI hot paths. Every run generates the same
+# synthetic dataset from a seed, times each scenario several times and writes
+# the medians as JSON, optionally comparing them against a stored baseline.
+# Event streams process pending events (including repaints) after every event.
+DEFAULT_BOX_COUNTS = (0, 100, 1000, 10000)
+
+
+def make_image(path, width, height, seed):
+    image = QImage(width, height, QImage.Format_RGB32)
+    rng = random.Random(seed)
+    image.fill(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    painter = QPainter(image)
+    for _ in range(64):
+        color = QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        painter.fillRect(rng.randrange(width), rng.randrange(height), width // 8, height // 8, color)
+    painter.end()
+    image.save(path, quality=90)
+
+
+def make_annotations(path, boxes, seed, labels=20):
+    # Writes a TXT sidecar, or a binary one if `path` ends in .box.
+    from annotations import encode_sidecar
+    rng = random.Random(seed)
+    names = []
+    rows = []
+    for _ in range(boxes):
+        w = rng.uniform(0.005, 0.05)
+        h = rng.uniform(0.005, 0.05)
+        names.append(f"L{rng.randrange(labels)}")
+        rows.append((rng.uniform(w, 1 - w), rng.uniform(h, 1 - h), w, h))
+    content = encode_sidecar(path, names, rows)
+    with open(path, "wb" if isinstance(content, bytes) else "w") as f:
+        f.write(content)
+
+
+def make_dataset(directory, box_counts, width, height, images_per_count=3, seed=0, sidecar=".txt"):
+    # Writes `images_per_count` images for every box count; returns {box_count: [image paths]}.
+    dataset = {}
+    for boxes in box_counts:
+        paths = []
+        for i in range(images_per_count):
+            base = os.path.join(directory, f"b{boxes:05d}_{i}")
+            make_image(base + ".jpg", width, height, seed + i)
+            make_annotations(base + sidecar, boxes, seed + boxes + i)
+            paths.append(base + ".jpg")
+        dataset[boxes] = paths
+    return dataset
+
+###############################################################################
+#                                   Timing                                    #
+###############################################################################
+def measure(fn, repeat, setup=None):
+    # Runs `setup` (untimed) and `fn` (timed) `repeat` times; returns timings in ms.
+    # The garbage collector is paused while timing, as timeit does.
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            gc.enable()
+    return timings
+
+
+def summarize(timings, per=1):
+    # Per-call figures when one timing covers `per` calls (e.g. an event stream).
+    timings = [t / per for t in timings]
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "mean_ms": statistics.fmean(timings),
+        "runs": len(timings),
+    }
+
+
+def send_mouse(widget, kind, pos, button=Qt.LeftButton, buttons=Qt.LeftButton):
+    event = QMouseEvent(kind, QPointF(pos), button, buttons, Qt.NoModifier)
+    QApplication.sendEvent(widget, event)
+
+###############################################################################
+#                                  Scenarios                                  #
+###############################################################################
+def run_scenarios(viewer, app, dataset, repeat, events):
+    import main
+    main.QInputDialog.getText = staticmethod(lambda *args, **kwargs: ("Bench", True))
+    results = {}
+    viewport = viewer.imageView.viewport()
+
+    def record(name, boxes, timings, per=1):
+        results[f"{name}[boxes={boxes}]"] = summarize(timings, per)
+
+    def open_image(paths, index=0):
+        viewer.image_list = paths
+        viewer.current_index = index
+        viewer.loadCurrentImage()
+        app.processEvents()
+
+    for boxes, paths in dataset.items():
+        # Cold load: decoded-image cache emptied first. Warm load: neighbour already prefetched.
+        record("load_current_image_cold", boxes, measure(
+            lambda: open_image(paths), repeat, setup=viewer.image_cache.clear))
+        viewer.image_cache.get(paths[1])
+        record("load_current_image_warm", boxes, measure(lambda: open_image(paths, 1), repeat))
+
+        def reset_annotations():
+            open_image(paths)
+            viewer.scene.clear()
+            viewer.annotations = []
+            viewer.overlay = None
+            viewer.listModel.beginResetModel()
+            viewer.store.clear()
+            viewer.listModel.endResetModel()
+        record("load_annotations", boxes, measure(
+            lambda: viewer.loadAnnotations(viewer.currentSidecar), repeat, setup=reset_annotations))
+
+        open_image(paths)
+
+        def add_many():
+            for i in range(events):
+                x = 10 + (i % 50) * 20
+                rect = main.ResizableAnnotationRect(QRectF(x, x, 40, 30), color=viewer.get_next_color())
+                viewer.scene.addItem(rect)
+                viewer.addAnnotation(rect)
+        record("add_annotation", boxes, measure(add_many, repeat, setup=lambda: open_image(paths)), per=events)
+
+        open_image(paths)
+        record("update_annotations_file", boxes, measure(viewer.updateAnnotationsFile, repeat))
+        record("flush_annotations_file", boxes, measure(
+            viewer.annotation_writer.flush, repeat, setup=viewer.updateAnnotationsFile))
+
+        if boxes:
+            record("assign_label_all_selected", boxes, measure(
+                viewer.assignLabelToSelected, repeat,
+                setup=lambda: (open_image(paths), viewer.listView.selectAll())))
+            record("delete_all_selected", boxes, measure(
+                viewer.deleteAnnotation, repeat,
+                setup=lambda: (open_image(paths), viewer.listView.selectAll())))
+            viewer.annotation_writer.flush()
+
+        def drag_new_box():
+            start = QPoint(20, 20)
+            send_mouse(viewport, QEvent.MouseButtonPress, start, buttons=Qt.LeftButton)
+            for i in range(events):
+                send_mouse(viewport, QEvent.MouseMove, start + QPoint(i % 300, i % 200), Qt.NoButton)
+                app.processEvents()
+            send_mouse(viewport, QEvent.MouseButtonRelease, start + QPoint(100, 80), buttons=Qt.NoButton)
+        record("drag_new_box_event", boxes, measure(drag_new_box, repeat, setup=lambda: open_image(paths)),
+               per=events)
+
+        def resize_box():
+            # The last box is on top in both rendering modes.
+            x, y, w, h = viewer.store.rect(len(viewer.store) - 1)
+            edge = viewer.imageView.mapFromScene(QPointF(x + w, y + h / 2))
+            send_mouse(viewport, QEvent.MouseButtonPress, edge)
+            for i in range(events):
+                send_mouse(viewport, QEvent.MouseMove, edge + QPoint(i % 40, 0), Qt.NoButton)
+                app.processEvents()
+            send_mouse(viewport, QEvent.MouseButtonRelease, edge + QPoint(20, 0), buttons=Qt.NoButton)
+        if boxes:
+            record("resize_box_event", boxes, measure(resize_box, repeat, setup=lambda: open_image(paths)),
+                   per=events)
+        viewer.annotation_writer.flush()
+    return results
+
+
+@contextmanager
+def temporary_home(path):
+    # Points the home directory at `path`, so the tool's caches under
+    # ~/.cache/image-annotation-tool (sessions, index, thumbnails, ...) start
+    # empty and the user's own caches are neither read nor written.
+    names = ("HOME", "USERPROFILE")
+    saved = {name: os.environ.get(name) for name in names}
+    os.makedirs(path, exist_ok=True)
+    os.environ.update(dict.fromkeys(names, path))
+    try:
+        yield path
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+###############################################################################
+#                                  Baseline                                   #
+###############################################################################
+def compare(results, baseline, tolerance, noise_ms):
+    # Returns (rows, regressions, missing). A scenario regresses when its median
+    # grows by more than `tolerance` (relative) and by more than `noise_ms`
+    # (absolute); it is missing when the baseline has it and the results do not.
+    rows = []
+    regressions = []
+    missing = sorted(set(baseline) - set(results))
+    for name in missing:
+        rows.append((name, baseline[name]["median_ms"], None, None, "MISSING"))
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, None, current["median_ms"], None, "new"))
+            continue
+        before, after = base["median_ms"], current["median_ms"]
+        ratio = after / before if before else float("inf") if after else 1.0
+        status = "ok"
+        if after - before > noise_ms and ratio > 1 + tolerance:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif before - after > noise_ms and ratio < 1 - tolerance:
+            status = "faster"
+        rows.append((name, before, after, ratio, status))
+    return rows, regressions, missing
+
+
+def print_comparison(rows):
+    print(f"{'scenario':<44} {'baseline':>10} {'current':>10} {'ratio':>7}  status")
+    for name, before, after, ratio, status in rows:
+        before_str = f"{before:10.3f}" if before is not None else f"{'-':>10}"
+        after_str = f"{after:10.3f}" if after is not None else f"{'-':>10}"
+        ratio_str = f"{ratio:7.2f}" if ratio is not None else f"{'-':>7}"
+        print(f"{name:<44} {before_str} {after_str} {ratio_str}  {status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offscreen performance benchmarks for the annotation tool.")
+    parser.add_argument("--boxes", type=int, nargs="+", default=list(DEFAULT_BOX_COUNTS),
+                        help="box counts per image (default: 0 100 1000 10000)")
+    parser.add_argument("--size", default="4000x3000", help="synthetic image resolution WxH")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per scenario")
+    parser.add_argument("--events", type=int, default=200, help="events per simulated drag/resize stream")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sidecar", choices=("txt", "box"), default="txt", help="annotation format to load")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (default 0.25)")
+    parser.add_argument("--noise-ms", type=float, default=0.5, help="ignore differences below this (ms)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated dataset directory")
+    args = parser.parse_args(argv)
+    width, height = (int(v) for v in args.size.lower().split("x"))
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    import main as annotation_tool
+    directory = tempfile.mkdtemp(prefix="annotation-bench-")
+    try:
+        os.mkdir(os.path.join(directory, "dataset"))
+        dataset = make_dataset(os.path.join(directory, "dataset"), args.boxes, width, height,
+                               seed=args.seed, sidecar="." + args.sidecar)
+        with temporary_home(os.path.join(directory, "home")):
+            viewer = annotation_tool.ImageViewer()
+            viewer.setGeometry(0, 0, 1280, 800)
+            # Hidden, so no thumbnails are rendered in the background while timing.
+            viewer.filmstrip.hide()
+            app.processEvents()
+            results = run_scenarios(viewer, app, dataset, args.repeat, args.events)
+            viewer.close()
+    finally:
+        if args.keep:
+            print(f"Dataset kept in {directory}", file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "platform": platform.platform(),
+            "size": [width, height],
+            "repeat": args.repeat,
+            "events": args.events,
+            "seed": args.seed,
+            "sidecar": args.sidecar,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    elif not args.baseline:
+        print(text)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+        return 0
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        rows, regressions, missing = compare(results, baseline, args.tolerance, args.noise_ms)
+        print_comparison(rows)
+        if missing:
+            print(f"{len(missing)} baseline scenario(s) missing from the results", file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)} scenario(s) regressed", file=sys.stderr)
+        if regressions or missing:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+from annotations import decode_sidecar, find_sidecar, normalized_to_pixels, read_sidecar_content
+from dataset import scan_dataset
+from image_headers import read_image_size
+
+###############################################################################
+#                               Dataset Streaming                             #
+###############################################################################
+# Headless conversion of the label-first sidecars (TXT or binary) to COCO
+# JSON, YOLO and Pascal VOC. Nothing here imports Qt. Images are discovered
+# lazily, sidecars are parsed in worker processes, and output is written as
+# results arrive, so memory use does not grow with the size of the dataset.
+FORMATS = ("coco", "yolo", "voc")
+
+
+def iter_images(root):
+    # Yields image paths under `root` in a stable order without listing the whole tree first.
+    for directory, names, _ in scan_dataset(root):
+        for name in names:
+            yield os.path.join(directory, name)
+
+
+def read_sample(image_path):
+    # Worker: image size from the file header plus the parsed sidecar, if any.
+    # Returns (image_path, size, labels, normalized boxes, error).
+    try:
+        size = read_image_size(image_path)
+    except OSError as e:
+        return image_path, None, [], None, str(e)
+    if size is None:
+        return image_path, None, [], None, "unknown image format"
+    sidecar = find_sidecar(image_path)
+    if sidecar is None:
+        return image_path, size, [], None, None
+    try:
+        content = read_sidecar_content(sidecar)
+    except (OSError, UnicodeDecodeError) as e:
+        return image_path, size, [], None, str(e)
+    try:
+        labels, normalized = decode_sidecar(content)
+    except ValueError as e:
+        return image_path, size, [], None, f"{sidecar}: {e}"
+    return image_path, size, labels, normalized, None
+
+
+def read_samples(image_paths):
+    # Worker entry point; batches keep inter-process traffic low.
+    return [read_sample(path) for path in image_paths]
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bounded_map(executor, fn, iterable, window):
+    # Like executor.map, but keeps at most `window` tasks in flight so a huge
+    # input iterator is never materialized. Results come back in input order.
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+###############################################################################
+#                                  Label Map                                  #
+###############################################################################
+class LabelMap:
+    # Assigns class ids to labels in the order they are first seen.
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.id(name)
+
+    def id(self, label) -> int:
+        label_id = self.ids.get(label)
+        if label_id is None:
+            label_id = len(self.names)
+            self.ids[label] = label_id
+            self.names.append(label)
+        return label_id
+
+
+def read_classes(path) -> list:
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+###############################################################################
+#                                   Writers                                   #
+###############################################################################
+class CocoWriter:
+    # Streams a single COCO JSON file. Image entries go straight to the output;
+    # annotation entries are spooled to a temporary file and appended at the end.
+    def __init__(self, output, label_map):
+        self.output = output
+        self.label_map = label_map
+        self.out = open(output, "w")
+        self.spool = tempfile.TemporaryFile("w+", dir=os.path.dirname(os.path.abspath(output)))
+        self.out.write('{"images": [')
+        self.image_count = 0
+        self.annotation_count = 0
+
+    def write(self, rel_path, width, height, labels, boxes):
+        self.image_count += 1
+        image_id = self.image_count
+        sep = ",\n" if image_id > 1 else "\n"
+        self.out.write(sep + json.dumps({"id": image_id, "file_name": rel_path, "width": width, "height": height}))
+        for label, (x, y, w, h) in zip(labels, boxes):
+            self.annotation_count += 1
+            sep = ",\n" if self.annotation_count > 1 else "\n"
+            self.spool.write(sep + json.dumps({
+                "id": self.annotation_count,
+                "image_id": image_id,
+                "category_id": self.label_map.id(label) + 1,
+                "bbox": [x, y, w, h],
+                "area": w * h,
+                "iscrowd": 0,
+            }))
+
+    def close(self):
+        self.out.write('\n],\n"annotations": [')
+        self.spool.seek(0)
+        while True:
+            chunk = self.spool.read(1 << 20)
+            if not chunk:
+                break
+            self.out.write(chunk)
+        self.spool.close()
+        categories = [{"id": i + 1, "name": name} for i, name in enumerate(self.label_map.names)]
+        self.out.write('\n],\n"categories": ' + json.dumps(categories) + "}\n")
+        self.out.close()
+
+
+class YoloWriter:
+    # One `<class_id> <x_center> <y_center> <width> <height>` file per image plus classes.txt.
+    def __init__(self, output, label_map):
+        self.output = output
+        self.label_map = label_map
+        self.image_count = 0
+        self.annotation_count = 0
+
+    def write(self, rel_path, width, height, labels, normalized):
+        self.image_count += 1
+        self.annotation_count += len(labels)
+        path = os.path.join(self.output, os.path.splitext(rel_path)[0] + ".txt")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write("".join(
+                f"{self.label_map.id(label)} {cx} {cy} {w} {h}\n"
+                for label, (cx, cy, w, h) in zip(labels, normalized)
+            ))
+
+    def close(self):
+        with open(os.path.join(self.output, "classes.txt"), "w") as f:
+            f.write("".join(name + "\n" for name in self.label_map.names))
+
+
+class VocWriter:
+    # One Pascal VOC XML file per image, with integer pixel corners clamped to the image.
+    def __init__(self, output, label_map):
+        self.output = output
+        self.label_map = label_map
+        self.image_count = 0
+        self.annotation_count = 0
+
+    def write(self, rel_path, width, height, labels, boxes):
+        self.image_count += 1
+        self.annotation_count += len(labels)
+        path = os.path.join(self.output, os.path.splitext(rel_path)[0] + ".xml")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        parts = [
+            "<annotation>\n",
+            f"  <folder>{escape(os.path.dirname(rel_path))}</folder>\n",
+            f"  <filename>{escape(os.path.basename(rel_path))}</filename>\n",
+            f"  <size>\n    <width>{width}</width>\n    <height>{height}</height>\n    <depth>3</depth>\n  </size>\n",
+        ]
+        for label, (x, y, w, h) in zip(labels, boxes):
+            self.label_map.id(label)
+            xmin = min(max(int(round(x)), 0), width)
+            ymin = min(max(int(round(y)), 0), height)
+            xmax = min(max(int(round(x + w)), 0), width)
+            ymax = min(max(int(round(y + h)), 0), height)
+            parts.append(
+                f"  <object>\n    <name>{escape(label)}</name>\n    <difficult>0</difficult>\n"
+                f"    <bndbox>\n      <xmin>{xmin}</xmin>\n      <ymin>{ymin}</ymin>\n"
+                f"      <xmax>{xmax}</xmax>\n      <ymax>{ymax}</ymax>\n    </bndbox>\n  </object>\n"
+            )
+        parts.append("</annotation>\n")
+        with open(path, "w") as f:
+            f.write("".join(parts))
+
+    def close(self):
+        pass
+
+###############################################################################
+#                                   Convert                                   #
+###############################################################################
+def convert(source, output, fmt, workers=None, classes=(), batch_size=64, window=32):
+    # Converts every image/sidecar pair under `source`; returns the writer for its counters.
+    label_map = LabelMap(classes)
+    if fmt == "coco":
+        writer = CocoWriter(output, label_map)
+    elif fmt == "yolo":
+        os.makedirs(output, exist_ok=True)
+        writer = YoloWriter(output, label_map)
+    elif fmt == "voc":
+        os.makedirs(output, exist_ok=True)
+        writer = VocWriter(output, label_map)
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+    writer.skipped = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        batches = bounded_map(executor, read_samples, batched(iter_images(source), batch_size), window)
+        for image_path, size, labels, normalized, error in (r for batch in batches for r in batch):
+            if error is not None:
+                print(f"Skipping {image_path}: {error}", file=sys.stderr)
+                writer.skipped += 1
+                continue
+            width, height = size
+            rel_path = os.path.relpath(image_path, source)
+            if normalized is None:
+                labels, rows = [], []
+            elif fmt == "yolo":
+                rows = normalized.tolist()
+            else:
+                rows = normalized_to_pixels(normalized, width, height).tolist()
+            writer.write(rel_path, width, height, labels, rows)
+    writer.close()
+    return writer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="convert",
+        description="Convert label-first TXT or binary annotations to COCO JSON, YOLO or Pascal VOC without Qt."
+    )
+    parser.add_argument("source", help="directory tree containing images and their .txt or .box files")
+    parser.add_argument("output", help="output .json file (coco) or directory (yolo, voc)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="coco")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--classes", help="file with one label per line fixing the first class ids")
+    args = parser.parse_args(argv)
+    classes = read_classes(args.classes) if args.classes else ()
+    writer = convert(args.source, args.output, args.format, args.workers, classes)
+    print(
+        f"Converted {writer.image_count} images, {writer.annotation_count} boxes, "
+        f"{len(writer.label_map.names)} labels ({writer.skipped} skipped)",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import os
+import sys
+from array import array
+from bisect import bisect_right
+
+from annotations import SIDECAR_EXTENSIONS, find_sidecar
+from image_headers import IMAGE_EXTENSIONS
+
+###############################################################################
+#                               Directory Scan                                #
+###############################################################################
+# Qt-free dataset listing. Directories are read with os.scandir, which reports
+# file types without a stat call per entry, and every directory is listed in
+# one pass that also notes which images have a sidecar (TXT or binary) next to them.
+
+
+def scan_dataset(root, chunk_size=2048):
+    # Yields (directory, sorted image basenames, has-sidecar flags) in chunks of at
+    # most `chunk_size` images, directory by directory; hidden directories are skipped.
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        images = []
+        stems = set()
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if not name.startswith("."):
+                            subdirs.append(entry.path)
+                    elif name.lower().endswith(IMAGE_EXTENSIONS):
+                        images.append(name)
+                    elif name.endswith(SIDECAR_EXTENSIONS):
+                        stems.add(os.path.splitext(name)[0])
+        except OSError as e:
+            print(f"Skipping {directory}: {e}", file=sys.stderr)
+            continue
+        images.sort()
+        for start in range(0, len(images), chunk_size):
+            names = images[start:start + chunk_size]
+            yield directory, names, [os.path.splitext(name)[0] in stems for name in names]
+        stack.extend(sorted(subdirs, reverse=True))
+
+
+def dataset_key(image_list) -> str:
+    # A dataset is identified by the deepest directory containing all of its images.
+    if isinstance(image_list, ImageList) and image_list.root:
+        return os.path.abspath(image_list.root)
+    directories = {os.path.dirname(os.path.abspath(path)) for path in image_list}
+    return os.path.commonpath(sorted(directories)) if directories else ""
+
+###############################################################################
+#                               ImageList Class                               #
+###############################################################################
+class ImageList:
+    # Sequence of image paths for large datasets. Every directory is stored
+    # once and basenames are packed into one string per chunk with an offset
+    # table, so 200k paths take a few megabytes instead of 200k string objects.
+    # A parallel bytearray records which images have a sidecar.
+    def __init__(self, root=""):
+        self.root = root
+        self.directories = []
+        self._directory_ids = {}
+        self._starts = array("q")
+        self._chunks = []
+        self.annotated = bytearray()
+
+    @classmethod
+    def from_paths(cls, paths):
+        # Groups consecutive paths by directory; used for images picked by hand.
+        image_list = cls(os.path.commonpath([os.path.dirname(p) for p in paths]) if paths else "")
+        group = []
+        directory = None
+        for path in paths:
+            head, name = os.path.split(path)
+            if head != directory and group:
+                image_list.extend(directory, group, [cls._has_sidecar(directory, n) for n in group])
+                group = []
+            directory = head
+            group.append(name)
+        if group:
+            image_list.extend(directory, group, [cls._has_sidecar(directory, n) for n in group])
+        return image_list
+
+    @staticmethod
+    def _has_sidecar(directory, name) -> bool:
+        return find_sidecar(os.path.join(directory, name)) is not None
+
+    def extend(self, directory, names, annotated):
+        if not names:
+            return
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self._directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+        offsets = array("I", [0])
+        total = 0
+        for name in names:
+            total += len(name)
+            offsets.append(total)
+        self._starts.append(len(self.annotated))
+        self._chunks.append((directory_id, "".join(names), offsets))
+        self.annotated.extend(bytes(bool(flag) for flag in annotated))
+
+    def extend_packed(self, directory, text, offsets, annotated):
+        # Appends a chunk in the form chunks() yields it, without splitting it into names.
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self._directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+        self._starts.append(len(self.annotated))
+        self._chunks.append((directory_id, text, offsets))
+        self.annotated.extend(annotated)
+
+    def chunks(self, first=0):
+        # Yields (directory, joined basenames, offsets, has-sidecar flags) per chunk, from chunk `first` on.
+        for start, (directory_id, text, offsets) in zip(self._starts[first:], self._chunks[first:]):
+            yield self.directories[directory_id], text, offsets, self.annotated[start:start + len(offsets) - 1]
+
+    def chunk_count(self) -> int:
+        return len(self._chunks)
+
+    def same_images(self, other) -> bool:
+        # True when both lists hold the same paths in the same order, chunk for chunk.
+        if len(self) != len(other) or len(self._chunks) != len(other._chunks):
+            return False
+        for (a, text, offsets, _), (b, other_text, other_offsets, _) in zip(self.chunks(), other.chunks()):
+            if a != b or text != other_text or offsets != other_offsets:
+                return False
+        return True
+
+    def __len__(self):
+        return len(self.annotated)
+
+    def __getitem__(self, index) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("image index out of range")
+        chunk = bisect_right(self._starts, index) - 1
+        directory_id, text, offsets = self._chunks[chunk]
+        i = index - self._starts[chunk]
+        return os.path.join(self.directories[directory_id], text[offsets[i]:offsets[i + 1]])
+
+    def __iter__(self):
+        for directory_id, text, offsets in self._chunks:
+            directory = self.directories[directory_id]
+            for i in range(len(offsets) - 1):
+                yield os.path.join(directory, text[offsets[i]:offsets[i + 1]])
+
+    def index(self, path) -> int:
+        # Position of `path`. Scanned chunks are sorted by name, so they are bisected first.
+        directory, name = os.path.split(path)
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is not None:
+            for chunk, (chunk_directory, text, offsets) in enumerate(self._chunks):
+                if chunk_directory != directory_id:
+                    continue
+                lo, hi = 0, len(offsets) - 1
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if text[offsets[mid]:offsets[mid + 1]] < name:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                if lo < len(offsets) - 1 and text[offsets[lo]:offsets[lo + 1]] == name:
+                    return self._starts[chunk] + lo
+                # Images picked by hand keep their selection order.
+                for i in range(len(offsets) - 1):
+                    if text[offsets[i]:offsets[i + 1]] == name:
+                        return self._starts[chunk] + i
+        raise ValueError(f"{path} is not in the image list")
+
+    def is_annotated(self, index) -> bool:
+        return bool(self.annotated[index])
+
+    def set_annotated(self, index, annotated=True):
+        self.annotated[index] = 1 if annotated else 0
+
+    def annotated_count(self) -> int:
+        return len(self.annotated) - self.annotated.count(0)
+
+    def next_unannotated(self, start, wrap=True):
+        # Index of the first image without a sidecar after `start`, or None.
+        index = self.annotated.find(0, start + 1)
+        if index < 0 and wrap:
+            index = self.annotated.find(0, 0, start + 1)
+        return index if index >= 0 else None
@@ -0,0 +1,337 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from annotations import BINARY_EXTENSION, decode_sidecar, sidecar_paths
+from dataset import ImageList, dataset_key, scan_dataset
+
+###############################################################################
+#                                Index Schema                                 #
+###############################################################################
+# Persistent per-dataset index of every sidecar (TXT or binary): one row per
+# image with its box count, one row per box with its label and normalized
+# geometry. Nothing here imports Qt. The index is a cache of the sidecars: a
+# sidecar is parsed again only when its mtime or size changed, and the
+# database can be deleted at any time.
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE images (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER,
+    size INTEGER,
+    boxes INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE labels (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE boxes (
+    image_id INTEGER NOT NULL,
+    label_id INTEGER NOT NULL,
+    cx REAL NOT NULL, cy REAL NOT NULL, w REAL NOT NULL, h REAL NOT NULL
+);
+CREATE INDEX boxes_image ON boxes(image_id);
+CREATE INDEX boxes_label ON boxes(label_id, image_id);
+"""
+# Signature stored for an image without a sidecar. Sidecars indexed from
+# unsaved editor content get a NULL signature, so the next sync re-reads them.
+MISSING = (0, -1)
+SYNC_BATCH = 512
+
+
+def index_cache_root() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "image-annotation-tool", "index")
+
+
+def sidecar_signature(image_path):
+    # (mtime_ns, size) of the image's sidecar, or MISSING.
+    for path in sidecar_paths(image_path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        return st.st_mtime_ns, st.st_size
+    return MISSING
+
+
+def read_sidecar(image_path):
+    # Returns (content or None, signature); content is None when there is no sidecar.
+    for path in sidecar_paths(image_path):
+        try:
+            with open(path, "rb" if path.endswith(BINARY_EXTENSION) else "r") as f:
+                st = os.fstat(f.fileno())
+                return f.read(), (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            continue
+    return None, MISSING
+
+###############################################################################
+#                              DatasetIndex Class                             #
+###############################################################################
+class DatasetIndex:
+    # SQLite-backed label index of one dataset. One connection is shared by
+    # every thread; each call holds the lock only for its own transaction, so
+    # queries from the GUI thread interleave with a background sync.
+    def __init__(self, filename):
+        self.filename = filename
+        if filename != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        # A cache of the sidecars: losing the last transactions on a crash is harmless.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with self._db:
+                for table in ("boxes", "labels", "images"):
+                    self._db.execute(f"DROP TABLE IF EXISTS {table}")
+                self._db.executescript(SCHEMA)
+                self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._label_ids = dict(self._db.execute("SELECT name, id FROM labels"))
+
+    @classmethod
+    def for_dataset(cls, image_list, cache_root=None):
+        key = dataset_key(image_list)
+        root = cache_root or index_cache_root()
+        return cls(os.path.join(root, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".sqlite"))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _label_id(self, name) -> int:
+        label_id = self._label_ids.get(name)
+        if label_id is None:
+            label_id = self._db.execute("INSERT INTO labels(name) VALUES (?)", (name,)).lastrowid
+            self._label_ids[name] = label_id
+        return label_id
+
+    def _store(self, entries):
+        # Replaces the rows of every (image path, content or None, signature) entry in one transaction.
+        with self._lock:
+            try:
+                with self._db:
+                    self._store_locked(entries)
+            except sqlite3.Error:
+                # Labels inserted by the rolled-back transaction are gone again.
+                self._label_ids = dict(self._db.execute("SELECT name, id FROM labels"))
+                raise
+
+    def _store_locked(self, entries):
+        # Images without a sidecar are written in bulk; most images of a fresh dataset are.
+        empty = [(path, *signature) for path, content, signature in entries if content is None]
+        if empty:
+            self._db.executemany(
+                "INSERT INTO images(path, mtime_ns, size, boxes, error) VALUES (?, ?, ?, 0, NULL) "
+                "ON CONFLICT(path) DO UPDATE SET mtime_ns=excluded.mtime_ns, size=excluded.size, "
+                "boxes=0, error=NULL",
+                empty
+            )
+            self._db.executemany(
+                "DELETE FROM boxes WHERE image_id=(SELECT id FROM images WHERE path=?)",
+                [(path,) for path, _, _ in empty]
+            )
+        for path, content, signature in entries:
+            if content is None:
+                continue
+            labels, rows, error = [], [], None
+            try:
+                labels, normalized = decode_sidecar(content)
+                rows = normalized.tolist()
+            except ValueError as e:
+                error = str(e)
+            mtime_ns, size = signature if signature is not None else (None, None)
+            image_id = self._db.execute(
+                "INSERT INTO images(path, mtime_ns, size, boxes, error) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET mtime_ns=excluded.mtime_ns, size=excluded.size, "
+                "boxes=excluded.boxes, error=excluded.error RETURNING id",
+                (path, mtime_ns, size, len(rows), error)
+            ).fetchone()[0]
+            self._db.execute("DELETE FROM boxes WHERE image_id=?", (image_id,))
+            self._db.executemany(
+                "INSERT INTO boxes(image_id, label_id, cx, cy, w, h) VALUES (?, ?, ?, ?, ?, ?)",
+                [(image_id, self._label_id(label), *row) for label, row in zip(labels, rows)]
+            )
+
+    def sync(self, image_paths, prune=False, cancelled=None, pending=None) -> dict:
+        # Brings the index up to date with the sidecars of `image_paths`. Only
+        # files whose mtime or size changed are parsed. With `prune`, images no
+        # longer in `image_paths` are dropped. `pending(image_path)` may return
+        # editor content that is newer than the sidecar on disk.
+        with self._lock:
+            known = {path: (mtime_ns, size) for path, mtime_ns, size in
+                     self._db.execute("SELECT path, mtime_ns, size FROM images")}
+        stats = {"checked": 0, "updated": 0, "removed": 0}
+        batch = []
+        for path in image_paths:
+            content = pending(path) if pending is not None else None
+            if content is None:
+                try:
+                    signature = sidecar_signature(path)
+                except OSError as e:
+                    print(f"Skipping the sidecar of {path}: {e}", file=sys.stderr)
+                    known.pop(path, None)
+                    continue
+                if known.pop(path, None) != signature:
+                    batch.append((path, None, MISSING) if signature == MISSING else path)
+            else:
+                known.pop(path, None)
+                batch.append((path, content, None))
+            stats["checked"] += 1
+            if len(batch) >= SYNC_BATCH:
+                stats["updated"] += self._store_files(batch)
+                batch = []
+            if stats["checked"] % SYNC_BATCH == 0 and cancelled is not None and cancelled():
+                return stats
+        stats["updated"] += self._store_files(batch)
+        if prune and known:
+            with self._lock, self._db:
+                for path in known:
+                    self._db.execute("DELETE FROM boxes WHERE image_id=(SELECT id FROM images WHERE path=?)", (path,))
+                    self._db.execute("DELETE FROM images WHERE path=?", (path,))
+            stats["removed"] = len(known)
+        return stats
+
+    def _store_files(self, paths) -> int:
+        # Reads and stores a batch of image paths; entries whose content is known come as tuples.
+        entries = []
+        for path in paths:
+            if isinstance(path, tuple):
+                entries.append(path)
+                continue
+            try:
+                content, signature = read_sidecar(path)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"Skipping the sidecar of {path}: {e}", file=sys.stderr)
+                continue
+            entries.append((path, content, signature))
+        self._store(entries)
+        return len(entries)
+
+    def refresh(self, image_paths, pending=None):
+        # Re-indexes the given images whatever their mtime. Content from `pending`
+        # may not be on disk yet, so it is stored without a signature and the
+        # next sync reads the file again.
+        entries = []
+        for path in image_paths:
+            content = pending(path) if pending is not None else None
+            entries.append(path if content is None else (path, content, None))
+        self._store_files(entries)
+
+    ###########################################################################
+    #                                 Queries                                 #
+    ###########################################################################
+    def _query(self, sql, params=()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def summary(self) -> dict:
+        images, annotated, boxes, errors = self._query(
+            "SELECT COUNT(*), COALESCE(SUM(CASE WHEN size = -1 THEN 0 ELSE 1 END), 0), "
+            "COALESCE(SUM(boxes), 0), COUNT(error) FROM images"
+        )[0]
+        labels = self._query("SELECT COUNT(DISTINCT label_id) FROM boxes")[0][0]
+        return {"images": images, "annotated": annotated, "boxes": boxes, "labels": labels, "errors": errors}
+
+    def label_stats(self) -> list:
+        # (label, boxes, images, mean normalized width, mean normalized height), most frequent first.
+        return self._query(
+            "SELECT labels.name, COUNT(*), COUNT(DISTINCT boxes.image_id), AVG(boxes.w), AVG(boxes.h) "
+            "FROM boxes JOIN labels ON labels.id = boxes.label_id "
+            "GROUP BY boxes.label_id ORDER BY COUNT(*) DESC, labels.name"
+        )
+
+    def box_count_histogram(self) -> list:
+        # (boxes per image, number of images) for every image in the index.
+        return self._query("SELECT boxes, COUNT(*) FROM images GROUP BY boxes ORDER BY boxes")
+
+    def images_with_label(self, label) -> list:
+        # (image path, boxes with `label`) in path order.
+        return self._query(
+            "SELECT images.path, COUNT(*) FROM boxes "
+            "JOIN images ON images.id = boxes.image_id "
+            "WHERE boxes.label_id = (SELECT id FROM labels WHERE name = ?) "
+            "GROUP BY boxes.image_id ORDER BY images.path",
+            (label,)
+        )
+
+    def images_where(self, min_boxes=None, max_boxes=None) -> list:
+        # (image path, box count) of images whose box count lies in the given range.
+        clauses, params = [], []
+        if min_boxes is not None:
+            clauses.append("boxes >= ?")
+            params.append(min_boxes)
+        if max_boxes is not None:
+            clauses.append("boxes <= ?")
+            params.append(max_boxes)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(f"SELECT path, boxes FROM images{where} ORDER BY path", params)
+
+    def errors(self) -> list:
+        return self._query("SELECT path, error FROM images WHERE error IS NOT NULL ORDER BY path")
+
+###############################################################################
+#                                Command Line                                 #
+###############################################################################
+def image_list_for(root) -> ImageList:
+    image_list = ImageList(root)
+    for directory, names, annotated in scan_dataset(root):
+        image_list.extend(directory, names, annotated)
+    return image_list
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="index",
+        description="Update the label index of a dataset and print statistics or matching images, without Qt."
+    )
+    parser.add_argument("source", help="directory tree containing images and their .txt or .box files")
+    parser.add_argument("--db", help="index file (default: the one the GUI uses for this folder)")
+    parser.add_argument("--label", help="list the images containing this label")
+    parser.add_argument("--min-boxes", type=int, help="list the images with at least this many boxes")
+    parser.add_argument("--max-boxes", type=int, help="list the images with at most this many boxes")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of text")
+    args = parser.parse_args(argv)
+    image_list = image_list_for(args.source)
+    index = DatasetIndex(args.db) if args.db else DatasetIndex.for_dataset(image_list)
+    stats = index.sync(image_list, prune=True)
+    print(f"Checked {stats['checked']} images, updated {stats['updated']}, "
+          f"removed {stats['removed']}", file=sys.stderr)
+    if args.label is not None:
+        result = [{"path": path, "boxes": n} for path, n in index.images_with_label(args.label)]
+    elif args.min_boxes is not None or args.max_boxes is not None:
+        result = [{"path": path, "boxes": n} for path, n in index.images_where(args.min_boxes, args.max_boxes)]
+    else:
+        result = {
+            "summary": index.summary(),
+            "labels": [
+                {"label": label, "boxes": boxes, "images": images, "mean_w": w, "mean_h": h}
+                for label, boxes, images, w, h in index.label_stats()
+            ],
+            "boxes_per_image": {str(boxes): images for boxes, images in index.box_count_histogram()},
+            "errors": [{"path": path, "error": error} for path, error in index.errors()],
+        }
+    index.close()
+    if args.json:
+        print(json.dumps(result, indent=2))
+    elif isinstance(result, list):
+        for entry in result:
+            print(f"{entry['boxes']:6d}  {entry['path']}")
+    else:
+        summary = result["summary"]
+        print(f"{summary['images']} images, {summary['annotated']} annotated, {summary['boxes']} boxes, "
+              f"{summary['labels']} labels, {summary['errors']} unreadable")
+        print(f"{'label':<24} {'boxes':>8} {'images':>8} {'mean w':>7} {'mean h':>7}")
+        for entry in result["labels"]:
+            print(f"{entry['label']:<24} {entry['boxes']:8d} {entry['images']:8d} "
+                  f"{entry['mean_w']:7.3f} {entry['mean_h']:7.3f}")
+        for entry in result["errors"]:
+            print(f"unreadable: {entry['path']}: {entry['error']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
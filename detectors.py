@@ -0,0 +1,154 @@
+import importlib
+import os
+
+import numpy as np
+
+###############################################################################
+#                              Detector Backends                              #
+###############################################################################
+# Pre-annotation backends. Nothing here imports Qt. A detector has a
+# detect(images) method that takes a batch of RGB uint8 arrays (H x W x 3) and
+# returns, for every image, a list of proposals (label, score, cx, cy, w, h)
+# with geometry normalized to [0..1] like the TXT format. An optional
+# `input_size` attribute tells the caller to decode images with their longer
+# side at most that many pixels.
+#
+# Detectors are chosen by a spec string:
+#   dummy                 DummyDetector, for tests and demos
+#   onnx:path/model.onnx  OnnxDetector (needs the optional onnxruntime package)
+#   package.module:name   a local callable with the detect() signature, or a
+#                         class (instantiated without arguments) with a detect() method
+
+
+class DummyDetector:
+    # Deterministic stand-in: proposes the (at most) `count` cells of a grid
+    # with the most contrast. Cheap enough to run on every image.
+    input_size = 256
+
+    def __init__(self, grid=4, count=3, label="object"):
+        self.grid = grid
+        self.count = count
+        self.label = label
+
+    def detect(self, images) -> list:
+        return [self._detect(image) for image in images]
+
+    def _detect(self, image) -> list:
+        gray = np.asarray(image, dtype=np.float32).mean(axis=2)
+        h = gray.shape[0] // self.grid * self.grid
+        w = gray.shape[1] // self.grid * self.grid
+        if not h or not w:
+            return []
+        cells = gray[:h, :w].reshape(self.grid, h // self.grid, self.grid, w // self.grid)
+        contrast = cells.std(axis=(1, 3))
+        proposals = []
+        for index in np.argsort(contrast, axis=None)[::-1][:self.count].tolist():
+            row, column = divmod(index, self.grid)
+            if contrast[row, column] < 1:
+                break
+            size = 0.8 / self.grid
+            proposals.append((self.label, min(1.0, float(contrast[row, column]) / 64),
+                              (column + 0.5) / self.grid, (row + 0.5) / self.grid, size, size))
+        return proposals
+
+
+class CallableDetector:
+    # Wraps a plain function images -> proposals.
+    def __init__(self, fn, input_size=None):
+        self.fn = fn
+        if input_size is not None:
+            self.input_size = input_size
+
+    def detect(self, images) -> list:
+        return self.fn(images)
+
+
+class OnnxDetector:
+    # CPU inference through ONNX Runtime. The model takes a float32 NCHW RGB
+    # batch in [0, 1], letterboxed to a square input, and its first output is
+    # (batch, N, 6) rows of x1, y1, x2, y2 (input pixels), score, class id.
+    # Class names come from a text file with one label per line next to the
+    # model (model.labels.txt or classes.txt); otherwise class ids are used.
+    def __init__(self, model_path, score_threshold=0.25, threads=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("ONNX detectors need the onnxruntime package (pip install onnxruntime)")
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        shape = self.session.get_inputs()[0].shape
+        self.input_size = shape[2] if isinstance(shape[2], int) else 640
+        self.score_threshold = score_threshold
+        self.labels = []
+        for name in (os.path.splitext(model_path)[0] + ".labels.txt",
+                     os.path.join(os.path.dirname(model_path), "classes.txt")):
+            if os.path.exists(name):
+                with open(name, "r") as f:
+                    self.labels = [line.strip() for line in f if line.strip()]
+                break
+
+    def detect(self, images) -> list:
+        size = self.input_size
+        batch = np.zeros((len(images), 3, size, size), dtype=np.float32)
+        for i, image in enumerate(images):
+            # Images arrive decoded with their longer side at most `size`: pad, never resize.
+            h, w = image.shape[:2]
+            batch[i, :, :h, :w] = image[:size, :size].transpose(2, 0, 1) / 255.0
+        outputs = self.session.run(None, {self.input_name: batch})[0]
+        results = []
+        for image, rows in zip(images, outputs):
+            h, w = image.shape[:2]
+            proposals = []
+            for x1, y1, x2, y2, score, class_id in np.asarray(rows, dtype=np.float64).reshape(-1, 6).tolist():
+                if score < self.score_threshold or x2 <= x1 or y2 <= y1:
+                    continue
+                class_id = int(class_id)
+                label = self.labels[class_id] if 0 <= class_id < len(self.labels) else str(class_id)
+                proposals.append((label, score, (x1 + x2) / 2 / w, (y1 + y2) / 2 / h, (x2 - x1) / w, (y2 - y1) / h))
+            results.append(proposals)
+        return results
+
+
+def check_detector_spec(spec):
+    # Raises ValueError for a spec that cannot name a detector, without loading
+    # anything, so the GUI can reject it before starting a worker.
+    if spec == "dummy":
+        return
+    if spec.startswith("onnx:"):
+        if not os.path.isfile(spec[len("onnx:"):]):
+            raise ValueError(f"Detector model not found: {spec[len('onnx:'):]}")
+        return
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Unknown detector {spec!r}: expected dummy, onnx:<model> or <module>:<name>")
+
+
+def load_detector(spec):
+    # Builds the detector described by `spec` (see above).
+    check_detector_spec(spec)
+    if spec == "dummy":
+        return DummyDetector()
+    if spec.startswith("onnx:"):
+        return OnnxDetector(spec[len("onnx:"):])
+    module_name, _, attribute = spec.partition(":")
+    target = getattr(importlib.import_module(module_name), attribute)
+    if isinstance(target, type):
+        return target()
+    if hasattr(target, "detect"):
+        return target
+    return CallableDetector(target)
+
+
+def detector_identity(spec) -> str:
+    # Cache key of a detector: the spec, plus the model file's mtime and size,
+    # so proposals are recomputed when an ONNX model is replaced.
+    if spec.startswith("onnx:"):
+        try:
+            st = os.stat(spec[len("onnx:"):])
+            return f"{spec}|{st.st_mtime_ns}|{st.st_size}"
+        except OSError:
+            pass
+    return spec
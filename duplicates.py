@@ -0,0 +1,349 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PyQt5.QtGui import QImage, QImageReader
+from PyQt5.QtCore import QSize, Qt
+
+from annotations import find_sidecar
+from convert import batched, bounded_map
+from dataset import dataset_key
+from dataset_index import image_list_for
+
+###############################################################################
+#                              Perceptual Hashes                              #
+###############################################################################
+# Near-duplicate detection for scraped datasets. Every image gets two 64-bit
+# perceptual hashes: dHash (signs of horizontal gradients of a 9 x 8
+# thumbnail) and pHash (signs of the low frequencies of the DCT of a 32 x 32
+# thumbnail, against their median). Images whose hashes differ in at most
+# `radius` bits are near-duplicates. Qt is used only to decode images, so no
+# QApplication is needed and this runs headless.
+HASHES = ("phash", "dhash")
+DEFAULT_RADIUS = 4
+PHASH_SIZE = 32
+
+
+def dct_matrix(n) -> np.ndarray:
+    # Orthonormal DCT-II matrix: dct_matrix(n) @ x is the DCT of the column x.
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT = dct_matrix(PHASH_SIZE)
+
+
+def bits_to_int(bits) -> int:
+    return int.from_bytes(np.packbits(np.asarray(bits, dtype=bool).ravel()).tobytes(), "big")
+
+
+def gray_pixels(image, width, height) -> np.ndarray:
+    # Grayscale float array of `image` resampled to width x height.
+    image = image.scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    rows = np.frombuffer(bits, np.uint8).reshape(height, image.bytesPerLine())
+    return rows[:, :width].astype(np.float64)
+
+
+def phash(image) -> int:
+    pixels = gray_pixels(image, PHASH_SIZE, PHASH_SIZE)
+    low = (DCT @ pixels @ DCT.T)[:8, :8].ravel()
+    # The DC term only measures brightness and would skew the median.
+    return bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(image) -> int:
+    pixels = gray_pixels(image, 9, 8)
+    return bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def hash_images(paths) -> list:
+    # Worker process: (path, mtime_ns, file size, phash, dhash) per image; the
+    # hashes are None for unreadable images so they are not decoded again.
+    results = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid():
+            # Decoding straight to a small size is much cheaper for JPEG.
+            scale = min(1.0, 4 * PHASH_SIZE / max(size.width(), size.height(), 1))
+            reader.setScaledSize(QSize(max(1, round(size.width() * scale)), max(1, round(size.height() * scale))))
+        image = reader.read()
+        if image.isNull():
+            results.append((path, st.st_mtime_ns, st.st_size, None, None))
+        else:
+            results.append((path, st.st_mtime_ns, st.st_size, phash(image), dhash(image)))
+    return results
+
+
+def hamming(a, b) -> int:
+    return bin(a ^ b).count("1")
+
+###############################################################################
+#                               HashIndex Class                               #
+###############################################################################
+def bit_ranges(radius, bits=64) -> list:
+    # (shift, mask) of radius + 1 nearly equal ranges covering all bits.
+    parts = radius + 1
+    ranges = []
+    start = 0
+    for part in range(parts):
+        width = bits // parts + (1 if part < bits % parts else 0)
+        ranges.append((start, (1 << width) - 1))
+        start += width
+    return ranges
+
+
+class HashIndex:
+    # Multi-index hash table for Hamming-radius lookups. Hashes are cut into
+    # radius + 1 bit ranges; two hashes within `radius` bits agree exactly on
+    # at least one range, so a query only compares the hashes that share a
+    # range value with it instead of every hash.
+    def __init__(self, radius=DEFAULT_RADIUS):
+        self.radius = radius
+        self.ranges = bit_ranges(radius)
+        self.tables = [{} for _ in self.ranges]
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, key, value):
+        if key in self.values:
+            self.remove(key)
+        self.values[key] = value
+        for (shift, mask), table in zip(self.ranges, self.tables):
+            table.setdefault((value >> shift) & mask, []).append(key)
+
+    def remove(self, key):
+        value = self.values.pop(key)
+        for (shift, mask), table in zip(self.ranges, self.tables):
+            table[(value >> shift) & mask].remove(key)
+
+    def query(self, value) -> list:
+        # (distance, key) of every hash within the radius, closest first.
+        found = {}
+        for (shift, mask), table in zip(self.ranges, self.tables):
+            for key in table.get((value >> shift) & mask, ()):
+                if key not in found:
+                    found[key] = hamming(value, self.values[key])
+        return sorted((distance, key) for key, distance in found.items() if distance <= self.radius)
+
+###############################################################################
+#                                  Clusters                                   #
+###############################################################################
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def near_pairs(hashes, radius, block=512) -> np.ndarray:
+    # (i, j) rows, i < j, of distinct hash values within `radius` bits. Values
+    # sharing a bit range are compared blockwise with vectorized popcounts.
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    pairs = []
+    for shift, mask in bit_ranges(radius):
+        keys = (hashes >> np.uint64(shift)) & np.uint64(mask)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True])
+        for start, stop in zip(starts[:-1].tolist(), starts[1:].tolist()):
+            if stop - start < 2:
+                continue
+            rows = order[start:stop]
+            group = hashes[rows]
+            for first in range(0, len(rows), block):
+                xor = group[first:first + block, None] ^ group[None, :]
+                distance = POPCOUNT[xor.view(np.uint8)].reshape(xor.shape + (8,)).sum(axis=2, dtype=np.int32)
+                i, j = np.nonzero(distance <= radius)
+                i += first
+                keep = i < j
+                pairs.append(np.stack([rows[i[keep]], rows[j[keep]]], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.intp)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def clusters(hashes, radius=DEFAULT_RADIUS) -> list:
+    # Groups of row numbers (two or more, sorted) linked by near-duplicate
+    # hashes, largest first. Identical hashes are compared once.
+    values, inverse = np.unique(np.asarray(hashes, dtype=np.uint64), return_inverse=True)
+    parent = list(range(len(values)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in near_pairs(values, radius).tolist():
+        a, b = find(i), find(j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    groups = {}
+    for row, value in enumerate(inverse.tolist()):
+        groups.setdefault(find(value), []).append(row)
+    return sorted((rows for rows in groups.values() if len(rows) > 1), key=lambda rows: (-len(rows), rows[0]))
+
+###############################################################################
+#                               HashCache Class                               #
+###############################################################################
+def hash_cache_root() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "image-annotation-tool", "hashes")
+
+
+def to_signed(value):
+    # SQLite integers are signed 64-bit.
+    return None if value is None else value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return None if value is None else value + (1 << 64) if value < 0 else value
+
+
+class HashCache:
+    # Perceptual hashes of one dataset in SQLite, valid while an image's mtime
+    # and size match. Like the label index it is only a cache.
+    def __init__(self, filename):
+        self.filename = filename
+        if filename != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, phash INTEGER, dhash INTEGER)"
+        )
+
+    @classmethod
+    def for_dataset(cls, image_list, cache_root=None):
+        key = dataset_key(image_list)
+        root = cache_root or hash_cache_root()
+        return cls(os.path.join(root, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".sqlite"))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def load(self) -> dict:
+        # path -> (mtime_ns, size, phash, dhash) of everything cached.
+        with self._lock:
+            rows = self._db.execute("SELECT path, mtime_ns, size, phash, dhash FROM hashes").fetchall()
+        return {path: (mtime_ns, size, to_unsigned(p), to_unsigned(d)) for path, mtime_ns, size, p, d in rows}
+
+    def store(self, results):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO hashes(path, mtime_ns, size, phash, dhash) VALUES (?, ?, ?, ?, ?)",
+                [(path, mtime_ns, size, to_signed(p), to_signed(d)) for path, mtime_ns, size, p, d in results]
+            )
+
+
+def hash_dataset(image_paths, cache, workers=None, cancelled=None, batch_size=32, window=16):
+    # Yields (row in image_paths, phash, dhash) for every image, in two passes:
+    # cached hashes first, then the images hashed by worker processes (stored
+    # in the cache as they arrive). Unreadable images have None hashes.
+    # `cancelled()` is polled between images and batches.
+    cached = cache.load()
+    missing = []
+    for row, path in enumerate(image_paths):
+        entry = cached.get(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if entry is not None and entry[:2] == (st.st_mtime_ns, st.st_size):
+            yield row, entry[2], entry[3]
+        else:
+            missing.append((row, path))
+        if cancelled is not None and cancelled():
+            return
+    if not missing:
+        return
+    # Workers are spawned, not forked, so they do not inherit the GUI's threads.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        row_batches = batched(missing, batch_size)
+        path_batches = ([path for _, path in batch] for batch in batched(missing, batch_size))
+        for rows, batch in zip(row_batches, bounded_map(executor, hash_images, path_batches, window)):
+            cache.store(batch)
+            row_of = dict((path, row) for row, path in rows)
+            for path, _, _, p, d in batch:
+                yield row_of[path], p, d
+            if cancelled is not None and cancelled():
+                executor.shutdown(wait=False, cancel_futures=True)
+                return
+
+###############################################################################
+#                                Command Line                                 #
+###############################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="duplicates",
+        description="Find clusters of near-duplicate images by perceptual hash and report which ones are annotated."
+    )
+    parser.add_argument("source", help="directory tree containing images")
+    parser.add_argument("--hash", choices=HASHES, default="phash", help="hash to compare (default phash)")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS,
+                        help=f"largest Hamming distance between near-duplicates, 0-63 (default {DEFAULT_RADIUS})")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of text")
+    args = parser.parse_args(argv)
+    if not 0 <= args.radius < 64:
+        parser.error("--radius must be between 0 and 63")
+
+    image_list = image_list_for(args.source)
+    cache = HashCache.for_dataset(image_list)
+    paths, hashes, unreadable = [], [], 0
+    column = HASHES.index(args.hash)
+    try:
+        for row, *values in hash_dataset(image_list, cache, args.workers):
+            if values[column] is None:
+                unreadable += 1
+                continue
+            paths.append(image_list[row])
+            hashes.append(values[column])
+    finally:
+        cache.close()
+    groups = clusters(hashes, args.radius)
+    report = []
+    for rows in groups:
+        # Distances are counted from the first image of the cluster.
+        rows = sorted(rows, key=lambda row: paths[row])
+        report.append([
+            {"path": paths[row], "annotated": find_sidecar(paths[row]) is not None,
+             "distance": hamming(hashes[rows[0]], hashes[row])}
+            for row in rows
+        ])
+    redundant = sum(len(cluster) - 1 for cluster in report)
+    if args.json:
+        print(json.dumps({"images": len(paths), "unreadable": unreadable, "hash": args.hash, "radius": args.radius,
+                          "clusters": report}, indent=2))
+    else:
+        for number, cluster in enumerate(report, start=1):
+            print(f"cluster {number} ({len(cluster)} images)")
+            for entry in cluster:
+                print(f"  {'*' if entry['annotated'] else ' '} {entry['distance']:2d}  {entry['path']}")
+    print(f"Hashed {len(paths)} images ({unreadable} unreadable): {len(report)} clusters, "
+          f"{redundant} images are near-duplicates of another one", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
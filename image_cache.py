@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtGui import QImage, QImageReader
+
+from telemetry import TELEMETRY
+
+###############################################################################
+#                               ImageCache Class                              #
+###############################################################################
+class ImageCache:
+    # Keeps decoded QImages under a byte budget (LRU eviction) and decodes
+    # neighbouring images on a background thread pool.
+    def __init__(self, max_bytes=768 * 1024 * 1024, prefetch_count=2, workers=2):
+        self.max_bytes = max_bytes
+        self.prefetch_count = prefetch_count
+        self._images = OrderedDict()
+        self._pending = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-decode")
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_waits = 0
+        self.decode_count = 0
+        self.decode_time = 0.0
+        self.last_decode_time = 0.0
+
+    def get(self, filename) -> QImage:
+        # Returns the decoded image, decoding it on the calling thread on a miss.
+        with self._lock:
+            image = self._images.get(filename)
+            if image is not None:
+                self._images.move_to_end(filename)
+                self.hits += 1
+                TELEMETRY.count("image_cache.hit")
+                return image
+            future = self._pending.get(filename)
+        if future is not None:
+            if not future.cancel():
+                # Already being decoded in the background; waiting is cheaper than starting over.
+                image = future.result()
+                with self._lock:
+                    self.prefetch_waits += 1
+                TELEMETRY.count("image_cache.prefetch_wait")
+                return image
+            with self._lock:
+                self._pending.pop(filename, None)
+        with self._lock:
+            self.misses += 1
+        TELEMETRY.count("image_cache.miss")
+        return self._decode(filename)
+
+    def prefetch(self, filenames):
+        # Schedules background decoding for images that are neither cached nor pending.
+        with self._lock:
+            wanted = set(filenames)
+            for filename, future in list(self._pending.items()):
+                if filename not in wanted and future.cancel():
+                    del self._pending[filename]
+            for filename in filenames:
+                if filename in self._images or filename in self._pending:
+                    continue
+                self._pending[filename] = self._executor.submit(self._prefetch, filename)
+
+    def prefetch_around(self, image_list, index):
+        # Prefetches the next and previous `prefetch_count` entries, nearest first.
+        filenames = []
+        for step in range(1, self.prefetch_count + 1):
+            if index + step < len(image_list):
+                filenames.append(image_list[index + step])
+            if index - step >= 0:
+                filenames.append(image_list[index - step])
+        self.prefetch(filenames)
+
+    def _prefetch(self, filename) -> QImage:
+        # Images that could never fit in the cache (e.g. tiled giants) are not decoded.
+        size = QImageReader(filename).size()
+        if size.width() * size.height() * 4 > self.max_bytes:
+            with self._lock:
+                self._pending.pop(filename, None)
+            return QImage()
+        return self._decode(filename)
+
+    def _decode(self, filename) -> QImage:
+        start = time.perf_counter()
+        image = QImage(filename)
+        elapsed = time.perf_counter() - start
+        TELEMETRY.record("image.decode", elapsed, start)
+        with self._lock:
+            self._pending.pop(filename, None)
+            self.decode_count += 1
+            self.decode_time += elapsed
+            self.last_decode_time = elapsed
+            if not image.isNull():
+                self._insert(filename, image)
+        return image
+
+    def _insert(self, filename, image):
+        # Caller must hold the lock.
+        size = image.sizeInBytes()
+        if size > self.max_bytes:
+            return
+        old = self._images.pop(filename, None)
+        if old is not None:
+            self._bytes -= old.sizeInBytes()
+        self._images[filename] = image
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._bytes -= evicted.sizeInBytes()
+
+    def stats(self) -> dict:
+        # Returns hit/miss counters and decode timings (seconds).
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "prefetch_waits": self.prefetch_waits,
+                "cached_images": len(self._images),
+                "cached_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "decode_count": self.decode_count,
+                "decode_time_total": self.decode_time,
+                "decode_time_avg": self.decode_time / self.decode_count if self.decode_count else 0.0,
+                "decode_time_last": self.last_decode_time,
+            }
+
+    def clear(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._images.clear()
+            self._bytes = 0
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
@@ -1,13 +1,68 @@
 import sys
 import os
+import bisect
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+if __name__ == "__main__" and sys.argv[1:2] == ["convert"]:
+    # Headless subcommands run without importing Qt.
+    from convert import main as convert_main
+    sys.exit(convert_main(sys.argv[2:]))
+if __name__ == "__main__" and sys.argv[1:2] == ["index"]:
+    from dataset_index import main as index_main
+    sys.exit(index_main(sys.argv[2:]))
+if __name__ == "__main__" and sys.argv[1:2] == ["validate"]:
+    from validate import main as validate_main
+    sys.exit(validate_main(sys.argv[2:]))
+if __name__ == "__main__" and sys.argv[1:2] == ["sidecars"]:
+    from sidecars import main as sidecars_main
+    sys.exit(sidecars_main(sys.argv[2:]))
+if __name__ == "__main__" and sys.argv[1:2] == ["duplicates"]:
+    from duplicates import main as duplicates_main
+    sys.exit(duplicates_main(sys.argv[2:]))
+if __name__ == "__main__" and sys.argv[1:2] == ["session"]:
+    from session import main as session_main
+    sys.exit(session_main(sys.argv[2:]))
+if __name__ == "__main__" and sys.argv[1:2] == ["serve"]:
+    from annotation_server import main as serve_main
+    sys.exit(serve_main(sys.argv[2:]))
+
+import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QGraphicsScene, QFileDialog, QGraphicsPixmapItem,
-    QGraphicsView, QListWidget, QListWidgetItem, QInputDialog, QGraphicsTextItem,
-    QGraphicsRectItem
+    QGraphicsView, QListView, QInputDialog, QGraphicsTextItem,
+    QGraphicsRectItem, QGraphicsItem, QDialog, QCheckBox, QTableWidget, QTableWidgetItem,
+    QHeaderView, QLabel, QStyledItemDelegate, QMessageBox
+)
+from PyQt5.QtGui import (
+    QImage, QImageReader, QPen, QColor, QFont, QBrush, QPainterPath, QStaticText, QFontMetricsF, QTransform
+)
+from PyQt5.QtCore import (
+    Qt, QRectF, QPointF, QSize, QLocale, QItemSelectionModel, QTimer, QAbstractListModel, QModelIndex,
+    QObject, QStringListModel, pyqtSignal, QElapsedTimer, QEvent
+)
+
+from image_cache import ImageCache
+from annotations import (
+    AnnotationStore, LabelTable, normalized_to_pixels, BINARY_EXTENSION, TXT_EXTENSION, SIDECAR_FORMAT_VAR,
+    decode_sidecar, encode_sidecar, find_sidecar, read_sidecar_content, sidecar_paths
 )
-from PyQt5.QtGui import QPixmap, QPen, QColor, QFont, QBrush
-from PyQt5.QtCore import Qt, QRectF, QPointF, QLocale
+from persistence import AnnotationWriter
+from spatial_index import GridIndex
+from tiles import LodPixmapItem, TiledImageItem, needs_tiling
+from telemetry import TELEMETRY, timed
+from thumbnails import FilmstripModel, FilmstripView, UnannotatedFilter
+from dataset import ImageList, dataset_key, scan_dataset
+from dataset_index import DatasetIndex
+from image_headers import read_image_size
+from propagation import propagate_boxes
+from detectors import check_detector_spec
+from preannotation import PreAnnotator
+from duplicates import HashCache, HashIndex, hash_dataset
+from annotation_server import SyncClient
+from session import DONE, IN_PROGRESS, SKIPPED, UNTOUCHED, Session, last_session, session_filename, set_last_session
 
 ###############################################################################
 #                             Internationalization                            #
@@ -21,7 +76,33 @@ STRINGS = {
         "rect_no_label": "No Label",
         "dialog_edit_label": "Edit Label",
         "dialog_new_label": "Enter new label:",
-        "nav_title": "Image {current} of {total} - {filename}"
+        "nav_title": "Image {current} of {total} - {filename}",
+        "telemetry_title": "Performance Telemetry",
+        "telemetry_enabled": "Record timings",
+        "telemetry_save_json": "Save JSON...",
+        "telemetry_save_trace": "Save Chrome Trace...",
+        "telemetry_reset": "Reset",
+        "filmstrip_count": "{count} boxes",
+        "open_folder": "Open Folder",
+        "next_unannotated": "Next Unannotated",
+        "unannotated_only": "Unannotated only",
+        "index_title": "Dataset Statistics",
+        "index_summary": "{images} images, {annotated} annotated, {boxes} boxes, {labels} labels",
+        "index_matches": "{count} images with \"{label}\"",
+        "index_previous": "Previous Match",
+        "index_next": "Next Match",
+        "propagate": "Propagate Boxes",
+        "auto_propagate": "Auto-propagate",
+        "detector": "Detector...",
+        "detector_prompt": "Detector (dummy, onnx:model.onnx or module:function; empty turns it off):",
+        "accept_proposals": "Accept Proposals",
+        "reject_proposals": "Reject Proposals",
+        "duplicate_of": "Near-duplicate of {name} ({count} boxes)",
+        "copy_duplicate": "Copy Boxes from Duplicate",
+        "leased_by": "{owner} is annotating this image",
+        "save_failed": "Could not save annotations ({error}); retrying",
+        "detector_failed": "Detector failed: {error}",
+        "unsaved_close": "Some annotations could not be saved ({error}). Close anyway and lose those edits?"
     },
     "es": {
         "window_title": "Herramienta de Anotación de Imágenes",
@@ -31,7 +112,33 @@ STRINGS = {
         "rect_no_label": "Sin nombre",
         "dialog_edit_label": "Editar Etiqueta",
         "dialog_new_label": "Ingrese nueva etiqueta:",
-        "nav_title": "Imagen {current} de {total} - {filename}"
+        "nav_title": "Imagen {current} de {total} - {filename}",
+        "telemetry_title": "Telemetría de rendimiento",
+        "telemetry_enabled": "Registrar tiempos",
+        "telemetry_save_json": "Guardar JSON...",
+        "telemetry_save_trace": "Guardar traza de Chrome...",
+        "telemetry_reset": "Reiniciar",
+        "filmstrip_count": "{count} cajas",
+        "open_folder": "Abrir carpeta",
+        "next_unannotated": "Siguiente sin anotar",
+        "unannotated_only": "Solo sin anotar",
+        "index_title": "Estadísticas del conjunto",
+        "index_summary": "{images} imágenes, {annotated} anotadas, {boxes} cajas, {labels} etiquetas",
+        "index_matches": "{count} imágenes con \"{label}\"",
+        "index_previous": "Coincidencia anterior",
+        "index_next": "Siguiente coincidencia",
+        "propagate": "Propagar cajas",
+        "auto_propagate": "Propagar automáticamente",
+        "detector": "Detector...",
+        "detector_prompt": "Detector (dummy, onnx:modelo.onnx o módulo:función; vacío lo desactiva):",
+        "accept_proposals": "Aceptar propuestas",
+        "reject_proposals": "Rechazar propuestas",
+        "duplicate_of": "Casi duplicado de {name} ({count} cajas)",
+        "copy_duplicate": "Copiar cajas del duplicado",
+        "leased_by": "{owner} está anotando esta imagen",
+        "save_failed": "No se pudieron guardar las anotaciones ({error}); reintentando",
+        "detector_failed": "El detector falló: {error}",
+        "unsaved_close": "Algunas anotaciones no se pudieron guardar ({error}). ¿Cerrar de todos modos y perder esos cambios?"
     },
     "de": {
         "window_title": "Bild-Anmerkungswerkzeug",
@@ -41,7 +148,33 @@ STRINGS = {
         "rect_no_label": "Kein Label",
         "dialog_edit_label": "Label bearbeiten",
         "dialog_new_label": "Neues Label eingeben:",
-        "nav_title": "Bild {current} von {total} - {filename}"
+        "nav_title": "Bild {current} von {total} - {filename}",
+        "telemetry_title": "Leistungs-Telemetrie",
+        "telemetry_enabled": "Zeiten aufzeichnen",
+        "telemetry_save_json": "JSON speichern...",
+        "telemetry_save_trace": "Chrome-Trace speichern...",
+        "telemetry_reset": "Zurücksetzen",
+        "filmstrip_count": "{count} Boxen",
+        "open_folder": "Ordner öffnen",
+        "next_unannotated": "Nächstes ohne Anmerkung",
+        "unannotated_only": "Nur ohne Anmerkung",
+        "index_title": "Datensatz-Statistik",
+        "index_summary": "{images} Bilder, {annotated} annotiert, {boxes} Rahmen, {labels} Labels",
+        "index_matches": "{count} Bilder mit \"{label}\"",
+        "index_previous": "Vorheriger Treffer",
+        "index_next": "Nächster Treffer",
+        "propagate": "Rahmen übernehmen",
+        "auto_propagate": "Automatisch übernehmen",
+        "detector": "Detektor...",
+        "detector_prompt": "Detektor (dummy, onnx:modell.onnx oder modul:funktion; leer schaltet ihn aus):",
+        "accept_proposals": "Vorschläge übernehmen",
+        "reject_proposals": "Vorschläge verwerfen",
+        "duplicate_of": "Fast-Duplikat von {name} ({count} Boxen)",
+        "copy_duplicate": "Rahmen vom Duplikat kopieren",
+        "leased_by": "{owner} annotiert dieses Bild gerade",
+        "save_failed": "Annotationen konnten nicht gespeichert werden ({error}); neuer Versuch läuft",
+        "detector_failed": "Detektor fehlgeschlagen: {error}",
+        "unsaved_close": "Einige Annotationen konnten nicht gespeichert werden ({error}). Trotzdem schließen und diese Änderungen verlieren?"
     },
     "fr": {
         "window_title": "Outil d'annotation d'images",
@@ -51,7 +184,33 @@ STRINGS = {
         "rect_no_label": "Pas d'étiquette",
         "dialog_edit_label": "Modifier l'étiquette",
         "dialog_new_label": "Entrez une nouvelle étiquette:",
-        "nav_title": "Image {current} sur {total} - {filename}"
+        "nav_title": "Image {current} sur {total} - {filename}",
+        "telemetry_title": "Télémétrie des performances",
+        "telemetry_enabled": "Enregistrer les temps",
+        "telemetry_save_json": "Enregistrer JSON...",
+        "telemetry_save_trace": "Enregistrer la trace Chrome...",
+        "telemetry_reset": "Réinitialiser",
+        "filmstrip_count": "{count} boîtes",
+        "open_folder": "Ouvrir un dossier",
+        "next_unannotated": "Suivante non annotée",
+        "unannotated_only": "Non annotées uniquement",
+        "index_title": "Statistiques du jeu de données",
+        "index_summary": "{images} images, {annotated} annotées, {boxes} boîtes, {labels} étiquettes",
+        "index_matches": "{count} images avec \"{label}\"",
+        "index_previous": "Résultat précédent",
+        "index_next": "Résultat suivant",
+        "propagate": "Propager les boîtes",
+        "auto_propagate": "Propagation automatique",
+        "detector": "Détecteur...",
+        "detector_prompt": "Détecteur (dummy, onnx:modele.onnx ou module:fonction ; vide pour le désactiver) :",
+        "accept_proposals": "Accepter les propositions",
+        "reject_proposals": "Rejeter les propositions",
+        "duplicate_of": "Quasi-doublon de {name} ({count} boîtes)",
+        "copy_duplicate": "Copier les boîtes du doublon",
+        "leased_by": "{owner} annote cette image",
+        "save_failed": "Impossible d'enregistrer les annotations ({error}) ; nouvelle tentative en cours",
+        "detector_failed": "Échec du détecteur : {error}",
+        "unsaved_close": "Certaines annotations n'ont pas pu être enregistrées ({error}). Fermer quand même et perdre ces modifications ?"
     },
     "pt": {
         "window_title": "Ferramenta de Anotação de Imagens",
@@ -61,7 +220,33 @@ STRINGS = {
         "rect_no_label": "Sem rótulo",
         "dialog_edit_label": "Editar Rótulo",
         "dialog_new_label": "Digite um novo rótulo:",
-        "nav_title": "Imagem {current} de {total} - {filename}"
+        "nav_title": "Imagem {current} de {total} - {filename}",
+        "telemetry_title": "Telemetria de desempenho",
+        "telemetry_enabled": "Registrar tempos",
+        "telemetry_save_json": "Salvar JSON...",
+        "telemetry_save_trace": "Salvar trace do Chrome...",
+        "telemetry_reset": "Redefinir",
+        "filmstrip_count": "{count} caixas",
+        "open_folder": "Abrir pasta",
+        "next_unannotated": "Próxima sem anotação",
+        "unannotated_only": "Somente sem anotação",
+        "index_title": "Estatísticas do conjunto",
+        "index_summary": "{images} imagens, {annotated} anotadas, {boxes} caixas, {labels} rótulos",
+        "index_matches": "{count} imagens com \"{label}\"",
+        "index_previous": "Resultado anterior",
+        "index_next": "Próximo resultado",
+        "propagate": "Propagar caixas",
+        "auto_propagate": "Propagar automaticamente",
+        "detector": "Detector...",
+        "detector_prompt": "Detector (dummy, onnx:modelo.onnx ou módulo:função; vazio o desativa):",
+        "accept_proposals": "Aceitar propostas",
+        "reject_proposals": "Rejeitar propostas",
+        "duplicate_of": "Quase duplicata de {name} ({count} caixas)",
+        "copy_duplicate": "Copiar caixas da duplicata",
+        "leased_by": "{owner} está anotando esta imagem",
+        "save_failed": "Não foi possível salvar as anotações ({error}); tentando novamente",
+        "detector_failed": "Falha no detector: {error}",
+        "unsaved_close": "Algumas anotações não puderam ser salvas ({error}). Fechar mesmo assim e perder essas alterações?"
     },
     "ru": {
         "window_title": "Инструмент аннотации изображений",
@@ -71,10 +256,127 @@ STRINGS = {
         "rect_no_label": "Без метки",
         "dialog_edit_label": "Редактировать метку",
         "dialog_new_label": "Введите новую метку:",
-        "nav_title": "Изображение {current} из {total} - {filename}"
+        "nav_title": "Изображение {current} из {total} - {filename}",
+        "telemetry_title": "Телеметрия производительности",
+        "telemetry_enabled": "Записывать время",
+        "telemetry_save_json": "Сохранить JSON...",
+        "telemetry_save_trace": "Сохранить трассировку Chrome...",
+        "telemetry_reset": "Сбросить",
+        "filmstrip_count": "Рамок: {count}",
+        "open_folder": "Открыть папку",
+        "next_unannotated": "Следующее без аннотаций",
+        "unannotated_only": "Только без аннотаций",
+        "index_title": "Статистика набора данных",
+        "index_summary": "Изображений: {images}, размечено: {annotated}, рамок: {boxes}, меток: {labels}",
+        "index_matches": "Изображений с \"{label}\": {count}",
+        "index_previous": "Предыдущее совпадение",
+        "index_next": "Следующее совпадение",
+        "propagate": "Перенести рамки",
+        "auto_propagate": "Автоперенос",
+        "detector": "Детектор...",
+        "detector_prompt": "Детектор (dummy, onnx:model.onnx или модуль:функция; пусто — отключить):",
+        "accept_proposals": "Принять предложения",
+        "reject_proposals": "Отклонить предложения",
+        "duplicate_of": "Почти дубликат {name} (рамок: {count})",
+        "copy_duplicate": "Копировать рамки из дубликата",
+        "leased_by": "Это изображение размечает {owner}",
+        "save_failed": "Не удалось сохранить разметку ({error}); повторная попытка",
+        "detector_failed": "Ошибка детектора: {error}",
+        "unsaved_close": "Часть разметки не удалось сохранить ({error}). Закрыть всё равно и потерять эти изменения?"
     }
 }
 
+###############################################################################
+#                                Resize Helpers                               #
+###############################################################################
+HANDLE_CURSORS = {
+    "top-left": Qt.SizeFDiagCursor, "bottom-right": Qt.SizeFDiagCursor,
+    "top-right": Qt.SizeBDiagCursor, "bottom-left": Qt.SizeBDiagCursor,
+    "left": Qt.SizeHorCursor, "right": Qt.SizeHorCursor,
+    "top": Qt.SizeVerCursor, "bottom": Qt.SizeVerCursor,
+}
+
+
+def resize_handle_at(r: QRectF, pos: QPointF, margin):
+    # Returns the name of the edge or corner of `r` under `pos`, or None.
+    left, right, top, bottom = r.left(), r.right(), r.top(), r.bottom()
+    if abs(pos.x() - left) <= margin and abs(pos.y() - top) <= margin:
+        return "top-left"
+    if abs(pos.x() - right) <= margin and abs(pos.y() - top) <= margin:
+        return "top-right"
+    if abs(pos.x() - left) <= margin and abs(pos.y() - bottom) <= margin:
+        return "bottom-left"
+    if abs(pos.x() - right) <= margin and abs(pos.y() - bottom) <= margin:
+        return "bottom-right"
+    if abs(pos.x() - left) <= margin and top < pos.y() < bottom:
+        return "left"
+    if abs(pos.x() - right) <= margin and top < pos.y() < bottom:
+        return "right"
+    if abs(pos.y() - top) <= margin and left < pos.x() < right:
+        return "top"
+    if abs(pos.y() - bottom) <= margin and left < pos.x() < right:
+        return "bottom"
+    return None
+
+
+def resized_rect(orig: QRectF, handle, delta: QPointF) -> QRectF:
+    # Moves the edges named by `handle` by `delta`, keeping at least 5x5 pixels.
+    newRect = QRectF(orig)
+    if "left" in handle:
+        newRect.setLeft(newRect.left() + delta.x())
+    if "right" in handle:
+        newRect.setRight(newRect.right() + delta.x())
+    if "top" in handle:
+        newRect.setTop(newRect.top() + delta.y())
+    if "bottom" in handle:
+        newRect.setBottom(newRect.bottom() + delta.y())
+    if newRect.width() < 5:
+        newRect.setWidth(5)
+    if newRect.height() < 5:
+        newRect.setHeight(5)
+    return newRect
+
+
+# Interactive updates are applied at most once per display frame (~60 Hz).
+FRAME_MS = 16
+
+
+class FrameThrottle:
+    # Coalesces bursts of input into at most one call of `callback` per frame.
+    # The first request runs at once; requests arriving within the same frame
+    # are merged into a single trailing call. flush() runs a pending call now.
+    def __init__(self, callback, interval=FRAME_MS):
+        self.callback = callback
+        self.interval = interval
+        self.clock = QElapsedTimer()
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._run)
+
+    def request(self):
+        if self.timer.isActive():
+            return
+        if self.clock.isValid() and self.clock.elapsed() < self.interval:
+            self.timer.start(self.interval - self.clock.elapsed())
+        else:
+            self._run()
+
+    def flush(self):
+        if self.timer.isActive():
+            self.timer.stop()
+            self._run()
+
+    def cancel(self):
+        self.timer.stop()
+
+    def _run(self):
+        self.clock.start()
+        self.callback()
+
+
+# Opacity of the fill drawn over boxes selected in the annotation list.
+SELECTION_ALPHA = 60
+
 ###############################################################################
 #                         ResizableAnnotationRect Class                       #
 ###############################################################################
@@ -97,28 +399,60 @@ class ResizableAnnotationRect(QGraphicsPixmapItem):
         self._resizeDir = None
         self._startPos = None
         self._origRect = None
+        self._resizePos = None
+        self._throttle = None
+        self._labelHeight = self.textItem.boundingRect().height()
         self.updateLabelPosition()
         pen = QPen(self.color, 2)
         self.rect_item.setPen(pen)
         self.rect_item.setZValue(1)
 
     def boundingRect(self):
-        return self.rect_item.rect()
+        # Includes the resize margin so edges and corners can be grabbed.
+        m = self.HANDLE_SIZE
+        return self.rect_item.rect().adjusted(-m, -m, m, m)
+
+    def shape(self):
+        path = QPainterPath()
+        path.addRect(self.boundingRect())
+        return path
+
+    def contains(self, point: QPointF) -> bool:
+        return self.shape().contains(point)
 
     def setRect(self, new_rect: QRectF):
+        self.prepareGeometryChange()
         self.rect_item.setRect(new_rect)
         self.updateLabelPosition()
 
     def rect(self) -> QRectF:
         return self.rect_item.rect()
 
+    def setLabel(self, label):
+        self.label = label
+        self.textItem.setPlainText(label)
+        self._labelHeight = self.textItem.boundingRect().height()
+        self.updateLabelPosition()
+
+    def setHighlighted(self, highlighted):
+        # Tints the box while it is selected in the annotation list.
+        if highlighted:
+            fill = QColor(self.color)
+            fill.setAlpha(SELECTION_ALPHA)
+            self.rect_item.setBrush(QBrush(fill))
+        else:
+            self.rect_item.setBrush(QBrush(Qt.NoBrush))
+
     def updateLabelPosition(self):
+        # The label only moves when the top-left corner does; its height is
+        # measured when the text changes.
         margin = 2
         r = self.rect()
-        textRect = self.textItem.boundingRect()
         x = r.left()
-        y = r.top() - textRect.height() - margin
-        self.textItem.setPos(x, y)
+        y = r.top() - self._labelHeight - margin
+        pos = self.textItem.pos()
+        if pos.x() != x or pos.y() != y:
+            self.textItem.setPos(x, y)
 
     def paint(self, painter, option, widget=None):
         pass
@@ -137,27 +471,31 @@ class ResizableAnnotationRect(QGraphicsPixmapItem):
 
     def mouseMoveEvent(self, event):
         if self._resizing:
-            delta = event.scenePos() - self._startPos
-            newRect = QRectF(self._origRect)
-            if "left" in self._resizeDir:
-                newRect.setLeft(newRect.left() + delta.x())
-            if "right" in self._resizeDir:
-                newRect.setRight(newRect.right() + delta.x())
-            if "top" in self._resizeDir:
-                newRect.setTop(newRect.top() + delta.y())
-            if "bottom" in self._resizeDir:
-                newRect.setBottom(newRect.bottom() + delta.y())
-            if newRect.width() < 5:
-                newRect.setWidth(5)
-            if newRect.height() < 5:
-                newRect.setHeight(5)
-            self.setRect(newRect)
+            # Only the latest position counts; it is applied once per frame.
+            self._resizePos = event.scenePos()
+            if self._throttle is None:
+                self._throttle = FrameThrottle(self.applyResize)
+            self._throttle.request()
             event.accept()
         else:
             super().mouseMoveEvent(event)
 
+    def cancelResize(self):
+        # Drops a resize in progress, e.g. before the scene is cleared under it;
+        # a pending throttle call would otherwise reach a deleted item.
+        if self._throttle is not None:
+            self._throttle.cancel()
+        self._resizing = False
+        self._resizeDir = None
+
+    def applyResize(self):
+        if self._resizing:
+            self.setRect(resized_rect(self._origRect, self._resizeDir, self._resizePos - self._startPos))
+
     def mouseReleaseEvent(self, event):
         if self._resizing:
+            if self._throttle is not None:
+                self._throttle.flush()
             self._resizing = False
             self._resizeDir = None
             event.accept()
@@ -165,43 +503,409 @@ class ResizableAnnotationRect(QGraphicsPixmapItem):
             super().mouseReleaseEvent(event)
 
     def getResizeHandle(self, pos: QPointF):
-        margin = self.HANDLE_SIZE
-        r = self.rect()
-        left, right, top, bottom = r.left(), r.right(), r.top(), r.bottom()
-        if abs(pos.x() - left) <= margin and abs(pos.y() - top) <= margin:
-            return "top-left"
-        if abs(pos.x() - right) <= margin and abs(pos.y() - top) <= margin:
-            return "top-right"
-        if abs(pos.x() - left) <= margin and abs(pos.y() - bottom) <= margin:
-            return "bottom-left"
-        if abs(pos.x() - right) <= margin and abs(pos.y() - bottom) <= margin:
-            return "bottom-right"
-        if abs(pos.x() - left) <= margin and top < pos.y() < bottom:
-            return "left"
-        if abs(pos.x() - right) <= margin and top < pos.y() < bottom:
-            return "right"
-        if abs(pos.y() - top) <= margin and left < pos.x() < right:
-            return "top"
-        if abs(pos.y() - bottom) <= margin and left < pos.x() < right:
-            return "bottom"
+        return resize_handle_at(self.rect(), pos, self.HANDLE_SIZE)
+
+###############################################################################
+#                            AnnotationOverlay Class                          #
+###############################################################################
+class AnnotationOverlay(QGraphicsItem):
+    # Draws every box and label of a dense image from a single item, reading
+    # geometry straight from the AnnotationStore. Painting and hit tests only
+    # look at the boxes a GridIndex returns for the area in question.
+    TEXT_MARGIN = 4
+    LABEL_MARGIN = 2
+    MIN_LABEL_PIXELS = 6
+
+    def __init__(self, store, palette, selection=None):
+        super().__init__()
+        self.store = store
+        self.selection = selection
+        self.pens = [QPen(color, 2) for color in palette]
+        self.fills = [QColor(color.red(), color.green(), color.blue(), SELECTION_ALPHA) for color in palette]
+        self.selected = None
+        self.font = QFont()
+        self.font.setPointSize(8)
+        self.textHeight = QFontMetricsF(self.font).height()
+        self.labelGlyphs = {}
+        self.index = None
+        self.bounds = QRectF()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setZValue(1)
+        self.refresh()
+
+    def refresh(self):
+        # Rebuilds the spatial index and bounds after boxes were added, removed or resized.
+        self.prepareGeometryChange()
+        boxes = self.store.boxes
+        self.index = GridIndex(boxes, margin=ResizableAnnotationRect.HANDLE_SIZE)
+        bounds = QRectF(0, 0, self.store.width, self.store.height)
+        if len(boxes):
+            x0, y0 = boxes[:, :2].min(axis=0).tolist()
+            x1, y1 = (boxes[:, :2] + boxes[:, 2:]).max(axis=0).tolist()
+            bounds = bounds.united(QRectF(x0, y0, x1 - x0, y1 - y0))
+        self.bounds = bounds.adjusted(-4, -self.textHeight - 2 * self.TEXT_MARGIN - self.LABEL_MARGIN, 4, 4)
+        self.update()
+
+    def boundingRect(self):
+        return self.bounds
+
+    def updateBox(self, rect: QRectF):
+        # Schedules a repaint of one box and its label.
+        self.update(rect.adjusted(-4, -self.textHeight - 2 * self.TEXT_MARGIN - self.LABEL_MARGIN, 4, 4))
+
+    def selectionChanged(self):
+        # The rows selected in the list are read again on the next paint, however often this is called.
+        self.selected = None
+        self.update()
+
+    def glyph(self, label_id) -> QStaticText:
+        # Label text is laid out once per label and reused for every box.
+        glyph = self.labelGlyphs.get(label_id)
+        if glyph is None:
+            glyph = QStaticText(self.store.labels.name(label_id))
+            glyph.prepare(font=self.font)
+            self.labelGlyphs[label_id] = glyph
+        return glyph
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect
+        label_space = self.textHeight + 2 * self.TEXT_MARGIN + self.LABEL_MARGIN
+        rows = self.index.query_rect(exposed.left(), exposed.top(), exposed.right(), exposed.bottom() + label_space)
+        if not len(rows):
+            return
+        boxes = self.store.boxes[rows]
+        color_ids = self.store.color_ids[rows]
+        if self.selected is None:
+            indexes = self.selection.selectedRows() if self.selection is not None else []
+            self.selected = np.array([index.row() for index in indexes], dtype=np.int64)
+        if len(self.selected):
+            selected = np.isin(rows, self.selected)
+            for (x, y, w, h), color_id in zip(boxes[selected].tolist(), color_ids[selected].tolist()):
+                painter.fillRect(QRectF(x, y, w, h), self.fills[color_id])
+        for color_id in np.unique(color_ids).tolist():
+            painter.setPen(self.pens[color_id])
+            painter.drawRects([QRectF(x, y, w, h) for x, y, w, h in boxes[color_ids == color_id].tolist()])
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        if lod * self.textHeight < self.MIN_LABEL_PIXELS:
+            return
+        painter.setFont(self.font)
+        painter.setPen(Qt.white)
+        offset = self.textHeight + self.TEXT_MARGIN + self.LABEL_MARGIN
+        for (x, y, _, _), label_id in zip(boxes.tolist(), self.store.label_ids[rows].tolist()):
+            painter.drawStaticText(QPointF(x + self.TEXT_MARGIN, y - offset), self.glyph(label_id))
+
+    def hitTest(self, pos: QPointF):
+        # Returns (row, handle) of the topmost box under `pos`; handles win over interiors.
+        rows = self.index.query_point(pos.x(), pos.y()).tolist()
+        boxes = self.store.boxes[rows].tolist()
+        inside = None
+        for row, (x, y, w, h) in zip(reversed(rows), reversed(boxes)):
+            handle = resize_handle_at(QRectF(x, y, w, h), pos, ResizableAnnotationRect.HANDLE_SIZE)
+            if handle:
+                return row, handle
+            if inside is None and x <= pos.x() <= x + w and y <= pos.y() <= y + h:
+                inside = row
+        return inside, None
+
+###############################################################################
+#                             ProposalOverlay Class                           #
+###############################################################################
+class ProposalOverlay(QGraphicsItem):
+    # Provisional boxes from a detector, drawn dashed with their label and
+    # score. They are not part of the store until accepted, and the item has
+    # no shape, so clicks go to the annotations underneath.
+    def __init__(self, boxes, labels, scores):
+        super().__init__()
+        self.boxes = boxes
+        self.labels = list(labels)
+        self.rects = [QRectF(x, y, w, h) for x, y, w, h in boxes.tolist()]
+        self.texts = [f"{label} {score:.2f}" for label, score in zip(labels, scores)]
+        self.pen = QPen(QColor(255, 255, 255), 2, Qt.DashLine)
+        self.pen.setCosmetic(True)
+        self.font = QFont()
+        self.font.setPointSize(8)
+        bounds = QRectF()
+        for rect in self.rects:
+            bounds = bounds.united(rect)
+        self.bounds = bounds.adjusted(-4, -QFontMetricsF(self.font).height() - 8, 4, 4)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.setZValue(0.5)
+
+    def boundingRect(self):
+        return self.bounds
+
+    def shape(self):
+        return QPainterPath()
+
+    def paint(self, painter, option, widget=None):
+        painter.setPen(self.pen)
+        painter.drawRects(self.rects)
+        painter.setFont(self.font)
+        for rect, text in zip(self.rects, self.texts):
+            painter.drawText(rect.topLeft() + QPointF(4, -4), text)
+
+###############################################################################
+#                          AnnotationListModel Class                          #
+###############################################################################
+def contiguous_runs(rows) -> list:
+    # Splits sorted row numbers into (first, last) runs of consecutive rows.
+    rows = np.asarray(rows, dtype=np.int64)
+    if not len(rows):
+        return []
+    breaks = np.flatnonzero(np.diff(rows) != 1)
+    firsts = np.concatenate(([rows[0]], rows[breaks + 1]))
+    lasts = np.concatenate((rows[breaks], [rows[-1]]))
+    return list(zip(firsts.tolist(), lasts.tolist()))
+
+
+class AnnotationListModel(QAbstractListModel):
+    # Read-only list model over the rows of an AnnotationStore. Row text and
+    # brushes are produced on demand for the rows a view actually shows, and
+    # edits are announced as row ranges, so the cost of loading, relabeling or
+    # deleting does not depend on how many boxes the list holds.
+    # Deletions spread over more ranges than this are announced as one reset.
+    MAX_REMOVE_RANGES = 64
+
+    def __init__(self, store, palette, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.brushes = [QBrush(color) for color in palette]
+        self.foreground = QBrush(Qt.black)
+        self.lang = "en"
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return self.text(row)
+        if role == Qt.BackgroundRole:
+            return self.brushes[int(self.store.color_ids[row])]
+        if role == Qt.ForegroundRole:
+            return self.foreground
         return None
 
+    def text(self, row) -> str:
+        # Text shown for one annotation in the right-hand list.
+        x, y, w, h = self.store.rect(row)
+        label = self.store.label(row)
+        show_label = label if label else STRINGS[self.lang]["rect_no_label"]
+        return (
+            f"Label: {show_label}  "
+            f"(Center: {x + w/2:.2f}, {y + h/2:.2f}, W: {w:.2f}, H: {h:.2f})"
+        )
+
+    def setStore(self, store):
+        self.beginResetModel()
+        self.store = store
+        self.endResetModel()
+
+    def setLanguage(self, lang):
+        self.lang = lang
+        if len(self.store):
+            self.dataChanged.emit(self.index(0), self.index(len(self.store) - 1), [Qt.DisplayRole])
+
+    def loadNormalized(self, labels, normalized, first_color=0, palette_size=1) -> range:
+        # Appends every box of a sidecar; a bulk load is announced as one reset.
+        self.beginResetModel()
+        try:
+            return self.store.load_normalized(labels, normalized, first_color, palette_size)
+        finally:
+            self.endResetModel()
+
+    def appendBox(self, x, y, w, h, label="", color_id=0) -> int:
+        row = len(self.store)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.store.add(x, y, w, h, label, color_id)
+        self.endInsertRows()
+        return row
+
+    def extendBoxes(self, boxes, labels, color_ids) -> range:
+        first = len(self.store)
+        if not len(labels):
+            return range(first, first)
+        self.beginInsertRows(QModelIndex(), first, first + len(labels) - 1)
+        rows = self.store.extend(boxes, labels, color_ids)
+        self.endInsertRows()
+        return rows
+
+    def rowsChanged(self, rows):
+        # Announces new geometry or labels for the given rows, one signal per run.
+        for first, last in contiguous_runs(sorted(rows)):
+            self.dataChanged.emit(self.index(first), self.index(last), [Qt.DisplayRole])
+
+    def removeBoxes(self, rows):
+        # Removes sorted rows from the store, announcing each run from the bottom up.
+        runs = contiguous_runs(rows)
+        if len(runs) > self.MAX_REMOVE_RANGES:
+            self.beginResetModel()
+            self.store.remove(rows)
+            self.endResetModel()
+            return
+        for first, last in reversed(runs):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.store.remove(range(first, last + 1))
+            self.endRemoveRows()
+
 ###############################################################################
 #                                ImageView Class                              #
 ###############################################################################
 class ImageView(QGraphicsView):
-    # Handles zooming and creating bounding boxes.
+    # Handles zooming and creating bounding boxes. Wheel zoom, drawing and
+    # resizing are applied at most once per frame; while the view moves the
+    # image item paints a fast preview, and a smooth repaint follows once the
+    # view has been still for SETTLE_MS.
+    SETTLE_MS = 150
+    # Continuous motion while a key is held: viewport pixels per second for
+    # panning and zoom factor per second.
+    PAN_SPEED = 1200
+    ZOOM_SPEED = 2.0
+    MOTION_KEYS = {
+        Qt.Key_Left: (-1, 0, 0), Qt.Key_Right: (1, 0, 0), Qt.Key_Up: (0, -1, 0), Qt.Key_Down: (0, 1, 0),
+        Qt.Key_Plus: (0, 0, 1), Qt.Key_Equal: (0, 0, 1), Qt.Key_Minus: (0, 0, -1),
+    }
+    PAN_KEYS = (Qt.Key_Left, Qt.Key_Right, Qt.Key_Up, Qt.Key_Down)
+
     def __init__(self, scene, main_window, parent=None):
         super().__init__(scene, parent)
         self.main_window = main_window
         self.startPos = None
         self.currentRect = None
+        self.pressedAnnotation = None
+        self.pressedRect = None
+        self.resizeRow = None
+        self.resizeHandle = None
+        self.resizeStart = None
+        self.resizeOrig = None
+        self.movePos = None
+        self.pendingZoom = 1.0
+        self.moveThrottle = FrameThrottle(self.applyMouseMove)
+        self.zoomThrottle = FrameThrottle(self.applyZoom)
+        self.settleTimer = QTimer(self)
+        self.settleTimer.setSingleShot(True)
+        self.settleTimer.setInterval(self.SETTLE_MS)
+        self.settleTimer.timeout.connect(self.settle)
+        self.heldKeys = set()
+        self.panRemainder = QPointF()
+        self.motionClock = QElapsedTimer()
+        self.motionTimer = QTimer(self)
+        self.motionTimer.setInterval(FRAME_MS)
+        self.motionTimer.timeout.connect(self.stepKeyMotion)
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
         self.setFocusPolicy(Qt.NoFocus)
 
+    def beginMotion(self):
+        # Switches the image to its fast preview until the view settles.
+        item = self.main_window.imageItem
+        if isinstance(item, (LodPixmapItem, TiledImageItem)):
+            item.setMoving(True)
+        self.settleTimer.start()
+
+    def settle(self):
+        if self.heldKeys:
+            self.settleTimer.start()
+            return
+        item = self.main_window.imageItem
+        if isinstance(item, (LodPixmapItem, TiledImageItem)):
+            item.setMoving(False)
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.beginMotion()
+
+    def startKeyMotion(self, event) -> bool:
+        # Ctrl+arrows pan and +/- zoom for as long as the key is held.
+        # Returns True if the key is one of them.
+        key = event.key()
+        if key not in self.MOTION_KEYS:
+            return False
+        if key in self.PAN_KEYS and not event.modifiers() & Qt.ControlModifier:
+            return False
+        if event.isAutoRepeat():
+            return True
+        self.heldKeys.add(key)
+        if not self.motionTimer.isActive():
+            self.motionClock.start()
+            self.motionTimer.start()
+        self.beginMotion()
+        return True
+
+    def stopKeyMotion(self, event) -> bool:
+        key = event.key()
+        if event.isAutoRepeat() or key not in self.heldKeys:
+            return False
+        self.heldKeys.discard(key)
+        if not self.heldKeys:
+            self.stopMotion()
+        return True
+
+    def stopMotion(self):
+        # Forgets held keys, e.g. when the window loses focus before they are released.
+        self.heldKeys.clear()
+        self.motionTimer.stop()
+        self.panRemainder = QPointF()
+        self.settleTimer.start()
+
+    def stepKeyMotion(self):
+        # One frame of continuous motion; speeds are per second so the result
+        # does not depend on how regularly the timer fires.
+        dt = min(self.motionClock.restart(), 100) / 1000
+        dx = dy = dz = 0
+        for key in self.heldKeys:
+            x, y, z = self.MOTION_KEYS[key]
+            dx, dy, dz = dx + x, dy + y, dz + z
+        if dz:
+            self.zoomBy(self.ZOOM_SPEED ** (dz * dt), QGraphicsView.AnchorViewCenter)
+        if dx or dy:
+            self.panRemainder += QPointF(dx, dy) * (self.PAN_SPEED * dt)
+            step_x, step_y = int(self.panRemainder.x()), int(self.panRemainder.y())
+            self.panRemainder -= QPointF(step_x, step_y)
+            self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() + step_x)
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() + step_y)
+        self.beginMotion()
+
+    def zoomBy(self, factor, anchor=None):
+        if anchor is not None:
+            previous = self.transformationAnchor()
+            self.setTransformationAnchor(anchor)
+            self.scale(factor, factor)
+            self.setTransformationAnchor(previous)
+        else:
+            self.scale(factor, factor)
+        self.beginMotion()
+
+    def annotationAt(self, view_pos):
+        # Returns the annotation item under a viewport position (item rendering only).
+        item = self.itemAt(view_pos)
+        if item and isinstance(item.parentItem(), ResizableAnnotationRect):
+            item = item.parentItem()
+        return item if isinstance(item, ResizableAnnotationRect) else None
+
     def mousePressEvent(self, event):
-        clicked_item = self.itemAt(event.pos())
-        if clicked_item and isinstance(clicked_item, ResizableAnnotationRect):
+        overlay = self.main_window.overlay
+        if overlay is not None:
+            scenePos = self.mapToScene(event.pos())
+            row, handle = overlay.hitTest(scenePos)
+            if row is not None:
+                if handle and event.button() == Qt.LeftButton:
+                    self.resizeRow = row
+                    self.resizeHandle = handle
+                    self.resizeStart = scenePos
+                    self.resizeOrig = QRectF(*self.main_window.store.rect(row))
+                else:
+                    self.main_window.selectAnnotation(row)
+                event.accept()
+                return
+        clicked_item = self.annotationAt(event.pos())
+        if clicked_item:
+            self.pressedAnnotation = clicked_item
+            self.pressedRect = QRectF(clicked_item.rect())
+            if not clicked_item.getResizeHandle(clicked_item.mapFromScene(self.mapToScene(event.pos()))):
+                self.main_window.selectAnnotation(self.main_window.annotations.index(clicked_item))
             super().mousePressEvent(event)
             return
         if event.button() == Qt.LeftButton:
@@ -212,49 +916,601 @@ class ImageView(QGraphicsView):
             self.scene().addItem(self.currentRect)
         super().mousePressEvent(event)
 
+    @timed("view.mouseMove")
     def mouseMoveEvent(self, event):
+        if self.resizeRow is not None:
+            self.movePos = event.pos()
+            self.moveThrottle.request()
+            event.accept()
+            return
         if self.currentRect and self.startPos:
-            currentPos = self.mapToScene(event.pos())
-            rect = QRectF(self.startPos, currentPos).normalized()
-            self.currentRect.setRect(rect)
+            self.movePos = event.pos()
+            self.moveThrottle.request()
+        elif not event.buttons():
+            self.updateHoverCursor(event.pos())
         super().mouseMoveEvent(event)
 
+    def cancelInteraction(self):
+        # Forgets a box being drawn or resized; called before the scene is cleared.
+        self.moveThrottle.cancel()
+        if self.pressedAnnotation is not None:
+            self.pressedAnnotation.cancelResize()
+        self.startPos = self.currentRect = None
+        self.pressedAnnotation = self.pressedRect = None
+        self.resizeRow = self.resizeHandle = self.resizeStart = self.resizeOrig = None
+
+    def applyMouseMove(self):
+        # Applies the latest pointer position to the box being resized or drawn.
+        if self.resizeRow is not None:
+            store = self.main_window.store
+            old = QRectF(*store.rect(self.resizeRow))
+            r = resized_rect(self.resizeOrig, self.resizeHandle, self.mapToScene(self.movePos) - self.resizeStart)
+            store.set_rect(self.resizeRow, r.x(), r.y(), r.width(), r.height())
+            self.main_window.overlay.updateBox(old.united(r))
+        elif self.currentRect and self.startPos:
+            self.currentRect.setRect(QRectF(self.startPos, self.mapToScene(self.movePos)).normalized())
+
+    def updateHoverCursor(self, view_pos):
+        # Shows a resize cursor while hovering over an edge or corner.
+        scenePos = self.mapToScene(view_pos)
+        overlay = self.main_window.overlay
+        if overlay is not None:
+            _, handle = overlay.hitTest(scenePos)
+        else:
+            annotation = self.annotationAt(view_pos)
+            handle = annotation.getResizeHandle(annotation.mapFromScene(scenePos)) if annotation else None
+        if handle:
+            self.viewport().setCursor(HANDLE_CURSORS[handle])
+        else:
+            self.viewport().unsetCursor()
+
     def mouseReleaseEvent(self, event):
+        self.moveThrottle.flush()
+        if self.resizeRow is not None:
+            r = QRectF(*self.main_window.store.rect(self.resizeRow))
+            if r != self.resizeOrig:
+                self.main_window.annotationResized(self.resizeRow, r)
+            self.resizeRow = None
+            self.resizeHandle = None
+            self.resizeStart = None
+            self.resizeOrig = None
+            event.accept()
+            return
         if event.button() == Qt.LeftButton and self.currentRect:
             r = self.currentRect.rect()
             if r.width() < 5 or r.height() < 5:
                 self.scene().removeItem(self.currentRect)
             else:
                 if self.main_window.last_label:
-                    self.currentRect.label = self.main_window.last_label
-                    self.currentRect.textItem.setPlainText(self.main_window.last_label)
-                    self.currentRect.updateLabelPosition()
-            self.main_window.addAnnotation(self.currentRect)
+                    self.currentRect.setLabel(self.main_window.last_label)
+                self.main_window.addAnnotation(self.currentRect)
             self.currentRect = None
             self.startPos = None
         super().mouseReleaseEvent(event)
+        if self.pressedAnnotation is not None:
+            if self.pressedAnnotation.rect() != self.pressedRect:
+                row = self.main_window.annotations.index(self.pressedAnnotation)
+                self.main_window.annotationResized(row, self.pressedAnnotation.rect())
+            self.pressedAnnotation = None
+            self.pressedRect = None
 
+    @timed("view.wheel")
     def wheelEvent(self, event):
         modifiers = event.modifiers()
         if modifiers & Qt.ControlModifier or modifiers & Qt.ShiftModifier:
             angle = event.angleDelta().y()
-            factor = 1.15 if angle > 0 else 0.85
-            self.scale(factor, factor)
+            self.pendingZoom *= 1.15 if angle > 0 else 0.85
+            self.zoomThrottle.request()
             event.accept()
         else:
             super().wheelEvent(event)
 
+    def applyZoom(self):
+        # Applies the wheel ticks received since the last frame as one scale.
+        factor, self.pendingZoom = self.pendingZoom, 1.0
+        if factor != 1.0:
+            self.zoomBy(factor)
+
+###############################################################################
+#                             TelemetryPanel Class                            #
+###############################################################################
+class TelemetryPanel(QDialog):
+    # Debug panel listing latency histograms and counters; refreshed every second while visible.
+    COLUMNS = ["Name", "Count", "Mean ms", "p50 ms", "p95 ms", "p99 ms", "Max ms", "Total ms"]
+    KEYS = ["count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "total_ms"]
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        layout = QVBoxLayout(self)
+        self.enabledBox = QCheckBox()
+        self.enabledBox.setChecked(TELEMETRY.enabled)
+        self.enabledBox.toggled.connect(main_window.setTelemetryEnabled)
+        layout.addWidget(self.enabledBox)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+        buttons = QHBoxLayout()
+        self.btnSaveJson = QPushButton()
+        self.btnSaveJson.clicked.connect(lambda: self.save(TELEMETRY.write_json, "telemetry.json"))
+        buttons.addWidget(self.btnSaveJson)
+        self.btnSaveTrace = QPushButton()
+        self.btnSaveTrace.clicked.connect(lambda: self.save(TELEMETRY.write_chrome_trace, "trace.json"))
+        buttons.addWidget(self.btnSaveTrace)
+        self.btnReset = QPushButton()
+        self.btnReset.clicked.connect(self.reset)
+        buttons.addWidget(self.btnReset)
+        layout.addLayout(buttons)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.set_language(main_window.current_lang)
+        self.resize(720, 420)
+
+    def set_language(self, lang):
+        self.setWindowTitle(STRINGS[lang]["telemetry_title"])
+        self.enabledBox.setText(STRINGS[lang]["telemetry_enabled"])
+        self.btnSaveJson.setText(STRINGS[lang]["telemetry_save_json"])
+        self.btnSaveTrace.setText(STRINGS[lang]["telemetry_save_trace"])
+        self.btnReset.setText(STRINGS[lang]["telemetry_reset"])
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        snapshot = TELEMETRY.snapshot()
+        rows = [(name, summary) for name, summary in snapshot["histograms"].items()]
+        rows += [(name, {"count": n}) for name, n in snapshot["counters"].items()]
+        self.table.setRowCount(len(rows))
+        for row, (name, summary) in enumerate(rows):
+            self.table.setItem(row, 0, QTableWidgetItem(name))
+            for column, key in enumerate(self.KEYS, start=1):
+                value = summary.get(key)
+                text = "" if value is None else str(value) if key == "count" else f"{value:.3f}"
+                item = QTableWidgetItem(text)
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def reset(self):
+        TELEMETRY.reset()
+        self.refresh()
+        self.main_window.updateTelemetryStatus()
+
+    def save(self, write, default_name):
+        path, _ = QFileDialog.getSaveFileName(self, self.windowTitle(), default_name, "JSON (*.json)")
+        if path:
+            write(path)
+
+###############################################################################
+#                            DatasetScanner Class                             #
+###############################################################################
+class DatasetScanner(QObject):
+    # Lists a dataset folder on a background thread and hands the GUI thread
+    # one chunk of sorted images (with their has-sidecar flags) at a time.
+    chunkFound = pyqtSignal(str, list, list)
+    finished = pyqtSignal()
+
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dataset-scan", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self):
+        for directory, names, annotated in scan_dataset(self.root):
+            if self._cancelled.is_set():
+                return
+            self.chunkFound.emit(directory, names, annotated)
+        self.finished.emit()
+
+###############################################################################
+#                            DatasetIndexer Class                             #
+###############################################################################
+class DatasetIndexer(QObject):
+    # Keeps the label index of the open dataset current on a background thread:
+    # a full sync once the image list is known, then every image that is saved.
+    changed = pyqtSignal()
+
+    def __init__(self, index, pending, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.pending = pending
+        self._cond = threading.Condition()
+        self._sync = None
+        self._saved = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="dataset-index", daemon=True)
+        self._thread.start()
+
+    def sync(self, image_list, prune=False):
+        # Checks every sidecar of `image_list`; with `prune`, forgets images that are gone.
+        with self._cond:
+            self._sync = (image_list, prune)
+            self._cond.notify()
+
+    def imageSaved(self, image_path):
+        with self._cond:
+            self._saved[image_path] = None
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.index.close()
+
+    def _takeSaved(self) -> list:
+        saved = list(self._saved)
+        self._saved.clear()
+        return saved
+
+    def _interrupted(self) -> bool:
+        # Polled between sync batches: saved images are indexed right away,
+        # and a sync stops when the window closes or a newer sync is queued.
+        with self._cond:
+            saved = self._takeSaved()
+            stop = self._closed or self._sync is not None
+        if saved:
+            self.index.refresh(saved, self.pending)
+            self.changed.emit()
+        return stop
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._closed or self._sync or self._saved):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                saved = self._takeSaved()
+                job, self._sync = self._sync, None
+            try:
+                if saved:
+                    self.index.refresh(saved, self.pending)
+                if job is not None:
+                    image_list, prune = job
+                    self.index.sync(image_list, prune, self._interrupted, self.pending)
+            except sqlite3.Error as e:
+                print(f"Dataset index: {e}", file=sys.stderr)
+            self.changed.emit()
+
+###############################################################################
+#                            DuplicateHasher Class                            #
+###############################################################################
+class DuplicateHasher(QObject):
+    # Computes the perceptual hash of every image of the open dataset on a
+    # background thread: cached hashes are read first, the rest are decoded
+    # by worker processes. Results reach the GUI thread in chunks of
+    # (row, phash) pairs; unreadable images are left out.
+    hashesReady = pyqtSignal(list)
+    CHUNK = 512
+
+    def __init__(self, image_list, cache, workers=None, parent=None):
+        super().__init__(parent)
+        self.image_list = image_list
+        self.cache = cache
+        self.workers = workers or max(1, min(2, (os.cpu_count() or 2) - 1))
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, name="duplicate-hasher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        # Asks the thread to stop without waiting for it; a running thread
+        # closes the cache itself once it notices.
+        self._cancelled = True
+        if self._thread.ident is None:
+            self.cache.close()
+
+    def _run(self):
+        chunk = []
+        try:
+            for row, phash, _ in hash_dataset(self.image_list, self.cache, self.workers, lambda: self._cancelled):
+                if phash is not None:
+                    chunk.append((row, phash))
+                if len(chunk) >= self.CHUNK and not self._cancelled:
+                    self.hashesReady.emit(chunk)
+                    chunk = []
+        except (OSError, RuntimeError, sqlite3.Error) as e:
+            print(f"Duplicate detection stopped: {e}", file=sys.stderr)
+        finally:
+            self.cache.close()
+        if chunk and not self._cancelled:
+            self.hashesReady.emit(chunk)
+
+###############################################################################
+#                              IndexPanel Class                               #
+###############################################################################
+class BarDelegate(QStyledItemDelegate):
+    # Draws a numeric cell as a horizontal bar scaled to the column maximum.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.maximum = 1
+
+    def paint(self, painter, option, index):
+        value = index.data(Qt.UserRole) or 0
+        bar = QRectF(option.rect).adjusted(2, 3, -2, -3)
+        bar.setWidth(bar.width() * value / max(self.maximum, 1))
+        painter.fillRect(bar, QColor(0, 130, 200, 90))
+        super().paint(painter, option, index)
+
+
+class IndexPanel(QDialog):
+    # Label histogram of the whole dataset from the index; selecting a label
+    # lists the images containing it, in image order, for navigation.
+    COLUMNS = ["Label", "Boxes", "Images", "Mean W", "Mean H"]
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.label = None
+        self.match_rows = []
+        layout = QVBoxLayout(self)
+        self.summaryLabel = QLabel()
+        layout.addWidget(self.summaryLabel)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setSelectionMode(QTableWidget.SingleSelection)
+        self.barDelegate = BarDelegate(self.table)
+        self.table.setItemDelegateForColumn(1, self.barDelegate)
+        self.table.itemSelectionChanged.connect(self.labelSelected)
+        layout.addWidget(self.table, 2)
+        self.matchesLabel = QLabel()
+        layout.addWidget(self.matchesLabel)
+        self.matchesModel = QStringListModel(self)
+        self.matchesView = QListView()
+        self.matchesView.setModel(self.matchesModel)
+        self.matchesView.setUniformItemSizes(True)
+        self.matchesView.setEditTriggers(QListView.NoEditTriggers)
+        self.matchesView.activated.connect(lambda index: self.main_window.jumpToRow(self.match_rows[index.row()]))
+        layout.addWidget(self.matchesView, 1)
+        buttons = QHBoxLayout()
+        self.btnPrevious = QPushButton()
+        self.btnPrevious.clicked.connect(lambda: self.step(-1))
+        buttons.addWidget(self.btnPrevious)
+        self.btnNext = QPushButton()
+        self.btnNext.clicked.connect(lambda: self.step(1))
+        buttons.addWidget(self.btnNext)
+        layout.addLayout(buttons)
+        # Index updates arrive in bursts while a dataset is synced; redraw at most twice a second.
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setSingleShot(True)
+        self.refreshTimer.setInterval(500)
+        self.refreshTimer.timeout.connect(self.refresh)
+        self.set_language(main_window.current_lang)
+        self.resize(520, 560)
+
+    def set_language(self, lang):
+        self.setWindowTitle(STRINGS[lang]["index_title"])
+        self.btnPrevious.setText(STRINGS[lang]["index_previous"])
+        self.btnNext.setText(STRINGS[lang]["index_next"])
+        if self.isVisible():
+            self.refresh()
+
+    def showEvent(self, event):
+        self.refresh()
+        super().showEvent(event)
+
+    def indexChanged(self):
+        if self.isVisible() and not self.refreshTimer.isActive():
+            self.refreshTimer.start()
+
+    def refresh(self):
+        strings = STRINGS[self.main_window.current_lang]
+        indexer = self.main_window.indexer
+        if indexer is None:
+            self.summaryLabel.setText("")
+            self.table.setRowCount(0)
+            self.setMatches(None, [])
+            return
+        self.summaryLabel.setText(strings["index_summary"].format(**indexer.index.summary()))
+        stats = indexer.index.label_stats()
+        self.barDelegate.maximum = max((boxes for _, boxes, _, _, _ in stats), default=1)
+        self.table.blockSignals(True)
+        self.table.setRowCount(len(stats))
+        selected_row = None
+        for row, (label, boxes, images, mean_w, mean_h) in enumerate(stats):
+            if label == self.label:
+                selected_row = row
+            self.table.setItem(row, 0, QTableWidgetItem(label or strings["rect_no_label"]))
+            self.table.item(row, 0).setData(Qt.UserRole, label)
+            for column, value in enumerate((boxes, images), start=1):
+                item = QTableWidgetItem(str(value))
+                item.setData(Qt.UserRole, value)
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+            for column, value in enumerate((mean_w, mean_h), start=3):
+                item = QTableWidgetItem(f"{value:.3f}")
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+        if selected_row is not None:
+            self.table.selectRow(selected_row)
+        self.table.blockSignals(False)
+        if self.label is not None:
+            self.setMatches(self.label, indexer.index.images_with_label(self.label))
+
+    def labelSelected(self):
+        items = self.table.selectedItems()
+        indexer = self.main_window.indexer
+        if not items or indexer is None:
+            return
+        label = self.table.item(items[0].row(), 0).data(Qt.UserRole)
+        self.setMatches(label, indexer.index.images_with_label(label))
+
+    def setMatches(self, label, matches):
+        # Lists the matching images in the order of the open image list.
+        self.label = label
+        counts = dict(matches)
+        image_list = self.main_window.image_list
+        root = dataset_key(image_list) if image_list else ""
+        self.match_rows = [row for row, path in enumerate(image_list) if path in counts]
+        self.matchesModel.setStringList([
+            f"{os.path.relpath(image_list[row], root)}  ({counts[image_list[row]]})" for row in self.match_rows
+        ])
+        if label is None:
+            self.matchesLabel.setText("")
+        else:
+            strings = STRINGS[self.main_window.current_lang]
+            self.matchesLabel.setText(strings["index_matches"].format(
+                count=len(self.match_rows), label=label or strings["rect_no_label"]))
+
+    def step(self, direction):
+        # Opens the next (or previous) matching image after the current one, wrapping around.
+        if not self.match_rows:
+            return
+        current = self.main_window.current_index
+        if direction > 0:
+            position = bisect.bisect_right(self.match_rows, current) % len(self.match_rows)
+        else:
+            position = (bisect.bisect_left(self.match_rows, current) - 1) % len(self.match_rows)
+        self.matchesView.setCurrentIndex(self.matchesModel.index(position))
+        self.main_window.jumpToRow(self.match_rows[position])
+
+###############################################################################
+#                              BoxPropagator Class                            #
+###############################################################################
+def gray_frame(image, max_side):
+    # Grayscale copy of a QImage as a uint8 array whose longer side is at most
+    # `max_side`; returns (array, scale from image pixels to array pixels).
+    if image.isNull():
+        return np.zeros((0, 0), np.uint8), 1.0
+    scale = min(1.0, max_side / max(image.width(), image.height()))
+    if scale < 1:
+        image = image.scaled(round(image.width() * scale), round(image.height() * scale),
+                             Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    gray = image.convertToFormat(QImage.Format_Grayscale8)
+    bits = gray.constBits()
+    bits.setsize(gray.sizeInBytes())
+    rows = np.frombuffer(bits, np.uint8).reshape(gray.height(), gray.bytesPerLine())
+    return rows[:, :gray.width()].copy(), scale
+
+
+class BoxPropagator(QObject):
+    # Tracks the boxes of one image into the next on a background thread, so
+    # the boxes for the next frame are ready before it is opened. Only the
+    # latest request is kept; it is identified by a key that changes whenever
+    # the source boxes are edited. Finished requests are emitted as
+    # tracked(key, boxes, labels) on the GUI thread.
+    FRAME_SIZE = 1280
+    tracked = pyqtSignal(object, object, object)
+
+    def __init__(self, image_cache, parent=None):
+        super().__init__(parent)
+        self.image_cache = image_cache
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="propagation")
+        self._key = None
+        self._future = None
+        self._wanted = None
+        self._closed = False
+
+    def request(self, key, source, target, boxes, labels):
+        if key == self._key:
+            return
+        if self._future is not None and self._key != self._wanted:
+            self._future.cancel()
+        self._key = key
+        self._future = self._executor.submit(self._propagate, source, target, np.array(boxes), list(labels))
+        self._future.add_done_callback(lambda future, key=key: self._finished(future, key))
+
+    def deliver(self, key, source, target, boxes, labels):
+        # Emits `tracked` for `key` once its boxes are ready; right away if a
+        # background request already computed them. Never waits.
+        self._wanted = key
+        if key != self._key or self._future.cancelled():
+            self._key = None
+            self.request(key, source, target, boxes, labels)
+        elif self._future.done():
+            self._finished(self._future, key)
+
+    def _finished(self, future, key):
+        # Runs on the propagation thread, or on the GUI thread from deliver().
+        if self._closed or future.cancelled():
+            return
+        try:
+            boxes, labels = future.result()
+        except Exception as e:
+            print(f"Could not propagate boxes into {key[1]}: {e}", file=sys.stderr)
+            return
+        self.tracked.emit(key, boxes, labels)
+
+    def loadFrame(self, path):
+        if needs_tiling(path):
+            reader = QImageReader(path)
+            size = reader.size()
+            scale = min(1.0, self.FRAME_SIZE / max(size.width(), size.height(), 1))
+            reader.setScaledSize(QSize(round(size.width() * scale), round(size.height() * scale)))
+            return gray_frame(reader.read(), self.FRAME_SIZE)[0], scale, (size.width(), size.height())
+        image = self.image_cache.get(path)
+        frame, scale = gray_frame(image, self.FRAME_SIZE)
+        return frame, scale, (image.width(), image.height())
+
+    def _propagate(self, source, target, boxes, labels):
+        with TELEMETRY.span("propagation.track"):
+            previous, scale, previous_size = self.loadFrame(source)
+            current, _, current_size = self.loadFrame(target)
+            if previous_size != current_size or not previous.size or not current.size:
+                # Not frames of one sequence: copy the boxes as they are.
+                return boxes, labels
+            moved, _ = propagate_boxes(previous, current, boxes * scale)
+            return moved / scale, labels
+
+    def shutdown(self):
+        self._closed = True
+        if self._future is not None:
+            self._future.cancel()
+        self._executor.shutdown(wait=False)
+
 ###############################################################################
 #                              ImageViewer Class                              #
 ###############################################################################
 class ImageViewer(QMainWindow):
     # Main window: loads images, manages bounding boxes, and supports multilingual UI.
+    # Images with at least BATCHED_RENDER_THRESHOLD boxes are drawn by one AnnotationOverlay.
+    BATCHED_RENDER_THRESHOLD = 500
+    # Histograms summarized in the status bar while telemetry is enabled.
+    STATUS_METRICS = [
+        ("load", "viewer.loadCurrentImage"), ("decode", "image.decode"),
+        ("move", "view.mouseMove"), ("wheel", "view.wheel"), ("write", "annotations.write")
+    ]
+    # Emitted from the sync thread when the server refused edits of an image.
+    syncConflict = pyqtSignal(str)
+    # Emitted from the writer thread with the error of a failed save, or "" once saves work again.
+    saveError = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
         self.image_list = []
         self.current_index = 0
         self.annotations = []
-        self.currentTxtFile = None
+        self.overlay = None
+        self.imageItem = None
+        self.labels = LabelTable()
+        self.store = AnnotationStore(labels=self.labels)
+        self.currentSidecar = None
+        # New sidecars are TXT unless ANNOTATION_TOOL_SIDECAR=box; existing ones keep their format.
+        self.new_sidecar_extension = BINARY_EXTENSION if os.environ.get(SIDECAR_FORMAT_VAR) == "box" else TXT_EXTENSION
         self.languages = ["en", "es", "de", "fr", "pt", "ru"]
         self.current_lang = "en"
         self.color_palette = [
@@ -267,30 +1523,129 @@ class ImageViewer(QMainWindow):
         self.last_label = ""
         self.image_width = 1
         self.image_height = 1
+        self.image_cache = ImageCache()
+        self.propagator = BoxPropagator(self.image_cache, self)
+        self.propagator.tracked.connect(self.propagationReady)
+        # (key, automatic) of the propagation the current image is waiting for.
+        self.pending_propagation = None
+        # Bumped on every edit; identifies the boxes a propagation was computed from.
+        self.annotation_version = 0
+        self.loaded_image = None
+        self.previous_frame = None
+        self.annotation_writer = AnnotationWriter(on_error=lambda e: self.saveError.emit("" if e is None else str(e)))
+        self.save_error = ""
         self.scene = QGraphicsScene()
         self.setFocusPolicy(Qt.StrongFocus)
         self.centralWidget = QWidget()
         self.setCentralWidget(self.centralWidget)
         self.mainLayout = QHBoxLayout(self.centralWidget)
         self.leftLayout = QVBoxLayout()
+        self.topLayout = QHBoxLayout()
         self.btnOpenImage = QPushButton()
         self.btnOpenImage.clicked.connect(self.openImages)
-        self.leftLayout.addWidget(self.btnOpenImage)
+        self.topLayout.addWidget(self.btnOpenImage)
+        self.btnOpenFolder = QPushButton()
+        self.btnOpenFolder.clicked.connect(self.openFolder)
+        self.topLayout.addWidget(self.btnOpenFolder)
+        self.btnNextUnannotated = QPushButton()
+        self.btnNextUnannotated.clicked.connect(self.nextUnannotated)
+        self.topLayout.addWidget(self.btnNextUnannotated)
+        self.chkUnannotatedOnly = QCheckBox()
+        self.chkUnannotatedOnly.toggled.connect(self.setUnannotatedOnly)
+        self.topLayout.addWidget(self.chkUnannotatedOnly)
+        self.btnPropagate = QPushButton()
+        self.btnPropagate.clicked.connect(self.propagatePrevious)
+        self.topLayout.addWidget(self.btnPropagate)
+        self.chkAutoPropagate = QCheckBox()
+        self.chkAutoPropagate.toggled.connect(lambda enabled: self.schedulePropagation())
+        self.topLayout.addWidget(self.chkAutoPropagate)
+        self.btnIndexPanel = QPushButton()
+        self.btnIndexPanel.clicked.connect(self.showIndexPanel)
+        self.topLayout.addWidget(self.btnIndexPanel)
+        self.leftLayout.addLayout(self.topLayout)
+        self.scanner = None
+        self.rescanner = None
+        self.session = None
+        self.indexer = None
+        self.indexPanel = None
         self.imageView = ImageView(self.scene, self)
         self.leftLayout.addWidget(self.imageView)
+        self.filmstripModel = FilmstripModel(
+            lambda count: STRINGS[self.current_lang]["filmstrip_count"].format(count=count), self
+        )
+        self.filmstripFilter = UnannotatedFilter(self)
+        self.filmstripFilter.setSourceModel(self.filmstripModel)
+        self.filmstrip = FilmstripView()
+        self.filmstrip.setModel(self.filmstripFilter)
+        self.filmstrip.setFocusPolicy(Qt.NoFocus)
+        self.filmstrip.clicked.connect(self.jumpToImage)
+        self.leftLayout.addWidget(self.filmstrip)
         self.mainLayout.addLayout(self.leftLayout, 3)
         self.rightLayout = QVBoxLayout()
-        self.listWidget = QListWidget()
-        self.listWidget.setSelectionMode(QListWidget.ExtendedSelection)
-        self.listWidget.itemDoubleClicked.connect(self.editAnnotationLabel)
-        self.rightLayout.addWidget(self.listWidget)
+        self.listModel = AnnotationListModel(self.store, self.color_palette, self)
+        self.listView = QListView()
+        self.listView.setModel(self.listModel)
+        self.listView.setUniformItemSizes(True)
+        self.listView.setSelectionMode(QListView.ExtendedSelection)
+        self.listView.setEditTriggers(QListView.NoEditTriggers)
+        self.listView.doubleClicked.connect(self.editAnnotationLabel)
+        self.listView.selectionModel().selectionChanged.connect(self.annotationSelectionChanged)
+        self.rightLayout.addWidget(self.listView)
         self.btnAssignLabel = QPushButton()
         self.btnAssignLabel.clicked.connect(self.assignLabelToSelected)
         self.rightLayout.addWidget(self.btnAssignLabel)
         self.btnDeleteAnnotation = QPushButton()
         self.btnDeleteAnnotation.clicked.connect(self.deleteAnnotation)
         self.rightLayout.addWidget(self.btnDeleteAnnotation)
+        self.btnDetector = QPushButton()
+        self.btnDetector.clicked.connect(self.chooseDetector)
+        self.rightLayout.addWidget(self.btnDetector)
+        self.btnAcceptProposals = QPushButton()
+        self.btnAcceptProposals.clicked.connect(self.acceptProposals)
+        self.rightLayout.addWidget(self.btnAcceptProposals)
+        self.btnRejectProposals = QPushButton()
+        self.btnRejectProposals.clicked.connect(self.rejectProposals)
+        self.rightLayout.addWidget(self.btnRejectProposals)
+        self.detectorErrorLabel = QLabel()
+        self.detectorErrorLabel.setWordWrap(True)
+        self.detectorErrorLabel.hide()
+        self.rightLayout.addWidget(self.detectorErrorLabel)
+        self.detector_error = ""
+        self.proposalOverlay = None
+        self.preannotator = None
+        self.setPreAnnotator(PreAnnotator.from_environment(self))
+        self.duplicateLabel = QLabel()
+        self.duplicateLabel.setWordWrap(True)
+        self.duplicateLabel.hide()
+        self.rightLayout.addWidget(self.duplicateLabel)
+        self.btnCopyDuplicate = QPushButton()
+        self.btnCopyDuplicate.clicked.connect(self.copyDuplicateBoxes)
+        self.btnCopyDuplicate.setEnabled(False)
+        self.rightLayout.addWidget(self.btnCopyDuplicate)
+        self.leaseLabel = QLabel()
+        self.leaseLabel.setWordWrap(True)
+        self.leaseLabel.hide()
+        self.rightLayout.addWidget(self.leaseLabel)
+        self.sync = None
+        self.lease_owner = None
+        # Queued even from the GUI thread: a reload must not run inside a sync call.
+        self.syncConflict.connect(self.sharedConflict, Qt.QueuedConnection)
+        self.saveErrorLabel = QLabel()
+        self.saveErrorLabel.setWordWrap(True)
+        self.saveErrorLabel.hide()
+        self.rightLayout.addWidget(self.saveErrorLabel)
+        self.saveError.connect(self.setSaveError)
+        self.hasher = None
+        self.duplicate_index = HashIndex()
+        self.duplicate_source = None
         self.mainLayout.addLayout(self.rightLayout, 1)
+        self.telemetryPanel = None
+        self.telemetryLabel = QLabel()
+        self.statusBar().addPermanentWidget(self.telemetryLabel)
+        self.telemetryTimer = QTimer(self)
+        self.telemetryTimer.setInterval(1000)
+        self.telemetryTimer.timeout.connect(self.updateTelemetryStatus)
+        self.setTelemetryEnabled(TELEMETRY.enabled)
         self.set_language("en")
         self.setGeometry(100, 100, 1200, 600)
         self.show()
@@ -302,8 +1657,28 @@ class ImageViewer(QMainWindow):
         self.current_lang = lang
         self.setWindowTitle(STRINGS[lang]["window_title"])
         self.btnOpenImage.setText(STRINGS[lang]["open_images"])
+        self.btnOpenFolder.setText(STRINGS[lang]["open_folder"])
+        self.btnNextUnannotated.setText(STRINGS[lang]["next_unannotated"])
+        self.chkUnannotatedOnly.setText(STRINGS[lang]["unannotated_only"])
+        self.btnIndexPanel.setText(STRINGS[lang]["index_title"])
+        self.btnPropagate.setText(STRINGS[lang]["propagate"])
+        self.chkAutoPropagate.setText(STRINGS[lang]["auto_propagate"])
         self.btnAssignLabel.setText(STRINGS[lang]["assign_label"])
         self.btnDeleteAnnotation.setText(STRINGS[lang]["delete_annotation"])
+        self.btnDetector.setText(STRINGS[lang]["detector"])
+        self.btnAcceptProposals.setText(STRINGS[lang]["accept_proposals"])
+        self.btnRejectProposals.setText(STRINGS[lang]["reject_proposals"])
+        self.btnCopyDuplicate.setText(STRINGS[lang]["copy_duplicate"])
+        self.updateDuplicateOffer()
+        self.updateLeaseLabel()
+        self.updateSaveErrorLabel()
+        self.updateDetectorErrorLabel()
+        self.listModel.setLanguage(lang)
+        self.filmstrip.viewport().update()
+        if self.telemetryPanel is not None:
+            self.telemetryPanel.set_language(lang)
+        if self.indexPanel is not None:
+            self.indexPanel.set_language(lang)
 
     def get_next_color(self) -> QColor:
         # Returns the next color in the palette, cycling through 10 colors.
@@ -316,41 +1691,695 @@ class ImageViewer(QMainWindow):
         open_title = STRINGS[self.current_lang]["open_images"]
         files, _ = QFileDialog.getOpenFileNames(self, open_title, "", "Images (*.png *.jpg *.jpeg *.bmp)")
         if files:
-            self.image_list = files
+            self.stopScan()
+            self.closeSession()
+            self.image_list = ImageList.from_paths(files)
             self.current_index = 0
+            self.openSession(folder=False)
+            self.openIndex()
+            self.openSync()
+            if self.indexer is not None:
+                self.indexer.sync(self.image_list)
+            self.startHashing()
+            self.loadCurrentImage()
+
+    def openFolder(self, folder=None):
+        # Opens every image under a folder. The folder is listed in the background and
+        # the first image is shown as soon as the first directory has been read.
+        if not folder:
+            folder = QFileDialog.getExistingDirectory(self, STRINGS[self.current_lang]["open_folder"])
+            if not folder:
+                return
+        self.stopScan()
+        self.closeSession()
+        session = Session.load(session_filename(ImageList(folder)))
+        if session is not None:
+            # Pick up where the last session stopped right away; a background
+            # rescan then brings in images added or removed since, and lists
+            # the rest of the folder if the tool was closed mid-listing.
+            self.restoreSession(session)
+            self.rescan_list = ImageList(folder)
+            self.rescanner = DatasetScanner(folder, self)
+            self.rescanner.chunkFound.connect(self.rescanFound)
+            self.rescanner.finished.connect(self.rescanFinished)
+            self.rescanner.start()
+            return
+        self.image_list = ImageList(folder)
+        self.current_index = 0
+        self.filmstripModel.setImages(self.image_list)
+        self.openSession()
+        self.openIndex()
+        self.openSync()
+        self.stopHashing()
+        self.scanner = DatasetScanner(folder, self)
+        self.scanner.chunkFound.connect(self.imagesFound)
+        self.scanner.finished.connect(self.scanFinished)
+        self.scanner.start()
+
+    def stopScan(self):
+        if self.scanner is not None:
+            self.scanner.cancel()
+            self.scanner.deleteLater()
+            self.scanner = None
+        if self.rescanner is not None:
+            self.rescanner.cancel()
+            self.rescanner.deleteLater()
+            self.rescanner = None
+            self.rescan_list = None
+
+    def imagesFound(self, directory, names, annotated):
+        # Appends a chunk of scanned images; loads the first image of the dataset.
+        if self.sender() is not self.scanner:
+            # Queued before the scan was replaced or cancelled.
+            return
+        first = len(self.image_list)
+        self.filmstripModel.extendImages(directory, names, annotated)
+        if self.sessionActive():
+            self.session.add_chunks()
+        if first == 0:
             self.loadCurrentImage()
+        else:
+            self.updateWindowTitle()
+
+    def scanFinished(self):
+        # The whole folder is listed: index it, dropping images deleted since the last
+        # session, and look for near-duplicates.
+        if self.sender() is not self.scanner:
+            return
+        if self.sessionActive():
+            self.session.mark_complete()
+        if self.indexer is not None:
+            self.indexer.sync(self.image_list, prune=True)
+        self.startHashing()
+
+    def rescanFound(self, directory, names, annotated):
+        if self.sender() is not self.rescanner:
+            return
+        self.rescan_list.extend(directory, names, annotated)
+        # A session closed before its folder was fully listed: images past the
+        # recorded ones are shown and recorded as they are found.
+        if (self.sessionActive() and not self.session.complete
+                and self.rescan_list.chunk_count() > self.image_list.chunk_count()):
+            first = len(self.image_list)
+            self.filmstripModel.extendImages(directory, names, annotated)
+            self.session.add_chunks()
+            if first == 0:
+                self.loadCurrentImage()
+            else:
+                self.updateWindowTitle()
+
+    def rescanFinished(self):
+        # Reconciles a restored folder session with a fresh listing. Statuses and
+        # the current image follow their paths; the image on screen is not reloaded.
+        if self.sender() is not self.rescanner:
+            return
+        image_list = self.rescan_list
+        self.rescanner.deleteLater()
+        self.rescanner = None
+        self.rescan_list = None
+        if not self.sessionActive():
+            return
+        self.session.mark_complete()
+        if image_list.same_images(self.image_list):
+            if image_list.annotated != self.image_list.annotated:
+                self.image_list.annotated[:] = image_list.annotated
+                self.session.compact()
+        else:
+            current = self.image_list[self.current_index] if self.current_index < len(self.image_list) else None
+            self.session.position = self.current_index
+            self.session.rebase(image_list)
+            self.image_list = image_list
+            self.current_index = self.session.position
+            self.filmstripModel.setImages(self.image_list)
+            if self.image_list and self.image_list[self.current_index] == current:
+                self.updateWindowTitle()
+                self.filmstripModel.setCount(self.current_index, len(self.store))
+                self.showCurrentInFilmstrip()
+            else:
+                self.loadCurrentImage()
+        if self.indexer is not None:
+            self.indexer.sync(self.image_list, prune=True)
+        self.startHashing()
+
+    def openSync(self):
+        # Joins the annotation server named by ANNOTATION_TOOL_SERVER, if any, for the current dataset.
+        self.closeSync()
+        self.sync = SyncClient.from_environment(dataset_key(self.image_list), on_conflict=self.syncConflict.emit)
+
+    def closeSync(self):
+        if self.sync is not None:
+            self.sync.close()
+            self.sync = None
+        self.lease_owner = None
+        self.updateLeaseLabel()
+
+    def loadSharedAnnotations(self, filename, sidecar):
+        # Loads the boxes the server holds for the image and leases it to this annotator.
+        try:
+            labels, normalized, ids = self.sync.fetch(filename)
+            self.lease_owner = self.sync.lease(filename)
+        except OSError as e:
+            # Edits the server has not received yet are newer than the sidecar.
+            print(f"Annotation server unreachable, showing local boxes: {e}", file=sys.stderr)
+            self.lease_owner = None
+            pending = self.sync.pending(filename, ids=True)
+            if pending is not None:
+                labels, normalized, ids = pending
+                self.store.set_ids(self.showLoadedBoxes(labels, normalized), ids)
+            elif sidecar is not None:
+                self.loadAnnotations(sidecar)
+        else:
+            self.store.set_ids(self.showLoadedBoxes(labels, normalized), ids)
+        self.updateLeaseLabel()
 
+    def updateLeaseLabel(self):
+        # Names the annotator holding the lease on the current image when it is not us.
+        if self.sync is None or self.lease_owner in (None, self.sync.name):
+            self.leaseLabel.hide()
+        else:
+            self.leaseLabel.setText(STRINGS[self.current_lang]["leased_by"].format(owner=self.lease_owner))
+            self.leaseLabel.show()
+
+    def setSaveError(self, error):
+        self.save_error = error
+        self.updateSaveErrorLabel()
+
+    def updateSaveErrorLabel(self):
+        # Warns while annotations could not be written; the writer keeps retrying.
+        if not self.save_error:
+            self.saveErrorLabel.hide()
+        else:
+            self.saveErrorLabel.setText(STRINGS[self.current_lang]["save_failed"].format(error=self.save_error))
+            self.saveErrorLabel.show()
+
+    def nextSharedImage(self):
+        # Row of the next image the server leases to us: not done and nobody else's.
+        try:
+            path = self.sync.lease_next(self.image_list[self.current_index])
+        except OSError as e:
+            print(f"Annotation server unreachable: {e}", file=sys.stderr)
+            return None
+        if path is None:
+            return None
+        try:
+            return self.image_list.index(path)
+        except ValueError:
+            # Not listed yet (or not part of this selection).
+            return None
+
+    def sharedConflict(self, image_path):
+        # Another annotator changed boxes we edited: show the merged boxes, keeping the view.
+        if image_path != self.loaded_image or self.current_index >= len(self.image_list):
+            return
+        if self.image_list[self.current_index] != image_path:
+            return
+        transform = self.imageView.transform()
+        center = self.imageView.mapToScene(self.imageView.viewport().rect().center())
+        self.loadCurrentImage()
+        self.imageView.setTransform(transform)
+        self.imageView.centerOn(center)
+
+    def sessionActive(self) -> bool:
+        # The session records the image list on screen (not one set by a script or benchmark).
+        return self.session is not None and self.session.image_list is self.image_list
+
+    def openSession(self, folder=True):
+        # Starts recording a session for the current image list. A previous
+        # session of the same picked images keeps its statuses and position.
+        filename = session_filename(self.image_list, folder)
+        try:
+            session = Session.load(filename) if not folder else None
+            if session is not None:
+                session.rebase(self.image_list)
+                self.current_index = session.position
+            else:
+                session = Session.create(filename, self.image_list, folder, complete=not folder)
+            set_last_session(filename)
+        except OSError as e:
+            print(f"Session not saved: {e}", file=sys.stderr)
+            return
+        self.session = session
+
+    def restoreSession(self, session):
+        # Shows a saved session as it was left, without listing the folder or reading sidecars.
+        self.session = session
+        self.image_list = session.image_list
+        self.current_index = session.position
+        self.filmstripModel.setImages(self.image_list)
+        if session.labels:
+            self.last_label = session.labels[-1]
+        try:
+            set_last_session(session.filename)
+        except OSError:
+            pass
+        self.openIndex()
+        self.openSync()
+        self.startHashing()
+        self.loadCurrentImage()
+        if session.view is not None:
+            m11, m12, m21, m22, x, y = session.view
+            self.imageView.setTransform(QTransform(m11, m12, m21, m22, 0, 0))
+            self.imageView.centerOn(x, y)
+            session.set_position(self.current_index, session.view)
+
+    def restoreLastSession(self):
+        # Reopens the session that was open when the tool was last closed.
+        filename = last_session()
+        session = Session.load(filename) if filename else None
+        if session is None:
+            return False
+        if not session.complete or not len(session.image_list):
+            session.close()
+            return False
+        self.restoreSession(session)
+        return True
+
+    def saveSession(self):
+        # Records the current image and how it is zoomed and panned.
+        if not self.sessionActive() or not self.image_list:
+            return
+        t = self.imageView.transform()
+        center = self.imageView.mapToScene(self.imageView.viewport().rect().center())
+        self.session.set_position(self.current_index, (t.m11(), t.m12(), t.m21(), t.m22(), center.x(), center.y()))
+
+    def closeSession(self):
+        if self.session is not None:
+            self.saveSession()
+            self.session.close(compact=True)
+            self.session = None
+
+    def setImageStatus(self, row, status):
+        if self.sessionActive():
+            self.session.set_status(row, status)
+
+    def finishCurrentImage(self):
+        # Moving on from an image marks it done if it has a sidecar, skipped otherwise.
+        if not self.image_list:
+            return
+        annotated = self.filmstripModel.isAnnotated(self.current_index)
+        if self.sessionActive():
+            self.session.set_status(self.current_index, DONE if annotated else SKIPPED)
+        if self.sync is not None and annotated:
+            try:
+                self.sync.release(self.image_list[self.current_index], done=True)
+            except OSError as e:
+                print(f"Annotation server unreachable: {e}", file=sys.stderr)
+
+    def rememberLabel(self, label):
+        self.last_label = label
+        if self.sessionActive():
+            self.session.use_label(label)
+
+    def startHashing(self):
+        # Hashes the images of the current dataset in the background, replacing the previous job.
+        self.stopHashing()
+        try:
+            cache = HashCache.for_dataset(self.image_list)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Duplicate detection unavailable: {e}", file=sys.stderr)
+            return
+        self.hasher = DuplicateHasher(self.image_list, cache, parent=self)
+        self.hasher.hashesReady.connect(self.hashesArrived)
+        self.hasher.start()
+
+    def stopHashing(self):
+        if self.hasher is not None:
+            self.hasher.close()
+            # Not deleted here: the thread holds the last reference until it
+            # stops, so it never emits from a deleted object.
+            self.hasher.setParent(None)
+            self.hasher = None
+        self.duplicate_index = HashIndex()
+        self.updateDuplicateOffer()
+
+    def hashesArrived(self, chunk):
+        if self.sender() is not self.hasher:
+            # Queued before the job was replaced.
+            return
+        for row, phash in chunk:
+            self.duplicate_index.add(row, phash)
+        self.updateDuplicateOffer()
+
+    def updateDuplicateOffer(self):
+        # Offers the boxes of the closest annotated near-duplicate of an image that has none yet.
+        self.duplicate_source = None
+        row = self.current_index
+        phash = self.duplicate_index.values.get(row)
+        if phash is not None and not len(self.store) and not self.filmstripModel.isAnnotated(row):
+            for _, other in self.duplicate_index.query(phash):
+                if other != row and self.filmstripModel.isAnnotated(other) and self.filmstripModel.count(other):
+                    self.duplicate_source = other
+                    break
+        if self.duplicate_source is None:
+            self.duplicateLabel.hide()
+        else:
+            self.duplicateLabel.setText(STRINGS[self.current_lang]["duplicate_of"].format(
+                name=os.path.basename(self.image_list[self.duplicate_source]),
+                count=self.filmstripModel.count(self.duplicate_source)
+            ))
+            self.duplicateLabel.show()
+        self.btnCopyDuplicate.setEnabled(self.duplicate_source is not None)
+
+    def copyDuplicateBoxes(self):
+        # Copies the boxes of the offered near-duplicate; normalized geometry carries over resizes.
+        if self.duplicate_source is None or self.loaded_image is None:
+            return
+        source = self.image_list[self.duplicate_source]
+        content = self.pendingSidecar(source)
+        if content is None:
+            sidecar = find_sidecar(source)
+            if sidecar is None:
+                return
+            content = read_sidecar_content(sidecar)
+        labels, normalized = decode_sidecar(content)
+        self.addBoxes(normalized_to_pixels(normalized, self.image_width, self.image_height), labels)
+
+    def openIndex(self):
+        # Opens the persistent label index of the current dataset, replacing the previous one.
+        self.closeIndex()
+        try:
+            index = DatasetIndex.for_dataset(self.image_list)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Dataset index unavailable: {e}", file=sys.stderr)
+            return
+        self.indexer = DatasetIndexer(index, self.pendingSidecar, self)
+        self.indexer.changed.connect(self.indexChanged)
+        self.indexChanged()
+
+    def closeIndex(self):
+        if self.indexer is not None:
+            self.indexer.close()
+            self.indexer.deleteLater()
+            self.indexer = None
+
+    def indexChanged(self):
+        if self.indexPanel is not None:
+            self.indexPanel.indexChanged()
+
+    def showIndexPanel(self):
+        if self.indexPanel is None:
+            self.indexPanel = IndexPanel(self)
+        self.indexPanel.show()
+        self.indexPanel.raise_()
+
+    def updateWindowTitle(self):
+        if not self.image_list or self.current_index >= len(self.image_list):
+            return
+        self.setWindowTitle(STRINGS[self.current_lang]["nav_title"].format(
+            current=self.current_index + 1,
+            total=len(self.image_list),
+            filename=os.path.basename(self.image_list[self.current_index])
+        ))
+
+    @timed("viewer.loadCurrentImage")
     def loadCurrentImage(self):
-        # Loads the current image and its corresponding TXT annotations.
+        # Loads the current image and its annotations (TXT or binary sidecar).
         if not self.image_list or self.current_index >= len(self.image_list):
             return
         filename = self.image_list[self.current_index]
-        pixmap = QPixmap(filename)
-        if pixmap.isNull():
-            return
-        self.image_width = pixmap.width()
-        self.image_height = pixmap.height()
+        if needs_tiling(filename):
+            # Too large to decode at once: show it through a tile pyramid in full-resolution coordinates.
+            item = TiledImageItem(filename)
+            self.image_width = item.pyramid.width
+            self.image_height = item.pyramid.height
+        else:
+            image = self.image_cache.get(filename)
+            if image.isNull():
+                return
+            item = LodPixmapItem(image)
+            self.image_width = image.width()
+            self.image_height = image.height()
+        if self.currentSidecar:
+            # Start writing the image we are leaving right away instead of after the delay.
+            self.annotation_writer.flush_async()
+        if isinstance(self.imageItem, (LodPixmapItem, TiledImageItem)):
+            self.imageItem.shutdown()
+        if self.loaded_image is not None:
+            self.previous_frame = (self.loaded_image, self.store, self.annotation_version)
+        self.imageItem = item
+        self.imageView.cancelInteraction()
+        self.pending_propagation = None
         self.scene.clear()
-        item = QGraphicsPixmapItem(pixmap)
         item.setZValue(0)
         self.scene.addItem(item)
         self.imageView.fitInView(item, Qt.KeepAspectRatio)
         self.annotations = []
-        self.listWidget.clear()
-        base, _ = os.path.splitext(filename)
-        self.currentTxtFile = base + ".txt"
-        self.loadAnnotations(self.currentTxtFile)
-        new_title = STRINGS[self.current_lang]["nav_title"].format(
-            current=self.current_index + 1,
-            total=len(self.image_list),
-            filename=os.path.basename(filename)
+        self.overlay = None
+        self.proposalOverlay = None
+        self.store = AnnotationStore(self.image_width, self.image_height, self.labels)
+        self.listModel.setStore(self.store)
+        unsaved = None
+        for path in sidecar_paths(filename):
+            if not self.annotation_writer.flush(path):
+                unsaved = path
+        # A failed write is queued for a retry; show the boxes it will write, not the stale file.
+        content = self.annotation_writer.pending(unsaved) if unsaved is not None else None
+        sidecar = find_sidecar(filename)
+        self.currentSidecar = unsaved or sidecar or os.path.splitext(filename)[0] + self.new_sidecar_extension
+        self.loaded_image = filename
+        if self.sync is not None:
+            self.loadSharedAnnotations(filename, sidecar)
+        elif content is not None:
+            self.showLoadedBoxes(*decode_sidecar(content))
+        elif sidecar is not None:
+            self.loadAnnotations(sidecar)
+        if (self.chkAutoPropagate.isChecked() and not len(self.store)
+                and sidecar is None and self.previousFrame() is not None):
+            self.propagateFrom(*self.previousFrame(), automatic=True)
+        self.updateWindowTitle()
+        self.image_cache.prefetch_around(self.image_list, self.current_index)
+        if self.filmstripModel.image_list is not self.image_list:
+            self.filmstripModel.setImages(self.image_list)
+        self.filmstripModel.setCount(self.current_index, len(self.store))
+        self.showCurrentInFilmstrip()
+        self.schedulePropagation()
+        self.showProposals()
+        self.scheduleDetection()
+        self.updateDuplicateOffer()
+        if self.sessionActive():
+            self.session.set_position(self.current_index)
+            if self.session.status[self.current_index] == UNTOUCHED:
+                self.session.set_status(self.current_index, IN_PROGRESS)
+
+    def previousFrame(self):
+        # (path, store, version) of the image before the current one, if it was the last one shown.
+        if self.previous_frame is None or self.current_index == 0:
+            return None
+        if self.previous_frame[0] != self.image_list[self.current_index - 1]:
+            return None
+        return self.previous_frame
+
+    def propagateFrom(self, source, store, version, automatic=False):
+        # Adds the boxes of `store` (shown on image `source`) tracked into the
+        # current image, as soon as the propagation thread has them.
+        if not len(store):
+            return
+        key = (source, self.loaded_image, version)
+        self.pending_propagation = (key, automatic)
+        self.propagator.deliver(key, source, self.loaded_image, store.boxes, store.label_names())
+
+    def propagationReady(self, key, boxes, labels):
+        if self.pending_propagation is None or self.pending_propagation[0] != key:
+            return
+        automatic = self.pending_propagation[1]
+        self.pending_propagation = None
+        # Automatic propagation only fills an image that is still empty.
+        if key[1] != self.loaded_image or (automatic and len(self.store)):
+            return
+        self.addBoxes(boxes, labels)
+
+    def propagatePrevious(self):
+        # Copies the boxes of the previous image into this one, following the image content.
+        if not self.image_list or self.current_index == 0 or self.loaded_image is None:
+            return
+        frame = self.previousFrame()
+        if frame is None:
+            source = self.image_list[self.current_index - 1]
+            content = self.pendingSidecar(source)
+            if content is None:
+                sidecar = find_sidecar(source)
+                if sidecar is None:
+                    return
+                content = read_sidecar_content(sidecar)
+            size = read_image_size(source)
+            if size is None:
+                return
+            store = AnnotationStore(*size, labels=self.labels)
+            store.load_normalized(*decode_sidecar(content))
+            # Read from disk: never matches a request computed in the background.
+            frame = (source, store, object())
+        self.propagateFrom(*frame)
+
+    def schedulePropagation(self):
+        # Starts tracking the current boxes into the next image if it has no sidecar yet.
+        if not self.chkAutoPropagate.isChecked() or self.loaded_image is None or not len(self.store):
+            return
+        target = self.current_index + 1
+        if target >= len(self.image_list) or self.filmstripModel.isAnnotated(target):
+            return
+        target = self.image_list[target]
+        self.propagator.request((self.loaded_image, target, self.annotation_version),
+                                self.loaded_image, target, self.store.boxes, self.store.label_names())
+
+    def setPreAnnotator(self, preannotator):
+        if self.preannotator is not None:
+            self.preannotator.shutdown()
+            self.preannotator.deleteLater()
+        self.preannotator = preannotator
+        self.btnAcceptProposals.setEnabled(preannotator is not None)
+        self.btnRejectProposals.setEnabled(preannotator is not None)
+        self.setDetectorError("")
+        if preannotator is not None:
+            preannotator.proposalsReady.connect(self.proposalsArrived)
+            preannotator.detectorError.connect(self.setDetectorError)
+            self.scheduleDetection()
+
+    def chooseDetector(self):
+        strings = STRINGS[self.current_lang]
+        spec, ok = QInputDialog.getText(
+            self, strings["detector"], strings["detector_prompt"],
+            text=self.preannotator.spec if self.preannotator is not None else "dummy"
         )
-        self.setWindowTitle(new_title)
+        if not ok:
+            return
+        spec = spec.strip()
+        if spec:
+            try:
+                check_detector_spec(spec)
+            except ValueError as e:
+                self.setDetectorError(str(e))
+                return
+        lookahead = self.preannotator.lookahead if self.preannotator is not None else 8
+        self.setPreAnnotator(PreAnnotator(spec, lookahead, parent=self) if spec else None)
+        self.showProposals()
+
+    def setDetectorError(self, error):
+        self.detector_error = error
+        self.updateDetectorErrorLabel()
+
+    def updateDetectorErrorLabel(self):
+        if not self.detector_error:
+            self.detectorErrorLabel.hide()
+        else:
+            self.detectorErrorLabel.setText(STRINGS[self.current_lang]["detector_failed"].format(error=self.detector_error))
+            self.detectorErrorLabel.show()
+
+    def scheduleDetection(self):
+        # Asks the detector worker for the current and upcoming images that have no sidecar.
+        if self.preannotator is not None and self.loaded_image is not None:
+            self.preannotator.schedule(self.image_list, self.current_index, self.filmstripModel.isAnnotated)
+
+    def proposalsArrived(self, paths):
+        if self.loaded_image in paths and self.proposalOverlay is None:
+            self.showProposals()
+
+    def showProposals(self):
+        # Shows the cached proposals for the current image as provisional boxes.
+        self.clearProposals()
+        if self.preannotator is None or self.loaded_image is None:
+            return
+        proposals = self.preannotator.proposals(self.loaded_image)
+        if not proposals:
+            return
+        labels = [p[0] for p in proposals]
+        scores = [p[1] for p in proposals]
+        boxes = normalized_to_pixels([p[2:] for p in proposals], self.image_width, self.image_height)
+        self.proposalOverlay = ProposalOverlay(boxes, labels, scores)
+        self.scene.addItem(self.proposalOverlay)
+
+    def clearProposals(self):
+        if self.proposalOverlay is not None:
+            self.scene.removeItem(self.proposalOverlay)
+            self.proposalOverlay = None
+
+    def acceptProposals(self):
+        # Adds every provisional box of the current image to its annotations.
+        if self.proposalOverlay is None:
+            return
+        boxes, labels = self.proposalOverlay.boxes, self.proposalOverlay.labels
+        self.clearProposals()
+        self.preannotator.markReviewed(self.loaded_image)
+        self.addBoxes(boxes, labels)
+
+    def rejectProposals(self):
+        if self.proposalOverlay is None:
+            return
+        self.clearProposals()
+        self.preannotator.markReviewed(self.loaded_image)
+
+    def showCurrentInFilmstrip(self):
+        # Highlights the current image in the filmstrip, unless it is filtered out.
+        index = self.filmstripFilter.mapFromSource(self.filmstripModel.index(self.current_index))
+        self.filmstrip.setCurrentIndex(index)
+        if index.isValid():
+            self.filmstrip.scrollTo(index)
+
+    def jumpToImage(self, index):
+        # Opens the image clicked in the filmstrip.
+        self.jumpToRow(self.filmstripFilter.mapToSource(index).row())
+
+    def jumpToRow(self, row):
+        if row != self.current_index and 0 <= row < len(self.image_list):
+            self.current_index = row
+            self.loadCurrentImage()
+
+    def nextUnannotated(self):
+        # Jumps to the next image without a sidecar, wrapping around at the end.
+        if not self.image_list:
+            return
+        if self.sync is not None:
+            row = self.nextSharedImage()
+        elif isinstance(self.image_list, ImageList):
+            row = self.image_list.next_unannotated(self.current_index)
+        else:
+            rows = list(range(self.current_index + 1, len(self.image_list))) + list(range(self.current_index))
+            row = next((r for r in rows if not self.filmstripModel.isAnnotated(r)), None)
+        if row is not None and row != self.current_index:
+            self.finishCurrentImage()
+            self.current_index = row
+            self.loadCurrentImage()
+
+    def setUnannotatedOnly(self, enabled):
+        self.filmstripFilter.setUnannotatedOnly(enabled)
+        self.showCurrentInFilmstrip()
+
+    def closeEvent(self, event):
+        # Saves pending annotations and stops background decoding before the window goes away.
+        # While some annotations cannot be written, closing needs a confirmation;
+        # otherwise the window stays open and the writer keeps retrying.
+        if not self.annotation_writer.flush():
+            answer = QMessageBox.warning(
+                self, self.windowTitle(),
+                STRINGS[self.current_lang]["unsaved_close"].format(error=self.annotation_writer.last_error),
+                QMessageBox.Close | QMessageBox.Cancel, QMessageBox.Cancel
+            )
+            if answer != QMessageBox.Close:
+                event.ignore()
+                return
+        self.stopScan()
+        self.closeSession()
+        self.closeSync()
+        self.closeIndex()
+        self.stopHashing()
+        self.annotation_writer.close()
+        self.propagator.shutdown()
+        self.setPreAnnotator(None)
+        self.image_cache.shutdown()
+        self.filmstripModel.shutdown()
+        if isinstance(self.imageItem, (LodPixmapItem, TiledImageItem)):
+            self.imageItem.shutdown()
+        if TELEMETRY.enabled and TELEMETRY.dump_dir:
+            for path in TELEMETRY.dump():
+                print(f"Telemetry written to {path}", file=sys.stderr)
+        super().closeEvent(event)
 
     def keyPressEvent(self, event):
         # Handles navigation between images using arrow keys or space.
-        if event.key() in (Qt.Key_Right, Qt.Key_Space):
+        if self.imageView.startKeyMotion(event):
+            event.accept()
+        elif event.key() in (Qt.Key_Right, Qt.Key_Space):
             if self.current_index < len(self.image_list) - 1:
+                self.finishCurrentImage()
                 self.current_index += 1
                 self.loadCurrentImage()
             event.accept()
@@ -359,83 +2388,204 @@ class ImageViewer(QMainWindow):
                 self.current_index -= 1
                 self.loadCurrentImage()
             event.accept()
+        elif event.key() == Qt.Key_N:
+            self.nextUnannotated()
+            event.accept()
+        elif event.key() == Qt.Key_P:
+            self.propagatePrevious()
+            event.accept()
+        elif event.key() == Qt.Key_A:
+            self.acceptProposals()
+            event.accept()
+        elif event.key() == Qt.Key_R:
+            self.rejectProposals()
+            event.accept()
+        elif event.key() == Qt.Key_D:
+            self.copyDuplicateBoxes()
+            event.accept()
+        elif event.key() == Qt.Key_F12:
+            self.showTelemetryPanel()
+            event.accept()
         else:
             super().keyPressEvent(event)
 
+    def keyReleaseEvent(self, event):
+        if self.imageView.stopKeyMotion(event):
+            event.accept()
+        else:
+            super().keyReleaseEvent(event)
+
+    def changeEvent(self, event):
+        # Keys released while another window has focus never reach us.
+        if event.type() == QEvent.ActivationChange and not self.isActiveWindow():
+            self.imageView.stopMotion()
+        super().changeEvent(event)
+
+    def setTelemetryEnabled(self, enabled):
+        # Turns hot-path instrumentation on or off; the status bar is only shown while it is on.
+        TELEMETRY.enabled = enabled
+        self.statusBar().setVisible(enabled)
+        if enabled:
+            self.telemetryTimer.start()
+            self.updateTelemetryStatus()
+        else:
+            self.telemetryTimer.stop()
+        if self.telemetryPanel is not None and self.telemetryPanel.enabledBox.isChecked() != enabled:
+            self.telemetryPanel.enabledBox.setChecked(enabled)
+
+    def updateTelemetryStatus(self):
+        # p95 latencies of the main hot paths, e.g. "load p95 41.2 ms | move p95 0.18 ms".
+        histograms = TELEMETRY.snapshot()["histograms"]
+        parts = [
+            f"{short} p95 {histograms[name]['p95_ms']:.2f} ms"
+            for short, name in self.STATUS_METRICS
+            if histograms.get(name, {}).get("count")
+        ]
+        self.telemetryLabel.setText("  |  ".join(parts))
+
+    def showTelemetryPanel(self):
+        if self.telemetryPanel is None:
+            self.telemetryPanel = TelemetryPanel(self)
+        self.telemetryPanel.show()
+        self.telemetryPanel.raise_()
+
     def addAnnotation(self, annotation):
-        # Adds a new annotation to the internal list and updates the annotation list widget.
+        # Adds a new annotation to the store, which also adds it to the annotation list.
         if not annotation.label and self.last_label:
-            annotation.label = self.last_label
-        self.annotations.append(annotation)
+            annotation.setLabel(self.last_label)
         r = annotation.rect()
-        cx = r.x() + r.width()/2
-        cy = r.y() + r.height()/2
-        no_label_str = STRINGS[self.current_lang]["rect_no_label"]
-        show_label = annotation.label if annotation.label else no_label_str
-        text = (
-            f"Label: {show_label}  "
-            f"(Center: {cx:.2f}, {cy:.2f}, W: {r.width():.2f}, H: {r.height():.2f})"
-        )
-        item = QListWidgetItem(text)
-        item.setData(Qt.UserRole, annotation)
-        item.setBackground(QBrush(annotation.color))
-        item.setForeground(QBrush(Qt.black))
-        self.listWidget.addItem(item)
+        color_id = self.color_palette.index(annotation.color)
+        if self.overlay is not None:
+            self.scene.removeItem(annotation)
+        else:
+            self.annotations.append(annotation)
+        self.listModel.appendBox(r.x(), r.y(), r.width(), r.height(), annotation.label, color_id)
+        if self.overlay is not None:
+            self.overlay.refresh()
         self.updateAnnotationsFile()
         if annotation.label:
-            self.last_label = annotation.label
+            self.rememberLabel(annotation.label)
+
+    def selectedRows(self) -> list:
+        # Store rows of the annotations selected in the list (list rows match store rows).
+        return sorted(index.row() for index in self.listView.selectionModel().selectedRows())
+
+    def selectAnnotation(self, row):
+        # Selects an annotation clicked in the scene in the list.
+        index = self.listModel.index(row)
+        self.listView.selectionModel().setCurrentIndex(index, QItemSelectionModel.ClearAndSelect)
+        self.listView.scrollTo(index)
+
+    def annotationSelectionChanged(self, selected, deselected):
+        # Highlights the boxes selected in the list; only the changed rows are touched.
+        if self.overlay is not None:
+            self.overlay.selectionChanged()
+            return
+        for index in deselected.indexes():
+            if index.row() < len(self.annotations):
+                self.annotations[index.row()].setHighlighted(False)
+        for index in selected.indexes():
+            if index.row() < len(self.annotations):
+                self.annotations[index.row()].setHighlighted(True)
+
+    def pendingSidecar(self, image_path):
+        # Sidecar content of `image_path` still waiting to be written, or None.
+        sync = self.sync
+        if sync is not None:
+            pending = sync.pending(image_path)
+            if pending is not None:
+                target = find_sidecar(image_path) or os.path.splitext(image_path)[0] + TXT_EXTENSION
+                return encode_sidecar(target, *pending)
+        for path in sidecar_paths(image_path):
+            content = self.annotation_writer.pending(path)
+            if content is not None:
+                return content
+        return None
 
     def updateAnnotationsFile(self):
-        # Writes all annotations to a TXT file using normalized coordinates.
-        if self.currentTxtFile:
-            with open(self.currentTxtFile, "w") as f:
-                for ann in self.annotations:
-                    r = ann.rect()
-                    center_x = (r.x() + r.width()/2) / self.image_width
-                    center_y = (r.y() + r.height()/2) / self.image_height
-                    norm_width = r.width() / self.image_width
-                    norm_height = r.height() / self.image_height
-                    line = f"{ann.label} {center_x} {center_y} {norm_width} {norm_height}\n"
-                    f.write(line)
-
-    def loadAnnotations(self, txt_file):
-        # Loads annotations from the TXT file and adds them to the scene and list widget.
-        if os.path.exists(txt_file):
-            with open(txt_file, "r") as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) >= 5:
-                        label = parts[0]
-                        x_c = float(parts[1])
-                        y_c = float(parts[2])
-                        w_n = float(parts[3])
-                        h_n = float(parts[4])
-                        cx = x_c * self.image_width
-                        cy = y_c * self.image_height
-                        w = w_n * self.image_width
-                        h = h_n * self.image_height
-                        x = cx - w/2
-                        y = cy - h/2
-                        c = self.get_next_color()
-                        ann = ResizableAnnotationRect(QRectF(x, y, w, h), label=label, color=c)
-                        self.scene.addItem(ann)
-                        self.annotations.append(ann)
-                        no_label_str = STRINGS[self.current_lang]["rect_no_label"]
-                        label_show = label if label else no_label_str
-                        item_txt = (
-                            f"Label: {label_show}  "
-                            f"(Center: {cx:.2f}, {cy:.2f}, W: {w:.2f}, H: {h:.2f})"
-                        )
-                        item = QListWidgetItem(item_txt)
-                        item.setData(Qt.UserRole, ann)
-                        item.setBackground(QBrush(c))
-                        item.setForeground(QBrush(Qt.black))
-                        self.listWidget.addItem(item)
-
-    def editAnnotationLabel(self, item):
+        # Queues all annotations for writing to the sidecar (TXT or binary) using normalized coordinates.
+        if self.currentSidecar:
+            if self.sync is not None:
+                # Shared mode: the server merges the edit and writes the sidecar.
+                self.sync.mark_dirty(self.loaded_image, self.store.label_names(), self.store.normalized(),
+                                     self.store.ids)
+            else:
+                content = encode_sidecar(self.currentSidecar, self.store.label_names(), self.store.normalized())
+                self.annotation_writer.mark_dirty(self.currentSidecar, content)
+            self.annotation_version += 1
+            self.filmstripModel.setCount(self.current_index, len(self.store))
+            if isinstance(self.image_list, ImageList):
+                if self.sessionActive() and not self.image_list.is_annotated(self.current_index):
+                    self.session.set_annotated(self.current_index)
+                self.image_list.set_annotated(self.current_index)
+            self.setImageStatus(self.current_index, IN_PROGRESS)
+            if self.indexer is not None:
+                self.indexer.imageSaved(self.image_list[self.current_index])
+            self.schedulePropagation()
+            self.updateDuplicateOffer()
+
+    def annotationResized(self, row, r: QRectF):
+        # Copies the new geometry of a resized annotation to the store and saves it.
+        self.store.set_rect(row, r.x(), r.y(), r.width(), r.height())
+        if self.overlay is not None:
+            self.overlay.refresh()
+        self.listModel.rowsChanged([row])
+        self.updateAnnotationsFile()
+
+    def loadAnnotations(self, sidecar):
+        # Loads annotations from a TXT or binary sidecar and adds them to the scene; the list reads the store.
+        self.showLoadedBoxes(*decode_sidecar(read_sidecar_content(sidecar)))
+
+    def showLoadedBoxes(self, labels, normalized):
+        # Adds loaded normalized boxes to the store and the scene; returns their rows.
+        with TELEMETRY.span("list.rebuild"):
+            rows = self.listModel.loadNormalized(labels, normalized, self.color_index, len(self.color_palette))
+        self.color_index = (self.color_index + len(rows)) % len(self.color_palette)
+        self.showAnnotationRows(rows)
+        return rows
+
+    def showAnnotationRows(self, rows):
+        # Adds new store rows to the scene: one overlay for dense images, otherwise one item per box.
+        if self.overlay is not None:
+            self.overlay.refresh()
+            return
+        if not self.annotations and len(self.store) >= self.BATCHED_RENDER_THRESHOLD:
+            self.overlay = AnnotationOverlay(self.store, self.color_palette, self.listView.selectionModel())
+            self.scene.addItem(self.overlay)
+            return
+        boxes = self.store.boxes[rows.start:rows.stop].tolist()
+        labels = self.store.labels.lookup(self.store.label_ids[rows.start:rows.stop])
+        colors = [self.color_palette[c] for c in self.store.color_ids[rows.start:rows.stop].tolist()]
+        for (x, y, w, h), label, color in zip(boxes, labels, colors):
+            ann = ResizableAnnotationRect(QRectF(x, y, w, h), label=label, color=color)
+            self.scene.addItem(ann)
+            self.annotations.append(ann)
+
+    def addBoxes(self, boxes, labels):
+        # Adds pixel boxes with their labels (e.g. propagated from the previous image) and saves them.
+        if not len(labels):
+            return
+        color_ids = (self.color_index + np.arange(len(labels))) % len(self.color_palette)
+        self.color_index = (self.color_index + len(labels)) % len(self.color_palette)
+        rows = self.listModel.extendBoxes(boxes, labels, color_ids)
+        self.showAnnotationRows(rows)
+        self.updateAnnotationsFile()
+
+    @timed("list.refreshLabels")
+    def refreshAnnotationLabels(self, rows):
+        # Pushes label changes of the given rows to the scene and the list.
+        if self.overlay is None:
+            labels = self.store.labels.lookup(self.store.label_ids[rows])
+            for row, label in zip(rows, labels):
+                self.annotations[row].setLabel(label)
+        else:
+            self.overlay.update()
+        self.listModel.rowsChanged(rows)
+
+    def editAnnotationLabel(self, index):
         # Opens a dialog to edit the label of an annotation.
-        annotation = item.data(Qt.UserRole)
-        current_label = annotation.label
+        row = index.row()
+        current_label = self.store.label(row)
         new_label, ok = QInputDialog.getText(
             self,
             STRINGS[self.current_lang]["dialog_edit_label"],
@@ -443,26 +2593,16 @@ class ImageViewer(QMainWindow):
             text=current_label
         )
         if ok:
-            annotation.label = new_label
-            annotation.textItem.setPlainText(new_label)
-            annotation.updateLabelPosition()
-            r = annotation.rect()
-            no_label_str = STRINGS[self.current_lang]["rect_no_label"]
-            show_label = new_label if new_label else no_label_str
-            item_txt = (
-                f"Label: {show_label}  "
-                f"(Center: {r.x() + r.width()/2:.2f}, {r.y() + r.height()/2:.2f}, "
-                f"W: {r.width():.2f}, H: {r.height():.2f})"
-            )
-            item.setText(item_txt)
+            self.store.set_labels([row], new_label)
+            self.refreshAnnotationLabels([row])
             self.updateAnnotationsFile()
             if new_label:
-                self.last_label = new_label
+                self.rememberLabel(new_label)
 
     def assignLabelToSelected(self):
         # Assigns a new label to all selected annotations.
-        selected_items = self.listWidget.selectedItems()
-        if not selected_items:
+        rows = self.selectedRows()
+        if not rows:
             return
         new_label, ok = QInputDialog.getText(
             self,
@@ -470,34 +2610,26 @@ class ImageViewer(QMainWindow):
             STRINGS[self.current_lang]["dialog_new_label"]
         )
         if ok:
-            for item in selected_items:
-                annotation = item.data(Qt.UserRole)
-                annotation.label = new_label
-                annotation.textItem.setPlainText(new_label)
-                annotation.updateLabelPosition()
-                r = annotation.rect()
-                no_label_str = STRINGS[self.current_lang]["rect_no_label"]
-                show_label = new_label if new_label else no_label_str
-                item_txt = (
-                    f"Label: {show_label}  "
-                    f"(Center: {r.x() + r.width()/2:.2f}, {r.y() + r.height()/2:.2f}, "
-                    f"W: {r.width():.2f}, H: {r.height():.2f})"
-                )
-                item.setText(item_txt)
+            self.store.set_labels(rows, new_label)
+            self.refreshAnnotationLabels(rows)
             self.updateAnnotationsFile()
-            self.last_label = new_label
+            self.rememberLabel(new_label)
 
     def deleteAnnotation(self):
-        # Deletes selected annotations from the scene and list.
-        selected_items = self.listWidget.selectedItems()
-        if not selected_items:
+        # Deletes selected annotations from the store, the scene and the list.
+        rows = self.selectedRows()
+        if not rows:
             return
-        for item in selected_items:
-            annotation = item.data(Qt.UserRole)
-            self.scene.removeItem(annotation)
-            if annotation in self.annotations:
-                self.annotations.remove(annotation)
-            self.listWidget.takeItem(self.listWidget.row(item))
+        with TELEMETRY.span("list.delete"):
+            self.listModel.removeBoxes(rows)
+        if self.overlay is None:
+            removed = set(rows)
+            for row in rows:
+                self.scene.removeItem(self.annotations[row])
+            self.annotations = [ann for row, ann in enumerate(self.annotations) if row not in removed]
+        else:
+            self.overlay.refresh()
+            self.overlay.selectionChanged()
         self.updateAnnotationsFile()
 
 ###############################################################################
@@ -512,4 +2644,5 @@ if __name__ == "__main__":
         sys_lang = "en"
     viewer.set_language(sys_lang)
     viewer.show()
+    viewer.restoreLastSession()
     sys.exit(app.exec_())
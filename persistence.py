@@ -0,0 +1,178 @@
+import os
+import sys
+import threading
+import time
+
+from telemetry import TELEMETRY
+
+###############################################################################
+#                              Atomic File Writes                             #
+###############################################################################
+def atomic_write(path, content):
+    # Writes `content` next to `path` and renames it into place, so readers see
+    # either the old file or the new one, never a truncated one. `content` is
+    # text, or bytes for binary files.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb" if isinstance(content, bytes) else "w") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+###############################################################################
+#                            AnnotationWriter Class                           #
+###############################################################################
+class AnnotationWriter:
+    # Write-behind persistence for annotation files. Edits only mark a file as
+    # dirty; the latest content of each dirty file is written once by a
+    # background thread after `delay` seconds, or immediately on flush().
+    # A failed write stays pending and is retried after RETRY_SECONDS, unless
+    # newer content replaced it. `on_error` is called on the writing thread
+    # with the OSError of every failure, and with None once writes succeed again.
+    RETRY_SECONDS = 2.0
+
+    def __init__(self, delay=0.5, on_error=None):
+        self.delay = delay
+        self.on_error = on_error
+        self._dirty = {}
+        self._deadlines = {}
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self.edits = 0
+        self.writes = 0
+        self.errors = 0
+        self.last_error = None
+        self._failing = set()
+        # Paths taken for writing whose write has not finished yet.
+        self._writing = set()
+        self._thread = threading.Thread(target=self._run, name="annotation-writer", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, path, content):
+        # Records the new content of `path`; replaces any write still pending.
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("AnnotationWriter is closed")
+            self._dirty[path] = content
+            self._deadlines.setdefault(path, time.monotonic() + self.delay)
+            self.edits += 1
+            self._cond.notify()
+        TELEMETRY.count("annotations.edit")
+
+    def pending(self, path):
+        # Returns the content waiting to be written to `path`, or None.
+        with self._cond:
+            return self._dirty.get(path)
+
+    def is_dirty(self, path=None) -> bool:
+        with self._cond:
+            return bool(self._dirty) if path is None else path in self._dirty
+
+    def flush(self, path=None) -> bool:
+        # Synchronously writes `path` (or every dirty file) on the calling thread.
+        # Returns False if a write failed; its content stays pending for a retry.
+        # A path that is neither dirty nor being written returns right away,
+        # without waiting for the background thread's writes to other files.
+        with self._cond:
+            if path is not None and path not in self._dirty and path not in self._writing:
+                return True
+        with self._io_lock:
+            with self._cond:
+                paths = list(self._dirty) if path is None else [path]
+                batch = self._take(paths)
+            return self._write(batch)
+
+    def flush_async(self):
+        # Makes every dirty file due now without waiting for it to be written.
+        with self._cond:
+            now = time.monotonic()
+            for path in self._deadlines:
+                self._deadlines[path] = now
+            self._cond.notify()
+
+    def close(self) -> bool:
+        # Writes everything still pending and stops the background thread.
+        # Returns False if some files could not be written; their edits are lost.
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        if self.flush():
+            return True
+        print(f"{len(self._dirty)} annotation file(s) not saved: {self.last_error}", file=sys.stderr)
+        return False
+
+    def _take(self, paths):
+        # Caller must hold the condition lock.
+        batch = []
+        for path in paths:
+            if path in self._dirty:
+                batch.append((path, self._dirty.pop(path)))
+                del self._deadlines[path]
+                self._writing.add(path)
+        return batch
+
+    def _write(self, batch) -> bool:
+        # Caller must hold the I/O lock so writes to one path stay ordered.
+        failed = []
+        for path, content in batch:
+            try:
+                with TELEMETRY.span("annotations.write"):
+                    atomic_write(path, content)
+                self.writes += 1
+                self._failing.discard(path)
+            except OSError as e:
+                self.errors += 1
+                TELEMETRY.count("annotations.write_error")
+                self.last_error = e
+                if path not in self._failing:
+                    print(f"Could not save annotations to {path}, will retry: {e}", file=sys.stderr)
+                self._failing.add(path)
+                failed.append((path, content))
+                if self.on_error is not None:
+                    self.on_error(e)
+        # Requeued before they stop counting as in flight, so flush(path) never misses them.
+        self._requeue(failed)
+        with self._cond:
+            self._writing.difference_update(path for path, _ in batch)
+        if not failed and batch and not self._failing and self.last_error is not None:
+            self.last_error = None
+            if self.on_error is not None:
+                self.on_error(None)
+        return not failed
+
+    def _requeue(self, batch):
+        # Puts back writes that failed, unless newer content arrived meanwhile.
+        if not batch:
+            return
+        with self._cond:
+            retry = time.monotonic() + self.RETRY_SECONDS
+            for path, content in batch:
+                if path not in self._dirty:
+                    self._dirty[path] = content
+                    self._deadlines[path] = retry
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if self._deadlines:
+                        timeout = min(self._deadlines.values()) - time.monotonic()
+                        if timeout <= 0:
+                            break
+                        self._cond.wait(timeout)
+                    else:
+                        self._cond.wait()
+            with self._io_lock:
+                with self._cond:
+                    now = time.monotonic()
+                    batch = self._take([p for p, t in self._deadlines.items() if t <= now])
+                self._write(batch)
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from PyQt5.QtGui import QImage, QImageReader
+from PyQt5.QtCore import QObject, QSize, QTimer, pyqtSignal
+
+from detectors import detector_identity, load_detector
+from persistence import atomic_write
+
+DETECTOR_VAR = "ANNOTATION_TOOL_DETECTOR"
+LOOKAHEAD_VAR = "ANNOTATION_TOOL_DETECTOR_AHEAD"
+
+
+def proposal_cache_root() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "image-annotation-tool", "proposals")
+
+###############################################################################
+#                             ProposalCache Class                             #
+###############################################################################
+class ProposalCache:
+    # One small JSON file per image and detector holding its proposals, valid
+    # while the image's mtime and size match. Written atomically by the worker
+    # process and read by the GUI, so nothing is shared but the files.
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def for_detector(cls, spec, cache_root=None):
+        key = hashlib.sha1(detector_identity(spec).encode("utf-8")).hexdigest()
+        return cls(os.path.join(cache_root or proposal_cache_root(), key))
+
+    def filename(self, image_path) -> str:
+        key = hashlib.sha1(os.path.abspath(image_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".json")
+
+    def lookup(self, image_path):
+        # Returns the cached entry ({"proposals": [...], "reviewed": bool}) or None.
+        try:
+            st = os.stat(image_path)
+            with open(self.filename(image_path), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("mtime_ns") != st.st_mtime_ns or entry.get("size") != st.st_size:
+            return None
+        return entry
+
+    def store(self, image_path, proposals, reviewed=False):
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            return None
+        entry = {
+            "path": image_path, "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+            "proposals": [list(p) for p in proposals], "reviewed": reviewed,
+        }
+        atomic_write(self.filename(image_path), json.dumps(entry))
+        return entry
+
+    def mark_reviewed(self, image_path):
+        # Accepted or rejected proposals are not shown again.
+        entry = self.lookup(image_path)
+        if entry is not None and not entry.get("reviewed"):
+            self.store(image_path, entry["proposals"], reviewed=True)
+
+###############################################################################
+#                                Worker Process                               #
+###############################################################################
+# The detector is loaded once per worker process by the pool initializer. A
+# detector that fails to load is reported by every batch as DetectorLoadError,
+# so the GUI can tell it apart from a batch that failed on its own.
+_detector = None
+_load_error = None
+_cache = None
+
+
+class DetectorLoadError(RuntimeError):
+    pass
+
+
+def decode_rgb(path, max_side):
+    # RGB uint8 array of the image with its longer side at most `max_side`, or None.
+    reader = QImageReader(path)
+    size = reader.size()
+    if size.isValid():
+        scale = min(1.0, max_side / max(size.width(), size.height(), 1))
+        reader.setScaledSize(QSize(max(1, round(size.width() * scale)), max(1, round(size.height() * scale))))
+    image = reader.read()
+    if image.isNull():
+        return None
+    image = image.convertToFormat(QImage.Format_RGB888)
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    rows = np.frombuffer(bits, np.uint8).reshape(image.height(), image.bytesPerLine())
+    return rows[:, :image.width() * 3].reshape(image.height(), image.width(), 3).copy()
+
+
+def init_worker(spec, cache_directory):
+    global _detector, _load_error, _cache
+    _cache = ProposalCache(cache_directory)
+    try:
+        _detector = load_detector(spec)
+    except Exception as e:
+        _load_error = f"{spec}: {e}"
+
+
+def detect_images(paths) -> list:
+    # Worker: runs one batch through the detector and caches the results.
+    # Unreadable images are cached with no proposals so they are not retried.
+    if _detector is None:
+        raise DetectorLoadError(_load_error)
+    max_side = getattr(_detector, "input_size", 1024)
+    images, readable = [], []
+    for path in paths:
+        image = decode_rgb(path, max_side)
+        if image is None:
+            _cache.store(path, [])
+        else:
+            images.append(image)
+            readable.append(path)
+    results = _detector.detect(images) if images else []
+    for path, proposals in zip(readable, results):
+        _cache.store(path, [
+            (str(label), float(score), float(cx), float(cy), float(w), float(h))
+            for label, score, cx, cy, w, h in proposals
+        ])
+    return paths
+
+###############################################################################
+#                             PreAnnotator Class                              #
+###############################################################################
+class PreAnnotator(QObject):
+    # Runs a detector in one spawned worker process, `lookahead` images ahead
+    # of the image being reviewed, in batches of `batch_size`. The GUI thread
+    # only reads finished proposals from the cache; loading the model and
+    # inference happen in the worker. `detectorError` carries the last failure,
+    # or an empty string once a batch succeeds again.
+    proposalsReady = pyqtSignal(list)
+    detectorError = pyqtSignal(str)
+
+    def __init__(self, spec, lookahead=8, batch_size=4, cache_root=None, parent=None):
+        super().__init__(parent)
+        self.spec = spec
+        self.lookahead = lookahead
+        self.batch_size = batch_size
+        self.cache = ProposalCache.for_detector(spec, cache_root)
+        self._executor = None
+        self._wanted = []
+        self._in_flight = set()
+        self._closed = False
+        self.broken = False
+        self.error = ""
+        self.proposalsReady.connect(self._onReady)
+        self.detectorError.connect(self._setError)
+
+    @classmethod
+    def from_environment(cls, parent=None):
+        # ANNOTATION_TOOL_DETECTOR selects a detector at startup; ANNOTATION_TOOL_DETECTOR_AHEAD the lookahead.
+        spec = os.environ.get(DETECTOR_VAR)
+        if not spec:
+            return None
+        return cls(spec, lookahead=int(os.environ.get(LOOKAHEAD_VAR, "8")), parent=parent)
+
+    def schedule(self, image_list, index, skip=None):
+        # Queues the current image and the next `lookahead` ones, nearest first,
+        # unless they are cached, in flight, or `skip(row)` is true.
+        wanted = []
+        for row in range(index, min(index + self.lookahead + 1, len(image_list))):
+            if skip is not None and skip(row):
+                continue
+            path = image_list[row]
+            if path not in self._in_flight and self.cache.lookup(path) is None:
+                wanted.append(path)
+        self._wanted = wanted
+        self._submit()
+
+    def proposals(self, path) -> list:
+        # Proposals for `path` that have not been accepted or rejected yet.
+        entry = self.cache.lookup(path)
+        if entry is None or entry.get("reviewed"):
+            return []
+        return entry["proposals"]
+
+    def markReviewed(self, path):
+        self.cache.mark_reviewed(path)
+
+    def _submit(self):
+        if self.broken or self._closed:
+            return
+        if self._executor is None and self._wanted:
+            context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=context,
+                initializer=init_worker, initargs=(self.spec, self.cache.directory)
+            )
+        # One batch running and one queued keeps the worker busy without hoarding stale requests.
+        while self._wanted and len(self._in_flight) < 2 * self.batch_size:
+            batch = self._wanted[:self.batch_size]
+            del self._wanted[:self.batch_size]
+            try:
+                future = self._executor.submit(detect_images, batch)
+            except (BrokenProcessPool, RuntimeError) as e:
+                print(f"Could not start the detector worker: {e}", file=sys.stderr)
+                self.broken = True
+                self.detectorError.emit(str(e))
+                return
+            self._in_flight.update(batch)
+            future.add_done_callback(lambda f, batch=batch: self._finished(f, batch))
+
+    def _finished(self, future, batch):
+        # Runs on an executor thread; the signal hands the result to the GUI thread.
+        if self._closed:
+            return
+        try:
+            future.result()
+        except (DetectorLoadError, BrokenProcessPool) as e:
+            # A detector that cannot load, or a worker that died, breaks every batch; stop asking.
+            print(f"Detector failed: {e}", file=sys.stderr)
+            self.broken = True
+            self.detectorError.emit(str(e))
+        except Exception as e:
+            # One bad batch; its images are not cached, so they are asked for again later.
+            print(f"Detector failed on {len(batch)} images: {e}", file=sys.stderr)
+            self.detectorError.emit(str(e))
+        else:
+            if self.error:
+                self.detectorError.emit("")
+        self.proposalsReady.emit(batch)
+
+    def _setError(self, error):
+        self.error = error
+
+    def _onReady(self, batch):
+        self._in_flight.difference_update(batch)
+        QTimer.singleShot(0, self._submit)
+
+    def shutdown(self):
+        self._closed = True
+        self._wanted = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+###############################################################################
+#                              Template Matching                              #
+###############################################################################
+# Carries boxes from one video frame to the next. Each box is cut out of the
+# previous frame as a template and searched for around its old position in
+# the next frame by normalized cross-correlation. Nothing here imports Qt;
+# frames are 2-D grayscale arrays. Large boxes are matched on block-averaged
+# copies, so every match costs about the same whatever the box size.
+TEMPLATE_SIZE = 32
+SEARCH_MARGIN = 0.5
+MIN_SEARCH_MARGIN = 8
+MIN_SCORE = 0.5
+
+
+def downsample(image, factor) -> np.ndarray:
+    # Block mean over factor x factor pixels; trailing rows and columns are dropped.
+    if factor == 1:
+        return image.astype(np.float64)
+    h = image.shape[0] // factor * factor
+    w = image.shape[1] // factor * factor
+    blocks = image[:h, :w].reshape(h // factor, factor, w // factor, factor)
+    return blocks.mean(axis=(1, 3))
+
+
+def match_template(search, template):
+    # Returns (row, column, score) of the best normalized cross-correlation of
+    # `template` inside `search`; the score is in [-1, 1].
+    th, tw = template.shape
+    t = template - template.mean()
+    t_norm = math.sqrt(float((t * t).sum()))
+    windows = sliding_window_view(search, (th, tw))
+    # Sum and sum of squares of every window from integral images.
+    integral = np.pad(search, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    squares = np.pad(search * search, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    sums = integral[th:, tw:] - integral[:-th, tw:] - integral[th:, :-tw] + integral[:-th, :-tw]
+    sums_sq = squares[th:, tw:] - squares[:-th, tw:] - squares[th:, :-tw] + squares[:-th, :-tw]
+    variance = np.maximum(sums_sq - sums * sums / (th * tw), 0)
+    correlation = np.tensordot(windows, t, axes=((2, 3), (0, 1)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = correlation / (np.sqrt(variance) * t_norm)
+    scores[~np.isfinite(scores)] = -1
+    row, column = np.unravel_index(int(np.argmax(scores)), scores.shape)
+    return int(row), int(column), float(scores[row, column])
+
+
+def track_box(previous, current, box, margin=SEARCH_MARGIN, template_size=TEMPLATE_SIZE):
+    # Finds pixel box (x, y, w, h) of `previous` in `current`. Returns the moved
+    # box and the match score, or the unmoved box and None for boxes that
+    # cannot be matched (outside the frame, or a flat template).
+    x, y, w, h = box
+    height, width = previous.shape
+    x0, y0 = max(int(round(x)), 0), max(int(round(y)), 0)
+    x1, y1 = min(int(round(x + w)), width), min(int(round(y + h)), height)
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return box, None
+    factor = max(1, math.ceil(max(x1 - x0, y1 - y0) / template_size))
+    pad = max(MIN_SEARCH_MARGIN * factor, int(margin * max(x1 - x0, y1 - y0)))
+    dx = dy = 0
+    score = None
+    # Coarse to fine: the match found on block-averaged frames is refined at a
+    # quarter of the block size, within one coarse block, down to single pixels.
+    while True:
+        template = downsample(previous[y0:y1, x0:x1], factor)
+        if template.shape[0] < 2 or template.shape[1] < 2 or float(template.std()) < 1e-3:
+            break
+        sx0, sy0 = max(x0 + dx - pad, 0), max(y0 + dy - pad, 0)
+        sx1, sy1 = min(x1 + dx + pad, current.shape[1]), min(y1 + dy + pad, current.shape[0])
+        search = downsample(current[sy0:sy1, sx0:sx1], factor)
+        if search.shape[0] < template.shape[0] or search.shape[1] < template.shape[1]:
+            break
+        row, column, score = match_template(search, template)
+        dx = sx0 + column * factor - x0
+        dy = sy0 + row * factor - y0
+        if factor == 1:
+            break
+        pad = factor
+        factor = max(1, factor // 4)
+    if score is None:
+        return box, None
+    return (x + dx, y + dy, w, h), score
+
+
+def propagate_boxes(previous, current, boxes, min_score=MIN_SCORE):
+    # Moves every pixel box (x, y, w, h) of `previous` to its match in `current`.
+    # Boxes whose best match scores below `min_score` stay where they were.
+    # Returns (boxes array, scores array with NaN for unmatched boxes).
+    previous = np.asarray(previous, dtype=np.float64)
+    current = np.asarray(current, dtype=np.float64)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    moved = boxes.copy()
+    scores = np.full(len(boxes), np.nan)
+    for row, box in enumerate(boxes.tolist()):
+        tracked, score = track_box(previous, current, box)
+        if score is not None:
+            scores[row] = score
+            if score >= min_score:
+                moved[row] = tracked
+    return moved, scores
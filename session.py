@@ -0,0 +1,371 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from dataset import ImageList, dataset_key
+from persistence import atomic_write
+
+###############################################################################
+#                                Session Files                                #
+###############################################################################
+# One append-only log per dataset that remembers where annotation stopped:
+# the image list, the current image and view transform, the labels used and
+# the status of every image. Nothing here imports Qt. A session is restored by
+# replaying the log, which never lists the dataset folder or reads a sidecar:
+# the image list is stored in ImageList's own packed form, one compressed
+# record per chunk. The file starts with SESSION_MAGIC, followed by records of
+#   kind (u1), payload length (u4), CRC-32 of the payload (u4), payload
+# A torn record at the end (a crash mid-append) ends the log and is cut off
+# before the next append. Long logs are compacted into a snapshot.
+SESSION_MAGIC = b"IATS\x01\0\0\0"
+SESSION_RECORD = struct.Struct("<BII")
+SESSION_EXTENSION = ".session"
+
+# Record kinds and their payloads (little-endian).
+ROOT = 1         # folder flag (u1), UTF-8 dataset root
+CHUNK = 2        # zlib: directory and text byte lengths, image count (u4 each), directory,
+                 # joined basenames (UTF-8), count + 1 offsets (u4), has-sidecar flags (u1 each)
+COMPLETE = 3     # empty: every chunk of the image list has been recorded
+STATUSES = 4     # zlib: one status byte per image
+STATUS = 5       # row (u8), status (u1)
+ANNOTATED = 6    # row (u8), has-sidecar flag (u1)
+POSITION = 7     # row (u8), view flag (u1), view transform m11, m12, m21, m22 and scene center x, y (f8 each)
+LABEL = 8        # UTF-8 label, most recent last
+
+POSITION_RECORD = struct.Struct("<QB6d")
+ROW_RECORD = struct.Struct("<QB")
+CHUNK_HEADER = struct.Struct("<III")
+
+UNTOUCHED, IN_PROGRESS, DONE, SKIPPED = range(4)
+STATUS_NAMES = ("untouched", "in-progress", "done", "skipped")
+
+LABEL_HISTORY = 64
+# Appended records after which the log is rewritten as a snapshot.
+COMPACT_AFTER = 100000
+
+
+def session_cache_root() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "image-annotation-tool", "sessions")
+
+
+def session_filename(image_list, folder=True, cache_root=None) -> str:
+    # Sessions of opened folders and of images picked by hand under the same
+    # directory are kept apart, so picking a few images does not reset a folder.
+    key = dataset_key(image_list) + ("" if folder else "|picked")
+    root = cache_root or session_cache_root()
+    return os.path.join(root, hashlib.sha1(key.encode("utf-8")).hexdigest() + SESSION_EXTENSION)
+
+
+def last_session(cache_root=None):
+    # Filename of the session that was open last, or None.
+    try:
+        with open(os.path.join(cache_root or session_cache_root(), "last"), "r") as f:
+            filename = f.read().strip()
+    except OSError:
+        return None
+    return filename if filename and os.path.exists(filename) else None
+
+
+def set_last_session(filename, cache_root=None):
+    atomic_write(os.path.join(cache_root or session_cache_root(), "last"), filename)
+
+
+def encode_chunk(directory, text, offsets, annotated) -> bytes:
+    directory = directory.encode("utf-8")
+    text = text.encode("utf-8")
+    if offsets.itemsize != 4 or sys.byteorder != "little":
+        offsets = array("I", offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+    return zlib.compress(b"".join((
+        CHUNK_HEADER.pack(len(directory), len(text), len(offsets) - 1),
+        directory, text, offsets.tobytes(), bytes(annotated)
+    )), 1)
+
+
+def decode_chunk(payload):
+    # (directory, text, offsets, flags) of a CHUNK payload; offsets index the decoded text.
+    data = zlib.decompress(payload)
+    directory_size, text_size, count = CHUNK_HEADER.unpack_from(data)
+    position = CHUNK_HEADER.size
+    directory = data[position:position + directory_size].decode("utf-8")
+    position += directory_size
+    text = data[position:position + text_size].decode("utf-8")
+    position += text_size
+    offsets = array("I")
+    offsets.frombytes(data[position:position + 4 * (count + 1)])
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    position += 4 * (count + 1)
+    annotated = data[position:position + count]
+    if len(offsets) != count + 1 or len(annotated) != count:
+        raise ValueError("truncated image chunk")
+    return directory, text, offsets, annotated
+
+
+def frame(kind, payload=b"") -> bytes:
+    return SESSION_RECORD.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+###############################################################################
+#                                Session Class                                #
+###############################################################################
+class Session:
+    # State of one dataset's session. `image_list` is the ImageList the GUI
+    # shows; the GUI extends it while a folder is being scanned and calls
+    # add_chunks() afterwards. `status` holds one STATUS_NAMES index per image,
+    # `view` is None (fit to window) or the saved view transform, and `labels`
+    # is the label history, most recent last.
+    def __init__(self, filename, image_list, folder=True):
+        self.filename = filename
+        self.image_list = image_list
+        self.folder = folder
+        self.complete = False
+        self.status = bytearray(len(image_list))
+        self.position = 0
+        self.view = None
+        self.labels = []
+        self._chunks = 0
+        self._file = None
+        self._appended = 0
+
+    @classmethod
+    def create(cls, filename, image_list, folder=True, complete=False):
+        # Starts a new session file holding the chunks `image_list` has so far.
+        session = cls(filename, image_list, folder)
+        session.complete = complete
+        session.compact()
+        return session
+
+    @classmethod
+    def load(cls, filename, readonly=False):
+        # Replays a session file. Returns None if there is none or it is not a session.
+        # A `readonly` session leaves the file as it is (no cut tail, no compaction)
+        # and records nothing, so it can be read while the GUI appends to it.
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(SESSION_MAGIC):
+            return None
+        session = None
+        position = len(SESSION_MAGIC)
+        records = 0
+        while position + SESSION_RECORD.size <= len(data):
+            kind, size, crc = SESSION_RECORD.unpack_from(data, position)
+            start = position + SESSION_RECORD.size
+            payload = data[start:start + size]
+            if len(payload) != size or zlib.crc32(payload) != crc:
+                break
+            try:
+                if kind == ROOT:
+                    session = cls(filename, ImageList(payload[1:].decode("utf-8")), bool(payload[0]))
+                elif session is None:
+                    break
+                else:
+                    session._replay(kind, payload)
+            except (ValueError, UnicodeDecodeError, struct.error, zlib.error):
+                break
+            position = start + size
+            records += 1
+        if session is None:
+            return None
+        if len(session.status) < len(session.image_list):
+            session.status.extend(bytes(len(session.image_list) - len(session.status)))
+        session.position = min(session.position, max(len(session.image_list) - 1, 0))
+        if readonly:
+            return session
+        if records > COMPACT_AFTER:
+            session.compact()
+        else:
+            # Cut off a torn tail, then keep appending after the last good record.
+            session._file = open(filename, "r+b")
+            session._file.truncate(position)
+            session._file.seek(position)
+        return session
+
+    def _replay(self, kind, payload):
+        if kind == CHUNK:
+            self.image_list.extend_packed(*decode_chunk(payload))
+            self._chunks += 1
+        elif kind == COMPLETE:
+            self.complete = True
+        elif kind == STATUSES:
+            self.status = bytearray(zlib.decompress(payload))
+        elif kind == STATUS or kind == ANNOTATED:
+            row, value = ROW_RECORD.unpack(payload)
+            if kind == STATUS:
+                if row >= len(self.status):
+                    self.status.extend(bytes(row + 1 - len(self.status)))
+                self.status[row] = value
+            elif row < len(self.image_list):
+                self.image_list.set_annotated(row, value)
+        elif kind == POSITION:
+            row, has_view, *view = POSITION_RECORD.unpack(payload)
+            self.position = row
+            self.view = tuple(view) if has_view else None
+        elif kind == LABEL:
+            self._remember(payload.decode("utf-8"))
+
+    def _append(self, kind, payload=b""):
+        if self._file is None:
+            return
+        try:
+            self._file.write(frame(kind, payload))
+            self._file.flush()
+        except OSError as e:
+            print(f"Session not saved: {e}", file=sys.stderr)
+            self._file = None
+            return
+        self._appended += 1
+        if self._appended > COMPACT_AFTER:
+            self.compact()
+
+    def add_chunks(self):
+        # Records the chunks appended to `image_list` since the last call.
+        for chunk in self.image_list.chunks(self._chunks):
+            self._append(CHUNK, encode_chunk(*chunk))
+            self._chunks += 1
+        if len(self.status) < len(self.image_list):
+            self.status.extend(bytes(len(self.image_list) - len(self.status)))
+
+    def mark_complete(self):
+        self.add_chunks()
+        if not self.complete:
+            self.complete = True
+            self._append(COMPLETE)
+
+    def set_status(self, row, status):
+        if row < len(self.status) and self.status[row] != status:
+            self.status[row] = status
+            self._append(STATUS, ROW_RECORD.pack(row, status))
+
+    def set_annotated(self, row, annotated=True):
+        # Mirrors ImageList.set_annotated (called by the GUI), so flags survive without a rescan.
+        self._append(ANNOTATED, ROW_RECORD.pack(row, 1 if annotated else 0))
+
+    def set_position(self, row, view=None):
+        if row == self.position and view == self.view:
+            return
+        self.position = row
+        self.view = tuple(view) if view is not None else None
+        self._append(POSITION, POSITION_RECORD.pack(row, view is not None, *(view or (0.0,) * 6)))
+
+    def use_label(self, label):
+        if label and (not self.labels or self.labels[-1] != label):
+            self._remember(label)
+            self._append(LABEL, label.encode("utf-8"))
+
+    def _remember(self, label):
+        if label in self.labels:
+            self.labels.remove(label)
+        self.labels.append(label)
+        del self.labels[:-LABEL_HISTORY]
+
+    def counts(self) -> dict:
+        return {name: self.status.count(status) for status, name in enumerate(STATUS_NAMES)}
+
+    def compact(self):
+        # Rewrites the log as one snapshot of the current state and keeps appending to it.
+        self.close()
+        records = [frame(ROOT, bytes([self.folder]) + self.image_list.root.encode("utf-8"))]
+        records.extend(frame(CHUNK, encode_chunk(*chunk)) for chunk in self.image_list.chunks())
+        self._chunks = len(records) - 1
+        if self.complete:
+            records.append(frame(COMPLETE))
+        if self.status.count(UNTOUCHED) != len(self.status):
+            records.append(frame(STATUSES, zlib.compress(bytes(self.status), 1)))
+        records.extend(frame(LABEL, label.encode("utf-8")) for label in self.labels)
+        view = self.view
+        records.append(frame(POSITION, POSITION_RECORD.pack(self.position, view is not None, *(view or (0.0,) * 6))))
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            atomic_write(self.filename, SESSION_MAGIC + b"".join(records))
+            self._file = open(self.filename, "ab")
+        except OSError as e:
+            print(f"Session not saved: {e}", file=sys.stderr)
+            return
+        self._appended = 0
+
+    def rebase(self, image_list):
+        # Moves the session to a new listing of the dataset (after a rescan, or
+        # a new selection), carrying statuses and the position over by path.
+        old_list, old_status = self.image_list, self.status
+        current = old_list[self.position] if self.position < len(old_list) else None
+        self.image_list = image_list
+        self.status = bytearray(len(image_list))
+        rows = [row for row in range(min(len(old_status), len(old_list))) if old_status[row] != UNTOUCHED]
+        if len(rows) < 1000:
+            for row in rows:
+                try:
+                    self.status[image_list.index(old_list[row])] = old_status[row]
+                except ValueError:
+                    pass
+        else:
+            # One pass over the new list beats a lookup per image once many are touched.
+            wanted = {old_list[row]: old_status[row] for row in rows}
+            for row, path in enumerate(image_list):
+                status = wanted.get(path)
+                if status is not None:
+                    self.status[row] = status
+        try:
+            self.position = image_list.index(current) if current is not None else 0
+        except ValueError:
+            self.position = min(self.position, max(len(image_list) - 1, 0))
+            self.view = None
+        self.compact()
+
+    def close(self, compact=False):
+        # With `compact`, a log that grew since it was opened is first rewritten as a snapshot.
+        if compact and self._appended:
+            self.compact()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+###############################################################################
+#                                Command Line                                 #
+###############################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="session",
+        description="Show the saved annotation session of a folder: where it stopped and how many "
+                    "images are untouched, in progress, done or skipped."
+    )
+    parser.add_argument("folder", help="dataset folder that was opened in the annotation tool")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    session = Session.load(session_filename(ImageList(args.folder)), readonly=True)
+    if session is None:
+        print(f"No session for {args.folder}", file=sys.stderr)
+        return 1
+    image_list = session.image_list
+    summary = {
+        "root": image_list.root,
+        "images": len(image_list),
+        "complete": session.complete,
+        "position": session.position,
+        "current": image_list[session.position] if len(image_list) else None,
+        "status": session.counts(),
+        "labels": session.labels[::-1],
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{summary['root']}: {summary['images']} images" + ("" if session.complete else " (listing incomplete)"))
+        if summary["current"] is not None:
+            print(f"  current: {session.position + 1} {os.path.relpath(summary['current'], image_list.root)}")
+        print("  " + ", ".join(f"{count} {name}" for name, count in summary["status"].items()))
+        if session.labels:
+            print("  recent labels: " + ", ".join(summary["labels"][:10]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
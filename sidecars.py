@@ -0,0 +1,286 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from annotations import (
+    BINARY_EXTENSION, BOX_RECORD, TXT_EXTENSION, decode_sidecar, encode_sidecar, find_sidecar, fits_float32,
+    pack_records, pack_string_table, read_sidecar_content, unpack_string_table
+)
+from convert import batched, bounded_map, iter_images
+from persistence import atomic_write
+
+###############################################################################
+#                               Packed Datasets                               #
+###############################################################################
+# One file holding the boxes of a whole dataset, for training dataloaders and
+# QA scripts that read millions of boxes. Nothing here imports Qt. The file is
+# memory-mapped and never parsed: geometry and label ids are strided views of
+# the record section. All fields are little-endian; sections are 8-byte aligned:
+#   header   64 bytes: b"IATP", version (u2), flags (u2), image, record and
+#            label counts (u8 each), offsets of the index, record, label and
+#            path sections (u8 each)
+#   records  record count x 20 bytes, the records of binary sidecars (BOX_RECORD)
+#   index    image count x 16 bytes: first record (u8), box count (u4), flags (u4)
+#   labels   label count + 1 offsets (u8) into UTF-8 label bytes
+#   paths    image count + 1 offsets (u8) into UTF-8 image paths, relative to
+#            the packed folder and separated by "/"
+# Index flag 1 marks an image that has a sidecar, so images reviewed and left
+# empty survive a round trip through the packed file. Geometry is float32, so
+# TXT values with more than about seven significant digits are rounded.
+PACK_MAGIC = b"IATP"
+PACK_VERSION = 1
+PACK_EXTENSION = ".boxpack"
+PACK_HEADER = np.dtype([
+    ("magic", "S4"), ("version", "<u2"), ("flags", "<u2"),
+    ("images", "<u8"), ("records", "<u8"), ("labels", "<u8"),
+    ("index_offset", "<u8"), ("records_offset", "<u8"), ("labels_offset", "<u8"), ("paths_offset", "<u8"),
+])
+PACK_INDEX = np.dtype([("start", "<u8"), ("count", "<u4"), ("flags", "<u4")])
+HAS_SIDECAR = 1
+
+
+def read_boxes(image_path):
+    # Worker: (image_path, has sidecar, labels, float32 normalized geometry, error,
+    # whether the geometry had to be rounded to fit float32).
+    sidecar = find_sidecar(image_path)
+    if sidecar is None:
+        return image_path, False, [], None, None, False
+    try:
+        labels, normalized = decode_sidecar(read_sidecar_content(sidecar))
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        return image_path, False, [], None, f"{sidecar}: {e}", False
+    return image_path, True, labels, np.asarray(normalized, dtype=np.float32), None, not fits_float32(normalized)
+
+
+def read_boxes_batch(image_paths):
+    # Worker entry point; batches keep inter-process traffic low.
+    return [read_boxes(path) for path in image_paths]
+
+
+def align(f):
+    # Pads the file with zeros up to the next multiple of 8 bytes.
+    f.write(b"\0" * (-f.tell() % 8))
+    return f.tell()
+
+
+def pack_dataset(source, output, workers=None, batch_size=64, window=32) -> dict:
+    # Writes the boxes of every image under `source` to the packed file `output`.
+    # Records are streamed to the file as sidecars are read; only the index,
+    # labels and paths are kept in memory. Returns counts for a summary;
+    # "rounded" counts images whose TXT geometry did not fit float32 exactly.
+    stats = {"images": 0, "annotated": 0, "boxes": 0, "errors": 0, "rounded": 0}
+    label_ids = {}
+    paths = []
+    index = []
+    tmp_path = output + ".tmp"
+    with open(tmp_path, "wb") as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        f.write(b"\0" * PACK_HEADER.itemsize)
+        records_offset = f.tell()
+        record_count = 0
+        for batch in bounded_map(executor, read_boxes_batch, batched(iter_images(source), batch_size), window):
+            for image_path, annotated, labels, normalized, error, rounded in batch:
+                if error is not None:
+                    print(f"Skipping {error}", file=sys.stderr)
+                    stats["errors"] += 1
+                stats["images"] += 1
+                paths.append(os.path.relpath(image_path, source).replace(os.sep, "/"))
+                index.append((record_count, len(labels), HAS_SIDECAR if annotated else 0))
+                stats["rounded"] += rounded
+                if annotated:
+                    records = pack_records(labels, normalized, label_ids)
+                    f.write(records.tobytes())
+                    record_count += len(records)
+                    stats["annotated"] += 1
+        stats["boxes"] = record_count
+        index_offset = align(f)
+        f.write(np.array(index, dtype=PACK_INDEX).tobytes())
+        labels_offset = align(f)
+        f.write(pack_string_table(label_ids, "<u8"))
+        paths_offset = align(f)
+        f.write(pack_string_table(paths, "<u8"))
+        f.seek(0)
+        f.write(np.array([(
+            PACK_MAGIC, PACK_VERSION, 0, len(paths), record_count, len(label_ids),
+            index_offset, records_offset, labels_offset, paths_offset
+        )], dtype=PACK_HEADER).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output)
+    return stats
+
+###############################################################################
+#                               BoxPack Class                                 #
+###############################################################################
+class BoxPack:
+    # Read-only, memory-mapped view of a packed dataset file. `geometry` is an
+    # (records, 4) float32 array of normalized cx, cy, w, h and `label_ids`
+    # indexes `labels`; the boxes of image i are rows
+    # index["start"][i] : index["start"][i] + index["count"][i].
+    def __init__(self, filename):
+        self.filename = filename
+        self._data = np.memmap(filename, dtype=np.uint8, mode="r")
+        if len(self._data) < PACK_HEADER.itemsize:
+            raise ValueError(f"{filename}: not a packed dataset")
+        header = self._data[:PACK_HEADER.itemsize].view(PACK_HEADER)[0]
+        if header["magic"] != PACK_MAGIC or header["version"] != PACK_VERSION:
+            raise ValueError(f"{filename}: not a packed dataset (or an unsupported version)")
+        image_count = int(header["images"])
+        record_count = int(header["records"])
+        records_offset = int(header["records_offset"])
+        index_offset = int(header["index_offset"])
+        if index_offset + image_count * PACK_INDEX.itemsize > len(self._data):
+            raise ValueError(f"{filename}: packed dataset is truncated")
+        self.index = self._data[index_offset:index_offset + image_count * PACK_INDEX.itemsize].view(PACK_INDEX)
+        self.records = self._data[records_offset:records_offset + record_count * BOX_RECORD.itemsize].view(BOX_RECORD)
+        # Strided views of the geometry and label fields of every record.
+        self.geometry = np.ndarray((record_count, 4), dtype="<f4", buffer=self.records,
+                                   strides=(BOX_RECORD.itemsize, 4))
+        self.label_ids = self.records["label"]
+        self.labels = unpack_string_table(self._data, int(header["labels"]), int(header["labels_offset"]), "<u8")
+        self._paths_offset = int(header["paths_offset"])
+        self._path_offsets = np.frombuffer(self._data, dtype="<u8", count=image_count + 1, offset=self._paths_offset)
+        self._path_rows = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def path(self, i) -> str:
+        # Path of image `i`, relative to the packed folder.
+        start = self._paths_offset + (len(self.index) + 1) * 8
+        a, b = int(self._path_offsets[i]), int(self._path_offsets[i + 1])
+        return bytes(self._data[start + a:start + b]).decode("utf-8")
+
+    def find(self, path):
+        # Row of a relative image path, or None.
+        if self._path_rows is None:
+            self._path_rows = {self.path(i): i for i in range(len(self))}
+        return self._path_rows.get(path.replace(os.sep, "/"))
+
+    def has_sidecar(self, i) -> bool:
+        return bool(self.index["flags"][i] & HAS_SIDECAR)
+
+    def rows(self, i) -> slice:
+        start = int(self.index["start"][i])
+        return slice(start, start + int(self.index["count"][i]))
+
+    def boxes(self, i):
+        # (labels, float32 normalized geometry view) of image `i`.
+        rows = self.rows(i)
+        labels = self.labels
+        return [labels[label_id] for label_id in self.label_ids[rows].tolist()], self.geometry[rows]
+
+    def close(self):
+        # The file stays mapped until views handed out by boxes() are gone too.
+        self.geometry = self.label_ids = self.records = self.index = self._path_offsets = None
+        self._data = None
+
+###############################################################################
+#                                 Conversions                                 #
+###############################################################################
+def unpack_dataset(pack_path, output, binary=False) -> int:
+    # Writes a sidecar for every packed image that had one, under `output`.
+    # Returns the number of files written.
+    pack = BoxPack(pack_path)
+    extension = BINARY_EXTENSION if binary else TXT_EXTENSION
+    written = 0
+    try:
+        for i in range(len(pack)):
+            if not pack.has_sidecar(i):
+                continue
+            path = os.path.join(output, os.path.splitext(pack.path(i))[0] + extension)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, encode_sidecar(path, *pack.boxes(i)))
+            written += 1
+    finally:
+        pack.close()
+    return written
+
+
+def convert_sidecar(image_path, extension, keep=False, lossy=False):
+    # Worker: rewrites the image's sidecar in the format of `extension`. The
+    # old sidecar is removed unless `keep`. TXT geometry that float32 would
+    # round is left alone unless `lossy`. Returns (image_path, converted,
+    # error, refused), where `refused` is a message for a sidecar left alone.
+    sidecar = find_sidecar(image_path)
+    if sidecar is None or sidecar.endswith(extension):
+        return image_path, False, None, None
+    try:
+        labels, normalized = decode_sidecar(read_sidecar_content(sidecar))
+        if extension == BINARY_EXTENSION and not lossy and not fits_float32(normalized):
+            return image_path, False, None, f"{sidecar}: geometry has more digits than float32 keeps"
+        target = os.path.splitext(image_path)[0] + extension
+        atomic_write(target, encode_sidecar(target, labels, normalized))
+        if not keep:
+            os.unlink(sidecar)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        return image_path, False, f"{sidecar}: {e}", None
+    return image_path, True, None, None
+
+
+def convert_sidecars(image_paths, **options):
+    return [convert_sidecar(path, **options) for path in image_paths]
+
+###############################################################################
+#                                Command Line                                 #
+###############################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sidecars",
+        description="Convert annotations between TXT sidecars, binary .box sidecars and one packed "
+                    ".boxpack file per dataset, without Qt."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="write the boxes of a folder to one packed file")
+    pack.add_argument("source", help="directory tree containing images and their .txt or .box files")
+    pack.add_argument("output", help="packed file to write (.boxpack)")
+    pack.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    unpack = commands.add_parser("unpack", help="write the sidecars stored in a packed file")
+    unpack.add_argument("pack", help="packed file (.boxpack)")
+    unpack.add_argument("output", help="folder the images were packed from (sidecars are written next to them)")
+    unpack.add_argument("--binary", action="store_true", help="write .box instead of .txt sidecars")
+    convert = commands.add_parser("convert", help="convert the sidecars of a folder in place")
+    convert.add_argument("source", help="directory tree containing images and their .txt or .box files")
+    convert.add_argument("--to", choices=("txt", "box"), required=True, help="sidecar format to write")
+    convert.add_argument("--keep", action="store_true", help="keep the old sidecars (.box ones take precedence)")
+    convert.add_argument("--lossy", action="store_true",
+                         help="also convert TXT files whose geometry float32 would round (default: leave them)")
+    convert.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        stats = pack_dataset(args.source, args.output, args.workers)
+        print(f"Packed {stats['images']} images, {stats['annotated']} with sidecars, {stats['boxes']} boxes "
+              f"({stats['errors']} unreadable)", file=sys.stderr)
+        if stats["rounded"]:
+            print(f"Warning: geometry of {stats['rounded']} images was rounded to float32", file=sys.stderr)
+        return 1 if stats["errors"] else 0
+    if args.command == "unpack":
+        written = unpack_dataset(args.pack, args.output, args.binary)
+        print(f"Wrote {written} sidecars", file=sys.stderr)
+        return 0
+    extension = BINARY_EXTENSION if args.to == "box" else TXT_EXTENSION
+    check = partial(convert_sidecars, extension=extension, keep=args.keep, lossy=args.lossy)
+    converted = errors = refused = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for batch in bounded_map(executor, check, batched(iter_images(args.source), 64), 32):
+            for _, done, error, reason in batch:
+                converted += done
+                if error is not None:
+                    errors += 1
+                    print(f"Skipping {error}", file=sys.stderr)
+                if reason is not None:
+                    refused += 1
+                    print(f"Keeping {reason}", file=sys.stderr)
+    print(f"Converted {converted} sidecars ({errors} unreadable)", file=sys.stderr)
+    if refused:
+        print(f"Kept {refused} TXT sidecars whose geometry float32 would round (use --lossy to convert them)",
+              file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import numpy as np
+
+###############################################################################
+#                               GridIndex Class                               #
+###############################################################################
+class GridIndex:
+    # Uniform grid over (x, y, w, h) boxes for fast point and rectangle queries.
+    # Each box is grown by `margin` on every side and registered in every cell
+    # it overlaps; the index is rebuilt from scratch when the boxes change.
+    MAX_ENTRIES_PER_BOX = 8
+
+    def __init__(self, boxes, margin=0.0, cell_size=None):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.margin = margin
+        self.bounds = np.empty((len(boxes), 4), dtype=np.float64)
+        self.bounds[:, 0] = boxes[:, 0] - margin
+        self.bounds[:, 1] = boxes[:, 1] - margin
+        self.bounds[:, 2] = boxes[:, 0] + boxes[:, 2] + margin
+        self.bounds[:, 3] = boxes[:, 1] + boxes[:, 3] + margin
+        self._cells = np.empty(0, dtype=np.intp)
+        self._entries = np.empty(0, dtype=np.intp)
+        self.cols = 0
+        self.rows = 0
+        if not len(boxes):
+            self.origin = (0.0, 0.0)
+            self.cell_size = 1.0
+            return
+        self.origin = (float(self.bounds[:, 0].min()), float(self.bounds[:, 1].min()))
+        if cell_size is None:
+            # Roughly one median-sized box per cell keeps the buckets short.
+            sizes = np.maximum(self.bounds[:, 2] - self.bounds[:, 0], self.bounds[:, 3] - self.bounds[:, 1])
+            cell_size = float(np.median(sizes))
+        self.cell_size = max(cell_size, 1.0)
+        while not self._build():
+            self.cell_size *= 2
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def _cell_range(self, x0, y0, x1, y1):
+        ox, oy = self.origin
+        cs = self.cell_size
+        return (
+            np.floor((x0 - ox) / cs).astype(np.intp), np.floor((y0 - oy) / cs).astype(np.intp),
+            np.floor((x1 - ox) / cs).astype(np.intp), np.floor((y1 - oy) / cs).astype(np.intp),
+        )
+
+    def _build(self) -> bool:
+        b = self.bounds
+        ix0, iy0, ix1, iy1 = self._cell_range(b[:, 0], b[:, 1], b[:, 2], b[:, 3])
+        span_x = ix1 - ix0 + 1
+        counts = span_x * (iy1 - iy0 + 1)
+        total = int(counts.sum())
+        if total > self.MAX_ENTRIES_PER_BOX * len(b) + 1024:
+            return False
+        self.cols = int(ix1.max()) + 1
+        self.rows = int(iy1.max()) + 1
+        box = np.repeat(np.arange(len(b)), counts)
+        k = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = (iy0[box] + k // span_x[box]) * self.cols + ix0[box] + k % span_x[box]
+        order = np.argsort(cells, kind="stable")
+        self._cells = cells[order]
+        self._entries = box[order]
+        return True
+
+    def query_point(self, x, y) -> np.ndarray:
+        # Returns the ascending rows whose (grown) box contains the point.
+        if not len(self.bounds):
+            return self._entries
+        ix, iy, _, _ = self._cell_range(x, y, x, y)
+        if not (0 <= ix < self.cols and 0 <= iy < self.rows):
+            return self._entries[:0]
+        cell = iy * self.cols + ix
+        lo, hi = np.searchsorted(self._cells, [cell, cell + 1])
+        candidates = self._entries[lo:hi]
+        b = self.bounds[candidates]
+        inside = (b[:, 0] <= x) & (x <= b[:, 2]) & (b[:, 1] <= y) & (y <= b[:, 3])
+        return candidates[inside]
+
+    def query_rect(self, x0, y0, x1, y1) -> np.ndarray:
+        # Returns the ascending rows whose (grown) box intersects the rectangle.
+        if not len(self.bounds):
+            return self._entries
+        cx0, cy0, cx1, cy1 = self._cell_range(x0, y0, x1, y1)
+        cx0, cy0 = max(cx0, 0), max(cy0, 0)
+        cx1, cy1 = min(cx1, self.cols - 1), min(cy1, self.rows - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return self._entries[:0]
+        b = self.bounds
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) * 4 >= len(b):
+            # Large areas: one vectorized pass over every box beats gathering cells.
+            hit = (b[:, 0] <= x1) & (x0 <= b[:, 2]) & (b[:, 1] <= y1) & (y0 <= b[:, 3])
+            return np.flatnonzero(hit)
+        parts = []
+        for cy in range(cy0, cy1 + 1):
+            lo, hi = np.searchsorted(self._cells, [cy * self.cols + cx0, cy * self.cols + cx1 + 1])
+            parts.append(self._entries[lo:hi])
+        candidates = np.unique(np.concatenate(parts))
+        c = b[candidates]
+        hit = (c[:, 0] <= x1) & (x0 <= c[:, 2]) & (c[:, 1] <= y1) & (y0 <= c[:, 3])
+        return candidates[hit]
@@ -0,0 +1,227 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+###############################################################################
+#                                  Histograms                                 #
+###############################################################################
+# Opt-in latency telemetry for the hot paths. Nothing here imports Qt. While
+# disabled, every entry point returns after a single attribute check, so the
+# instrumentation can stay compiled into production builds.
+ENABLE_VAR = "ANNOTATION_TOOL_TELEMETRY"
+DUMP_DIR_VAR = "ANNOTATION_TOOL_TELEMETRY_DIR"
+# Histogram buckets are log-scaled: SUBBUCKETS per power of two of microseconds.
+SUBBUCKETS = 8
+BUCKETS = 40 * SUBBUCKETS
+
+
+class Histogram:
+    # Fixed-size log-scale latency histogram; recording is O(1) and allocation-free.
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bucket_index(seconds)] += 1
+
+    def percentile(self, q) -> float:
+        # Upper edge of the bucket holding the q-th percentile (seconds), capped at the maximum.
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(bucket_upper(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        # Milliseconds, for display and JSON dumps.
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000,
+            "min_ms": self.min * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+def bucket_index(seconds) -> int:
+    micros = seconds * 1e6
+    if micros < 1:
+        return 0
+    mantissa, exponent = math.frexp(micros)
+    return min(exponent * SUBBUCKETS + int((mantissa - 0.5) * 2 * SUBBUCKETS), BUCKETS - 1)
+
+
+def bucket_upper(index) -> float:
+    exponent, sub = divmod(index + 1, SUBBUCKETS)
+    return math.ldexp(0.5 + sub / (2 * SUBBUCKETS), exponent) / 1e6
+
+###############################################################################
+#                               Telemetry Class                               #
+###############################################################################
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("telemetry", "name", "start")
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.telemetry.record(self.name, time.perf_counter() - self.start, self.start)
+        return False
+
+
+class Telemetry:
+    # Named latency histograms and counters, plus a bounded buffer of trace
+    # events for Chrome's trace viewer (chrome://tracing, Perfetto). Safe to
+    # record from worker threads.
+    def __init__(self, enabled=False, trace_capacity=200000, dump_dir=None):
+        self.enabled = enabled
+        self.dump_dir = dump_dir
+        self.histograms = {}
+        self.counters = {}
+        self.trace = deque(maxlen=trace_capacity)
+        self.thread_names = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls):
+        # ANNOTATION_TOOL_TELEMETRY=1 enables recording; ANNOTATION_TOOL_TELEMETRY_DIR
+        # also enables it and dumps JSON and trace files there on exit.
+        dump_dir = os.environ.get(DUMP_DIR_VAR) or None
+        enabled = os.environ.get(ENABLE_VAR, "").lower() not in ("", "0", "false", "no")
+        return cls(enabled=enabled or dump_dir is not None, dump_dir=dump_dir)
+
+    def span(self, name):
+        # Context manager timing its body under `name`.
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds, start=None):
+        # Adds one latency sample; `start` (a perf_counter value) places it in the trace.
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+            if start is not None:
+                self.trace.append((name, start, seconds, thread.ident))
+                if thread.ident not in self.thread_names:
+                    self.thread_names[thread.ident] = thread.name
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.trace.clear()
+            self.started = time.perf_counter()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "uptime_s": time.perf_counter() - self.started,
+                "histograms": {name: h.summary() for name, h in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def chrome_trace(self) -> dict:
+        # Complete ("X") events in the Trace Event Format, timestamps in microseconds.
+        pid = os.getpid()
+        with self._lock:
+            events = [
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self.thread_names.items()
+            ]
+            events.extend(
+                {"name": name, "ph": "X", "pid": pid, "tid": tid,
+                 "ts": (start - self.started) * 1e6, "dur": seconds * 1e6}
+                for name, start, seconds, tid in self.trace
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def dump(self, directory=None) -> list:
+        # Writes telemetry-<time>.json and trace-<time>.json; returns their paths.
+        directory = directory or self.dump_dir or os.getcwd()
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        paths = [
+            os.path.join(directory, f"telemetry-{stamp}.json"),
+            os.path.join(directory, f"trace-{stamp}.json"),
+        ]
+        self.write_json(paths[0])
+        self.write_chrome_trace(paths[1])
+        return paths
+
+
+TELEMETRY = Telemetry.from_environment()
+
+
+def timed(name):
+    # Decorator recording every call of the function in TELEMETRY under `name`.
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TELEMETRY.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                TELEMETRY.record(name, time.perf_counter() - start, start)
+        return wrapper
+    return decorate
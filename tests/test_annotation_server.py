@@ -0,0 +1,187 @@
+import os
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from annotation_server import (
+    AnnotationDatabase, AnnotationService, SyncClient, checked_path, make_server,
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = AnnotationDatabase(str(tmp_path / "db.sqlite"))
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "dataset"
+    root.mkdir()
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        (root / name).write_bytes(b"")
+    return str(root)
+
+
+@pytest.fixture
+def server(root, tmp_path):
+    service = AnnotationService(root, AnnotationDatabase(str(tmp_path / "server.sqlite")))
+    server = make_server(service, "127.0.0.1:0")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def box_op(box_id, base, label="cat", box=(0.5, 0.5, 0.2, 0.2), path="a.jpg"):
+    return {"path": path, "id": box_id, "base": base, "label": label, "box": list(box)}
+
+###############################################################################
+#                              Annotation Database                            #
+###############################################################################
+def test_apply_refuses_stale_versions(database):
+    results, changed = database.apply("ann1", [box_op(1, 0), box_op(2, 0)], 60)
+    assert results == [{"version": 1}, {"version": 1}]
+    assert changed == {"a.jpg"}
+    # ann2 moves box 1 on; ann1's edit based on version 1 is refused with the current box.
+    assert database.apply("ann2", [box_op(1, 1, "dog")], 60)[0] == [{"version": 2}]
+    results, _ = database.apply("ann1", [box_op(1, 1, "bird"), box_op(2, 1, "bird")], 60)
+    assert results[0] == {"conflict": [1, 2, "dog", 0.5, 0.5, 0.2, 0.2]}
+    assert results[1] == {"version": 2}
+    # Creating a box that exists, and deleting one that is gone, conflict too.
+    assert database.apply("ann1", [box_op(2, 0)], 60)[0][0]["conflict"][2] == "bird"
+    assert database.apply("ann1", [{"path": "a.jpg", "id": 3, "base": 1, "delete": True}], 60)[0] == [
+        {"conflict": None}]
+    assert database.apply("ann1", [{"path": "a.jpg", "id": 2, "base": 2, "delete": True}], 60)[0] == [
+        {"version": 0}]
+    labels, normalized = database.boxes("a.jpg")
+    assert labels == ["dog"] and normalized.shape == (1, 4)
+
+
+def test_lease_is_exclusive(database):
+    assert database.lease("ann1", "a.jpg", 60) == "ann1"
+    assert database.lease("ann2", "a.jpg", 60) == "ann1"
+    assert database.lease("ann1", "b.jpg", 60) == "ann1"
+    # Taking b.jpg dropped ann1's lease on a.jpg.
+    assert database.lease("ann2", "a.jpg", 60) == "ann2"
+    assert database.fetch(["a.jpg"])[0]["owner"] == "ann2"
+
+
+def test_expired_lease_can_be_taken(database):
+    assert database.lease("ann1", "a.jpg", -1) == "ann1"
+    assert database.lease("ann2", "a.jpg", 60) == "ann2"
+
+
+def test_lease_next_skips_leased_and_done_images(database):
+    for path in ("a.jpg", "b.jpg", "c.jpg", "d.jpg"):
+        database.release("nobody", [path])
+    database.release("nobody", ["b.jpg"], done=True)
+    assert database.lease("ann2", "c.jpg", 60) == "ann2"
+    assert database.lease_next("ann1", "a.jpg", 60) == "d.jpg"
+    # Wraps around, and never hands out the same image to two annotators.
+    assert database.lease_next("ann1", "d.jpg", 60) == "a.jpg"
+    # Moving on gives up the annotator's previous lease.
+    assert database.lease_next("ann2", "c.jpg", 60) == "d.jpg"
+    assert database.lease_next("ann3", "a.jpg", 60) == "c.jpg"
+    assert database.lease_next("ann4", "a.jpg", 60) is None
+    database.release("ann1")
+    assert database.lease_next("ann4", "b.jpg", 60) == "a.jpg"
+
+###############################################################################
+#                                 Path Checks                                 #
+###############################################################################
+def test_checked_path_accepts_images_under_root(root):
+    os.mkdir(os.path.join(root, "sub"))
+    assert checked_path(root, "a.jpg") == "a.jpg"
+    assert checked_path(root, "sub/../sub/x.PNG") == "sub/x.PNG"
+
+
+@pytest.mark.parametrize("path", [
+    "../a.jpg", "sub/../../a.jpg", "/etc/a.jpg", "..", "a.txt", "a.jpg.txt", "sub\\..\\..\\a.jpg", "", 3,
+])
+def test_checked_path_rejects_escapes(root, path):
+    with pytest.raises(ValueError):
+        checked_path(root, path)
+
+
+def test_checked_path_rejects_symlinks_out_of_root(root, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    os.symlink(str(outside), os.path.join(root, "link"))
+    with pytest.raises(ValueError):
+        checked_path(root, "link/a.jpg")
+
+###############################################################################
+#                                    Client                                   #
+###############################################################################
+def unused_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def test_sync_client_requeues_while_offline(root):
+    client = SyncClient(unused_url(), root, "ann1", delay=60)
+    image = os.path.join(root, "a.jpg")
+    try:
+        client.mark_dirty(image, ["cat"], [[0.5, 0.5, 0.2, 0.2]], [7])
+        with pytest.raises(OSError):
+            client.fetch(image)
+        labels, normalized, ids = client.pending(image, ids=True)
+        assert labels == ["cat"] and ids.tolist() == [7]
+        with pytest.raises(OSError):
+            client.flush()
+        assert client.pending(image) is not None
+    finally:
+        # Stops the sync thread without close(), which would try the server again.
+        with client._cond:
+            client._closed = True
+            client._cond.notify()
+        client.pool.close()
+        client.interactive.close()
+
+
+def test_sync_client_delivers_edits(server, root):
+    image = os.path.join(root, "a.jpg")
+    first = SyncClient(server, root, "ann1", delay=60)
+    second = SyncClient(server, root, "ann2", delay=60)
+    try:
+        first.mark_dirty(image, ["cat"], [[0.5, 0.5, 0.2, 0.2]], [7])
+        first.flush()
+        assert first.pending(image) is None
+        labels, normalized, ids = second.fetch(image)
+        assert labels == ["cat"] and ids.tolist() == [7]
+        assert np.allclose(normalized, [[0.5, 0.5, 0.2, 0.2]])
+    finally:
+        first.close()
+        second.close()
+
+
+def test_conflict_callback_can_fetch_again(server, root):
+    # The GUI reloads a conflicted image from on_conflict, which fetches again;
+    # this must not wait on the lock the conflicting fetch held.
+    image = os.path.join(root, "a.jpg")
+    reloaded = []
+    first = SyncClient(server, root, "ann1", delay=60, on_conflict=lambda path: reloaded.append(first.fetch(path)))
+    second = SyncClient(server, root, "ann2", delay=60)
+    try:
+        first.mark_dirty(image, ["cat"], [[0.5, 0.5, 0.2, 0.2]], [7])
+        first.flush()
+        second.fetch(image)
+        second.mark_dirty(image, ["dog"], [[0.5, 0.5, 0.2, 0.2]], [7])
+        second.flush()
+        first.mark_dirty(image, ["bird"], [[0.5, 0.5, 0.2, 0.2]], [7])
+        thread = threading.Thread(target=first.fetch, args=(image,), daemon=True)
+        thread.start()
+        thread.join(10)
+        assert not thread.is_alive(), "fetch deadlocked in the conflict callback"
+        assert first.conflicts == 1
+        assert len(reloaded) == 1 and reloaded[0][0] == ["dog"]
+    finally:
+        first.close()
+        second.close()
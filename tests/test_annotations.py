@@ -0,0 +1,112 @@
+import numpy as np
+
+from annotations import (
+    AnnotationStore, LabelTable, format_txt, normalized_to_pixels, parse_txt,
+    pixels_to_normalized,
+)
+
+###############################################################################
+#                                 TXT Format                                  #
+###############################################################################
+def test_parse_format_round_trip():
+    text = "cat 0.5 0.5 0.25 0.125\ndog 0.1 0.2 0.3 0.4\n"
+    labels, normalized = parse_txt(text)
+    assert labels == ["cat", "dog"]
+    assert normalized.shape == (2, 4)
+    assert format_txt(labels, normalized) == text
+
+
+def test_parse_skips_short_lines_and_ignores_extra_tokens():
+    labels, normalized = parse_txt("\nbad 0.1 0.2\ncat 0.1 0.2 0.3 0.4 0.99 extra\n")
+    assert labels == ["cat"]
+    assert normalized.tolist() == [[0.1, 0.2, 0.3, 0.4]]
+
+
+def test_parse_empty_text():
+    labels, normalized = parse_txt("")
+    assert labels == []
+    assert normalized.shape == (0, 4)
+    assert format_txt(labels, normalized) == ""
+
+
+def test_format_float32_reads_back_exactly():
+    normalized = np.array([[0.1, 0.2, 0.3, 0.4]], dtype=np.float32)
+    _, parsed = parse_txt(format_txt(["a"], normalized))
+    assert np.array_equal(parsed.astype(np.float32), normalized)
+
+###############################################################################
+#                              Coordinate Helpers                             #
+###############################################################################
+def test_normalized_to_pixels():
+    boxes = normalized_to_pixels([[0.5, 0.5, 0.5, 0.25]], 200, 100)
+    assert boxes.tolist() == [[50.0, 37.5, 100.0, 25.0]]
+
+
+def test_pixel_round_trip():
+    rng = np.random.default_rng(0)
+    normalized = rng.random((50, 4))
+    boxes = normalized_to_pixels(normalized, 1920, 1080)
+    assert np.allclose(pixels_to_normalized(boxes, 1920, 1080), normalized)
+
+###############################################################################
+#                               LabelTable Class                              #
+###############################################################################
+def test_label_interning():
+    table = LabelTable()
+    assert table.intern("cat") == 0
+    assert table.intern("dog") == 1
+    assert table.intern("cat") == 0
+    assert len(table) == 2
+    ids = table.intern_many(["dog", "bird", "cat"])
+    assert ids.tolist() == [1, 2, 0]
+    assert table.name(2) == "bird"
+    assert table.lookup(ids) == ["dog", "bird", "cat"]
+
+
+def test_stores_share_a_label_table():
+    table = LabelTable()
+    first = AnnotationStore(labels=table)
+    second = AnnotationStore(labels=table)
+    first.add(0, 0, 1, 1, "cat")
+    second.add(0, 0, 1, 1, "cat")
+    assert first.label_ids.tolist() == second.label_ids.tolist() == [0]
+    assert len(table) == 1
+
+###############################################################################
+#                             AnnotationStore Class                           #
+###############################################################################
+def test_store_grows_past_capacity():
+    store = AnnotationStore(100, 100, capacity=2)
+    rows = [store.add(i, i, 1, 1, f"l{i % 3}", color_id=i) for i in range(5)]
+    assert rows == list(range(5))
+    assert len(store) == 5
+    assert store.rect(4) == (4.0, 4.0, 1.0, 1.0)
+    assert store.label_names() == ["l0", "l1", "l2", "l0", "l1"]
+    assert store.color_ids.tolist() == [0, 1, 2, 3, 4]
+    new = store.extend(np.ones((20, 4)), ["x"] * 20, 7)
+    assert new == range(5, 25)
+    assert len(store) == 25
+    assert len(set(store.ids.tolist())) == 25
+
+
+def test_store_remove_keeps_order_and_ids():
+    store = AnnotationStore(100, 100)
+    for i in range(5):
+        store.add(i * 10, 0, 5, 5, str(i))
+    ids = store.ids.tolist()
+    store.remove([1, 3])
+    assert len(store) == 3
+    assert store.label_names() == ["0", "2", "4"]
+    assert store.boxes[:, 0].tolist() == [0.0, 20.0, 40.0]
+    assert store.ids.tolist() == [ids[0], ids[2], ids[4]]
+    store.clear()
+    assert len(store) == 0
+
+
+def test_store_txt_round_trip():
+    text = "cat 0.5 0.5 0.25 0.5\ndog 0.25 0.75 0.5 0.5\n"
+    store = AnnotationStore(640, 480)
+    assert store.load_txt(text, first_color=1, palette_size=2) == range(0, 2)
+    assert store.color_ids.tolist() == [1, 0]
+    assert store.rect(0) == (240.0, 120.0, 160.0, 240.0)
+    assert store.to_txt() == text
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+import pytest
+
+import persistence
+from persistence import AnnotationWriter, atomic_write
+
+
+@pytest.fixture
+def writer():
+    writer = AnnotationWriter(delay=60)
+    yield writer
+    writer.close()
+
+
+def wait_until(condition, timeout=10):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+###############################################################################
+#                              Atomic File Writes                             #
+###############################################################################
+def test_atomic_write_text_and_bytes(tmp_path):
+    path = str(tmp_path / "a.txt")
+    atomic_write(path, "cat 0.5 0.5 0.1 0.1\n")
+    assert open(path).read() == "cat 0.5 0.5 0.1 0.1\n"
+    atomic_write(path, b"\x00\x01")
+    assert open(path, "rb").read() == b"\x00\x01"
+    assert os.listdir(str(tmp_path)) == ["a.txt"]
+
+
+def test_atomic_write_keeps_the_old_file_on_failure(tmp_path, monkeypatch):
+    path = str(tmp_path / "a.txt")
+    atomic_write(path, "old\n")
+
+    def fail(src, dst):
+        raise OSError("disk gone")
+    monkeypatch.setattr(persistence.os, "replace", fail)
+    with pytest.raises(OSError):
+        atomic_write(path, "new\n")
+    assert open(path).read() == "old\n"
+    assert os.listdir(str(tmp_path)) == ["a.txt"]
+
+###############################################################################
+#                            AnnotationWriter Class                           #
+###############################################################################
+def test_repeated_edits_are_written_once(writer, tmp_path):
+    path = str(tmp_path / "a.txt")
+    for i in range(5):
+        writer.mark_dirty(path, f"edit {i}\n")
+    assert writer.pending(path) == "edit 4\n"
+    assert writer.edits == 5 and writer.writes == 0
+    assert writer.flush(path)
+    assert writer.writes == 1
+    assert open(path).read() == "edit 4\n"
+    assert not writer.is_dirty()
+
+
+def test_background_thread_writes_after_the_delay(tmp_path):
+    writer = AnnotationWriter(delay=0.05)
+    path = str(tmp_path / "a.txt")
+    try:
+        writer.mark_dirty(path, "one\n")
+        writer.mark_dirty(path, "two\n")
+        wait_until(lambda: writer.writes == 1)
+        assert open(path).read() == "two\n"
+    finally:
+        assert writer.close()
+
+
+def test_failed_write_is_requeued_and_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(AnnotationWriter, "RETRY_SECONDS", 0.05)
+    errors = []
+    writer = AnnotationWriter(delay=60, on_error=errors.append)
+    path = str(tmp_path / "a.txt")
+    # A directory where the temporary file goes makes every write fail.
+    os.mkdir(path + ".tmp")
+    try:
+        writer.mark_dirty(path, "boxes\n")
+        assert not writer.flush(path)
+        assert writer.pending(path) == "boxes\n"
+        assert isinstance(errors[-1], OSError) and writer.last_error is errors[-1]
+        os.rmdir(path + ".tmp")
+        wait_until(lambda: writer.writes == 1 and errors[-1] is None)
+        assert open(path).read() == "boxes\n"
+        assert errors[-1] is None and writer.last_error is None
+    finally:
+        writer.close()
+
+
+def test_newer_edit_replaces_a_failed_write(writer, tmp_path):
+    path = str(tmp_path / "a.txt")
+    os.mkdir(path + ".tmp")
+    writer.mark_dirty(path, "old\n")
+    assert not writer.flush()
+    writer.mark_dirty(path, "new\n")
+    os.rmdir(path + ".tmp")
+    assert writer.flush(path)
+    assert open(path).read() == "new\n"
+
+
+def test_close_reports_writes_that_failed(tmp_path):
+    writer = AnnotationWriter(delay=60)
+    path = str(tmp_path / "a.txt")
+    os.mkdir(path + ".tmp")
+    writer.mark_dirty(path, "boxes\n")
+    assert not writer.close()
+
+
+def test_flush_of_a_clean_path_does_not_wait_for_other_writes(writer, tmp_path):
+    # Another file's write holds the I/O lock; a path with nothing to write returns at once.
+    writer.mark_dirty(str(tmp_path / "b.txt"), "b\n")
+    results = []
+    with writer._io_lock:
+        thread = threading.Thread(target=lambda: results.append(writer.flush(str(tmp_path / "a.txt"))))
+        thread.start()
+        thread.join(5)
+        assert results == [True]
+    assert writer.flush(str(tmp_path / "b.txt"))
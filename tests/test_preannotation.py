@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+from PyQt5.QtGui import QImage
+
+from detectors import DummyDetector, check_detector_spec
+from preannotation import PreAnnotator
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def wait_for(signal, timeout_ms=60000):
+    # Runs the event loop until `signal` fires; returns its arguments, or None on timeout.
+    loop = QEventLoop()
+    received = []
+    signal.connect(lambda *args: (received.append(args), loop.quit()))
+    QTimer.singleShot(timeout_ms, loop.quit)
+    loop.exec_()
+    return received[0] if received else None
+
+
+def noise(width=64, height=48, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def make_image(path, width=64, height=48):
+    pixels = noise(width, height)
+    image = QImage(pixels.data, width, height, width * 3, QImage.Format_RGB888)
+    assert image.save(path)
+    return path
+
+
+def test_dummy_detector_proposals_are_normalized():
+    results = DummyDetector(count=3).detect([noise(), np.zeros((48, 64, 3), np.uint8)])
+    assert len(results) == 2 and len(results[0]) == 3
+    # A flat image has no contrast and gets no proposals.
+    assert results[1] == []
+    for label, score, cx, cy, w, h in results[0]:
+        assert label == "object"
+        assert 0 <= score <= 1
+        assert 0 <= cx - w / 2 and cx + w / 2 <= 1
+        assert 0 <= cy - h / 2 and cy + h / 2 <= 1
+
+
+def test_check_detector_spec(tmp_path):
+    check_detector_spec("dummy")
+    check_detector_spec("package.module:name")
+    for spec in ("nonsense", ":name", "onnx:" + str(tmp_path / "missing.onnx")):
+        with pytest.raises(ValueError):
+            check_detector_spec(spec)
+
+
+def test_dummy_preannotator(app, tmp_path):
+    paths = [make_image(str(tmp_path / f"{i}.png")) for i in range(3)]
+    preannotator = PreAnnotator("dummy", lookahead=2, batch_size=2, cache_root=str(tmp_path / "cache"))
+    try:
+        preannotator.schedule(paths, 0)
+        pending = set(paths)
+        while pending:
+            args = wait_for(preannotator.proposalsReady)
+            assert args is not None, "detector worker timed out"
+            pending.difference_update(args[0])
+        assert not preannotator.broken and not preannotator.error
+        for path in paths:
+            proposals = preannotator.proposals(path)
+            assert len(proposals) == 3
+            assert all(p[0] == "object" for p in proposals)
+        preannotator.markReviewed(paths[0])
+        assert preannotator.proposals(paths[0]) == []
+        # Cached images are not asked for again.
+        preannotator.schedule(paths, 0)
+        assert not preannotator._in_flight
+    finally:
+        preannotator.shutdown()
+
+
+def test_detector_that_fails_to_load_disables_preannotator(app, tmp_path):
+    path = make_image(str(tmp_path / "a.png"))
+    preannotator = PreAnnotator("no_such_module_here:detector", cache_root=str(tmp_path / "cache"))
+    try:
+        preannotator.schedule([path], 0)
+        # detectorError is emitted before proposalsReady, so `error` is set by now.
+        assert wait_for(preannotator.proposalsReady) is not None
+        assert preannotator.broken
+        assert "no_such_module_here" in preannotator.error
+        assert preannotator.proposals(path) == []
+    finally:
+        preannotator.shutdown()
+
+
+def failing_detector(images):
+    raise RuntimeError("bad batch")
+
+
+def test_failing_batch_keeps_preannotator_running(app, tmp_path):
+    path = make_image(str(tmp_path / "a.png"))
+    preannotator = PreAnnotator(f"{__name__}:failing_detector", cache_root=str(tmp_path / "cache"))
+    try:
+        preannotator.schedule([path], 0)
+        assert wait_for(preannotator.proposalsReady) is not None
+        assert not preannotator.broken
+        assert preannotator.error == "bad batch"
+    finally:
+        preannotator.shutdown()
@@ -0,0 +1,146 @@
+import os
+
+import session as session_module
+from dataset import ImageList
+from session import DONE, IN_PROGRESS, SKIPPED, UNTOUCHED, Session
+
+
+def make_list(root, chunks):
+    # chunks: [(subdirectory, [names])]; no files are needed on disk.
+    image_list = ImageList(root)
+    for directory, names in chunks:
+        image_list.extend(os.path.join(root, directory), names, [False] * len(names))
+    return image_list
+
+
+CHUNKS = [("a", ["0.jpg", "1.jpg", "2.jpg"]), ("b", ["0.jpg", "1.jpg"])]
+
+
+def count_records(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+    position, count = len(session_module.SESSION_MAGIC), 0
+    while position < len(data):
+        _, size, _ = session_module.SESSION_RECORD.unpack_from(data, position)
+        position += session_module.SESSION_RECORD.size + size
+        count += 1
+    return count
+
+
+def test_append_and_replay(tmp_path):
+    filename = str(tmp_path / "s.session")
+    session = Session.create(filename, make_list(str(tmp_path), CHUNKS), complete=True)
+    session.set_status(1, DONE)
+    session.set_status(3, SKIPPED)
+    session.set_annotated(1)
+    session.set_position(3, (2.0, 0.0, 0.0, 2.0, 10.0, 20.0))
+    for label in ("cat", "dog", "cat"):
+        session.use_label(label)
+    session.close()
+
+    loaded = Session.load(filename)
+    try:
+        assert loaded.complete and loaded.folder
+        assert list(loaded.image_list) == list(session.image_list)
+        assert list(loaded.status) == [UNTOUCHED, DONE, UNTOUCHED, SKIPPED, UNTOUCHED]
+        assert loaded.image_list.is_annotated(1) and not loaded.image_list.is_annotated(0)
+        assert loaded.position == 3
+        assert loaded.view == (2.0, 0.0, 0.0, 2.0, 10.0, 20.0)
+        assert loaded.labels == ["dog", "cat"]
+    finally:
+        loaded.close()
+
+
+def test_torn_tail_is_cut(tmp_path):
+    filename = str(tmp_path / "s.session")
+    session = Session.create(filename, make_list(str(tmp_path), CHUNKS), complete=True)
+    session.set_status(0, DONE)
+    session.close()
+    good = os.path.getsize(filename)
+    with open(filename, "ab") as f:
+        f.write(session_module.frame(session_module.STATUS, session_module.ROW_RECORD.pack(1, DONE))[:-3])
+
+    loaded = Session.load(filename)
+    assert list(loaded.status)[:2] == [DONE, UNTOUCHED]
+    assert os.path.getsize(filename) == good
+    # Appending goes on after the last good record.
+    loaded.set_status(2, SKIPPED)
+    loaded.close()
+    assert list(Session.load(filename, readonly=True).status)[:3] == [DONE, UNTOUCHED, SKIPPED]
+
+
+def test_readonly_load_leaves_the_file_alone(tmp_path, monkeypatch):
+    filename = str(tmp_path / "s.session")
+    session = Session.create(filename, make_list(str(tmp_path), CHUNKS), complete=True)
+    for row in range(5):
+        session.set_status(row, DONE)
+    session.close()
+    with open(filename, "ab") as f:
+        f.write(b"\x05torn")
+    with open(filename, "rb") as f:
+        before = f.read()
+    monkeypatch.setattr(session_module, "COMPACT_AFTER", 2)
+    loaded = Session.load(filename, readonly=True)
+    assert list(loaded.status) == [DONE] * 5
+    loaded.set_status(0, SKIPPED)
+    loaded.close(compact=True)
+    with open(filename, "rb") as f:
+        assert f.read() == before
+
+
+def test_long_logs_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_module, "COMPACT_AFTER", 10)
+    filename = str(tmp_path / "s.session")
+    session = Session.create(filename, make_list(str(tmp_path), CHUNKS), complete=True)
+    for i in range(25):
+        session.set_status(i % 5, DONE if i % 2 else SKIPPED)
+        session.set_position(i % 5)
+    session.close()
+    # 50 records were appended; compaction keeps the log at a snapshot plus at most 10 of them.
+    assert count_records(filename) <= 7 + 10
+    loaded = Session.load(filename)
+    loaded.close()
+    assert list(loaded.status) == list(session.status)
+    assert loaded.position == session.position
+
+
+def test_rebase_follows_paths(tmp_path):
+    root = str(tmp_path)
+    filename = str(tmp_path / "s.session")
+    session = Session.create(filename, make_list(root, CHUNKS), complete=True)
+    session.set_status(1, DONE)
+    session.set_status(4, SKIPPED)
+    session.set_position(4)
+    # a/0.jpg was deleted and c/0.jpg added.
+    session.rebase(make_list(root, [("a", ["1.jpg", "2.jpg"]), ("b", ["0.jpg", "1.jpg"]), ("c", ["0.jpg"])]))
+    assert list(session.status) == [DONE, UNTOUCHED, UNTOUCHED, SKIPPED, UNTOUCHED]
+    assert session.position == 3
+    session.close()
+    loaded = Session.load(filename, readonly=True)
+    assert list(loaded.status) == list(session.status)
+    assert loaded.image_list[4] == os.path.join(root, "c", "0.jpg")
+
+
+def test_incomplete_session_resumes(tmp_path):
+    root = str(tmp_path)
+    filename = str(tmp_path / "s.session")
+    # Closed after listing the first directory.
+    session = Session.create(filename, make_list(root, CHUNKS[:1]))
+    session.set_status(2, IN_PROGRESS)
+    session.set_position(2)
+    session.close()
+
+    loaded = Session.load(filename)
+    assert not loaded.complete
+    assert len(loaded.image_list) == 3
+    directory, names = CHUNKS[1]
+    loaded.image_list.extend(os.path.join(root, directory), names, [False] * len(names))
+    loaded.mark_complete()
+    loaded.set_status(4, DONE)
+    loaded.close()
+
+    resumed = Session.load(filename, readonly=True)
+    assert resumed.complete
+    assert list(resumed.image_list) == list(make_list(root, CHUNKS))
+    assert list(resumed.status) == [UNTOUCHED, UNTOUCHED, IN_PROGRESS, UNTOUCHED, DONE]
+    assert resumed.position == 2
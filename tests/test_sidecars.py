@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pytest
+
+from annotations import box_records, decode_sidecar, encode_sidecar, fits_float32
+from sidecars import BoxPack, convert_sidecar, pack_dataset, unpack_dataset
+
+# Values with few binary digits: exact in float32, so every format keeps them.
+EXACT = "cat 0.5 0.25 0.125 0.0625\nperro_grande 0.75 0.5 0.25 0.5\ncat 0.375 0.625 0.0625 0.125\n"
+
+
+def write(path, content=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+###############################################################################
+#                                Binary Sidecars                              #
+###############################################################################
+def test_box_round_trip():
+    labels, normalized = decode_sidecar(EXACT)
+    data = encode_sidecar("a.box", labels, normalized)
+    assert isinstance(data, bytes)
+    decoded_labels, decoded = decode_sidecar(data)
+    assert decoded_labels == labels
+    assert decoded.dtype == np.float32
+    assert np.array_equal(decoded.astype(np.float64), normalized)
+    # Repeated labels are stored once.
+    assert box_records(data)[1] == ["cat", "perro_grande"]
+    assert encode_sidecar("a.txt", decoded_labels, decoded) == EXACT
+
+
+def test_empty_box_round_trip():
+    labels, normalized = decode_sidecar(encode_sidecar("a.box", [], np.zeros((0, 4))))
+    assert labels == [] and normalized.shape == (0, 4)
+
+
+@pytest.mark.parametrize("data", [b"", b"IATB", b"XXXX" + bytes(12)])
+def test_box_rejects_bad_data(data):
+    with pytest.raises(ValueError):
+        decode_sidecar(data)
+
+
+def test_box_rejects_truncated_records():
+    data = encode_sidecar("a.box", *decode_sidecar(EXACT))
+    with pytest.raises(ValueError):
+        decode_sidecar(data[:30])
+
+
+def test_fits_float32():
+    assert fits_float32(decode_sidecar(EXACT)[1])
+    assert not fits_float32([[0.1, 0.5, 0.5, 0.5]])
+
+###############################################################################
+#                                Packed Datasets                              #
+###############################################################################
+def test_pack_round_trip(tmp_path):
+    source = str(tmp_path / "dataset")
+    write(os.path.join(source, "a.jpg"))
+    write(os.path.join(source, "a.txt"), EXACT)
+    write(os.path.join(source, "sub", "b.png"))
+    write(os.path.join(source, "sub", "b.box"))
+    with open(os.path.join(source, "sub", "b.box"), "wb") as f:
+        f.write(encode_sidecar("b.box", ["dog"], [[0.5, 0.5, 0.25, 0.25]]))
+    write(os.path.join(source, "c.jpg"))
+    write(os.path.join(source, "d.jpg"))
+    write(os.path.join(source, "d.txt"))
+    pack_path = str(tmp_path / "data.boxpack")
+
+    stats = pack_dataset(source, pack_path, workers=1)
+    assert stats == {"images": 4, "annotated": 3, "boxes": 4, "errors": 0, "rounded": 0}
+    pack = BoxPack(pack_path)
+    try:
+        assert len(pack) == 4
+        # Geometry is a view of the mapped file, not a parsed copy.
+        assert isinstance(pack._data, np.memmap) and np.shares_memory(pack.geometry, pack._data)
+        row = pack.find("a.jpg")
+        labels, geometry = pack.boxes(row)
+        assert labels == ["cat", "perro_grande", "cat"]
+        assert np.array_equal(geometry.astype(np.float64), decode_sidecar(EXACT)[1])
+        assert pack.boxes(pack.find("sub/b.png"))[0] == ["dog"]
+        assert not pack.has_sidecar(pack.find("c.jpg"))
+        # An image reviewed and left empty keeps its (empty) sidecar.
+        assert pack.has_sidecar(pack.find("d.jpg")) and pack.boxes(pack.find("d.jpg"))[0] == []
+        assert pack.find("missing.jpg") is None
+        assert sorted(set(pack.labels)) == ["cat", "dog", "perro_grande"]
+    finally:
+        pack.close()
+
+    output = str(tmp_path / "unpacked")
+    assert unpack_dataset(pack_path, output) == 3
+    with open(os.path.join(output, "a.txt")) as f:
+        assert f.read() == EXACT
+    assert not os.path.exists(os.path.join(output, "c.txt"))
+    assert os.path.getsize(os.path.join(output, "d.txt")) == 0
+
+
+def test_pack_counts_rounded_sidecars(tmp_path):
+    source = str(tmp_path / "dataset")
+    write(os.path.join(source, "a.jpg"))
+    write(os.path.join(source, "a.txt"), "cat 0.1 0.5 0.2 0.2\n")
+    assert pack_dataset(source, str(tmp_path / "data.boxpack"), workers=1)["rounded"] == 1
+
+
+def test_bad_pack_is_rejected(tmp_path):
+    path = write(str(tmp_path / "bad.boxpack"), "not a pack" * 10)
+    with pytest.raises(ValueError):
+        BoxPack(path)
+
+###############################################################################
+#                                 Conversions                                 #
+###############################################################################
+def test_convert_txt_to_box_and_back(tmp_path):
+    image = write(str(tmp_path / "a.jpg"))
+    write(str(tmp_path / "a.txt"), EXACT)
+    assert convert_sidecar(image, ".box") == (image, True, None, None)
+    assert not os.path.exists(str(tmp_path / "a.txt"))
+    assert convert_sidecar(image, ".txt") == (image, True, None, None)
+    assert not os.path.exists(str(tmp_path / "a.box"))
+    with open(str(tmp_path / "a.txt")) as f:
+        assert f.read() == EXACT
+
+
+def test_convert_keep_leaves_the_source(tmp_path):
+    image = write(str(tmp_path / "a.jpg"))
+    write(str(tmp_path / "a.txt"), EXACT)
+    assert convert_sidecar(image, ".box", keep=True)[1]
+    assert os.path.exists(str(tmp_path / "a.txt")) and os.path.exists(str(tmp_path / "a.box"))
+
+
+def test_convert_refuses_rounding_unless_lossy(tmp_path):
+    image = write(str(tmp_path / "a.jpg"))
+    text = "cat 0.1 0.5 0.2 0.2\n"
+    write(str(tmp_path / "a.txt"), text)
+    _, converted, error, refused = convert_sidecar(image, ".box")
+    assert not converted and error is None and "float32" in refused
+    with open(str(tmp_path / "a.txt")) as f:
+        assert f.read() == text
+    assert not os.path.exists(str(tmp_path / "a.box"))
+
+    assert convert_sidecar(image, ".box", lossy=True) == (image, True, None, None)
+    assert not os.path.exists(str(tmp_path / "a.txt"))
+    labels, normalized = decode_sidecar(open(str(tmp_path / "a.box"), "rb").read())
+    assert labels == ["cat"] and np.allclose(normalized, [[0.1, 0.5, 0.2, 0.2]])
@@ -0,0 +1,50 @@
+import struct
+import zlib
+
+from validate import main, validate_sidecar
+
+
+def write_png(path, width, height):
+    # Smallest valid grayscale PNG; validate only reads the header.
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\0" + bytes(width) for _ in range(height))
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+                + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+    return str(path)
+
+
+def test_fix_writes_rounded_values(tmp_path):
+    image = write_png(tmp_path / "a.png", 100, 100)
+    (tmp_path / "a.txt").write_text("cat 0.9 0.5 0.3 0.2\ndog 0.5 0.5 0.1 0.1\n")
+    _, issues, fixed = validate_sidecar(image, fix=True)
+    assert fixed
+    assert [kind for _, kind, _ in issues] == ["out_of_bounds"]
+    # Clipped to x 0.75..1.0 without float noise like 0.8750000000000001.
+    assert (tmp_path / "a.txt").read_text() == "cat 0.875 0.5 0.25 0.2\ndog 0.5 0.5 0.1 0.1\n"
+
+
+def test_fix_drops_duplicates_and_keeps_overlaps(tmp_path):
+    image = write_png(tmp_path / "a.png", 100, 100)
+    (tmp_path / "a.txt").write_text("cat 0.5 0.5 0.2 0.2\ncat 0.5 0.5 0.2 0.2\ndog 0.5 0.5 0.2 0.2\n")
+    _, issues, fixed = validate_sidecar(image, fix=True)
+    assert fixed
+    assert sorted(kind for _, kind, _ in issues) == ["duplicate", "overlap"]
+    assert (tmp_path / "a.txt").read_text() == "cat 0.5 0.5 0.2 0.2\ndog 0.5 0.5 0.2 0.2\n"
+
+
+def test_overlap_is_a_warning(tmp_path, capsys):
+    write_png(tmp_path / "a.png", 100, 100)
+    (tmp_path / "a.txt").write_text("cat 0.5 0.5 0.2 0.2\ndog 0.5 0.5 0.2 0.2\n")
+    assert main([str(tmp_path), "-j", "1"]) == 0
+    assert "overlap" in capsys.readouterr().out
+    assert main([str(tmp_path), "-j", "1", "--strict"]) == 1
+
+
+def test_remaining_issues_fail(tmp_path):
+    write_png(tmp_path / "a.png", 100, 100)
+    (tmp_path / "a.txt").write_text("cat 0.5 0.5 0 0.2\n")
+    assert main([str(tmp_path), "-j", "1"]) == 1
+    assert main([str(tmp_path), "-j", "1", "--fix"]) == 0
+    assert (tmp_path / "a.txt").read_text() == ""
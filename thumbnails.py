@@ -0,0 +1,427 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyQt5.QtWidgets import QListView
+from PyQt5.QtGui import QImage, QPixmap, QColor, QImageReader
+from PyQt5.QtCore import (
+    Qt, QObject, QSize, QTimer, QBuffer, QIODevice, QAbstractListModel, QModelIndex,
+    QSortFilterProxyModel, pyqtSignal
+)
+
+from annotations import BINARY_EXTENSION, box_records, find_sidecar, read_sidecar_content
+from dataset import ImageList, dataset_key
+
+THUMBNAIL_SIZE = 96
+THUMBNAIL_QUALITY = 85
+
+
+def thumbnail_cache_root() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "image-annotation-tool", "thumbnails")
+
+###############################################################################
+#                             ThumbnailPack Class                             #
+###############################################################################
+# One append-only file per dataset holding every thumbnail as an encoded JPEG.
+# Each record is a fixed header, the UTF-8 image path and the JPEG bytes; the
+# file is memory-mapped, so opening it only walks the record headers and a
+# thumbnail is read straight from the page cache. A record is valid while the
+# image's mtime and size match; a newer record for the same path replaces it.
+PACK_MAGIC = b"IATTHMB1"
+RECORD = struct.Struct("<HIHHqq")  # path length, data length, width, height, mtime_ns, size
+COMPACT_MIN_BYTES = 16 * 1024 * 1024
+
+
+class ThumbnailPack:
+    def __init__(self, filename):
+        self.filename = filename
+        self.index = {}
+        self.dead_bytes = 0
+        self._map = None
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        if not os.path.exists(filename) or os.path.getsize(filename) < len(PACK_MAGIC):
+            with open(filename, "wb") as f:
+                f.write(PACK_MAGIC)
+        self._file = open(filename, "r+b")
+        self._scan()
+        if self.dead_bytes > COMPACT_MIN_BYTES and self.dead_bytes > self.live_bytes():
+            self.compact()
+
+    @classmethod
+    def for_dataset(cls, image_list, cache_root=None):
+        key = dataset_key(image_list)
+        root = cache_root or thumbnail_cache_root()
+        return cls(os.path.join(root, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pack"))
+
+    def _scan(self):
+        # Builds the path index from the record headers; a torn record at the end is cut off.
+        self._remap()
+        data = self._map
+        if data is None or data[:len(PACK_MAGIC)] != PACK_MAGIC:
+            self._file.truncate(0)
+            self._file.seek(0)
+            self._file.write(PACK_MAGIC)
+            self._file.flush()
+            self._remap()
+            return
+        offset = len(PACK_MAGIC)
+        end = len(data)
+        while offset + RECORD.size <= end:
+            path_len, data_len, width, height, mtime_ns, size = RECORD.unpack_from(data, offset)
+            path_start = offset + RECORD.size
+            data_start = path_start + path_len
+            if data_start + data_len > end:
+                break
+            path = bytes(data[path_start:data_start]).decode("utf-8", "replace")
+            old = self.index.get(path)
+            if old is not None:
+                self.dead_bytes += old[1] + RECORD.size + path_len
+            self.index[path] = (data_start, data_len, width, height, mtime_ns, size)
+            offset = data_start + data_len
+        if offset < end:
+            self._map.close()
+            self._map = None
+            self._file.truncate(offset)
+            self._remap()
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.flush()
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) if size else None
+
+    def live_bytes(self) -> int:
+        return sum(entry[1] for entry in self.index.values())
+
+    def lookup(self, path, mtime_ns, size):
+        # Returns (width, height, JPEG bytes) if a thumbnail for this version of `path` exists.
+        entry = self.index.get(path)
+        if entry is None or entry[4] != mtime_ns or entry[5] != size:
+            return None
+        offset, length, width, height, _, _ = entry
+        if offset + length > len(self._map):
+            self._remap()
+        return width, height, self._map[offset:offset + length]
+
+    def add(self, path, mtime_ns, size, width, height, data):
+        encoded = path.encode("utf-8")
+        old = self.index.get(path)
+        if old is not None:
+            self.dead_bytes += old[1] + RECORD.size + len(encoded)
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(RECORD.pack(len(encoded), len(data), width, height, mtime_ns, size) + encoded + data)
+        self.index[path] = (offset + RECORD.size + len(encoded), len(data), width, height, mtime_ns, size)
+
+    def compact(self):
+        # Rewrites the pack without superseded records.
+        tmp_name = self.filename + ".tmp"
+        with open(tmp_name, "wb") as out:
+            out.write(PACK_MAGIC)
+            for path, (offset, length, width, height, mtime_ns, size) in self.index.items():
+                encoded = path.encode("utf-8")
+                out.write(RECORD.pack(len(encoded), length, width, height, mtime_ns, size) + encoded)
+                out.write(self._map[offset:offset + length])
+        self.close()
+        os.replace(tmp_name, self.filename)
+        self.index = {}
+        self.dead_bytes = 0
+        self._file = open(self.filename, "r+b")
+        self._scan()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if not self._file.closed:
+            self._file.close()
+
+###############################################################################
+#                             Thumbnail Rendering                             #
+###############################################################################
+def render_thumbnails(paths, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY) -> list:
+    # Worker process: returns (path, mtime_ns, file size, width, height, JPEG bytes) per image.
+    # Unreadable images get an empty record so they are not decoded again.
+    results = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        source = reader.size()
+        if source.isValid():
+            # JPEG readers scale while decoding, which is much cheaper than decoding in full.
+            scale = min(1.0, size / max(source.width(), source.height(), 1))
+            reader.setScaledSize(QSize(max(1, round(source.width() * scale)), max(1, round(source.height() * scale))))
+        image = reader.read()
+        if image.isNull():
+            results.append((path, st.st_mtime_ns, st.st_size, 0, 0, b""))
+            continue
+        if image.width() > size or image.height() > size:
+            image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        image.convertToFormat(QImage.Format_RGB888).save(buffer, "JPEG", quality)
+        results.append((path, st.st_mtime_ns, st.st_size, image.width(), image.height(), bytes(buffer.data())))
+    return results
+
+###############################################################################
+#                            ThumbnailLoader Class                            #
+###############################################################################
+class ThumbnailLoader(QObject):
+    # Renders thumbnails in a pool of worker processes. Requests are served
+    # newest first, so the thumbnails currently on screen are made before the
+    # ones that were scrolled past.
+    thumbnailsReady = pyqtSignal(list)
+
+    def __init__(self, workers=None, batch_size=8, parent=None):
+        super().__init__(parent)
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.batch_size = batch_size
+        self._executor = None
+        self._wanted = []
+        self._queued = set()
+        self._in_flight = 0
+        self._scheduled = False
+        self._closed = False
+        self._broken = False
+        self.thumbnailsReady.connect(self._onReady)
+
+    def request(self, path):
+        # Queues `path`; results arrive through thumbnailsReady as
+        # (path, mtime_ns, size, width, height, JPEG bytes) tuples.
+        if path in self._queued or self._broken:
+            return
+        self._queued.add(path)
+        self._wanted.append(path)
+        if not self._scheduled:
+            self._scheduled = True
+            QTimer.singleShot(0, self._submit)
+
+    def clear(self):
+        # Forgets requests that have not been sent to a worker yet.
+        self._queued.difference_update(self._wanted)
+        self._wanted = []
+
+    def _submit(self):
+        self._scheduled = False
+        if self._executor is None and self._wanted:
+            # Workers are spawned, not forked, so they do not inherit the GUI's threads.
+            context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        while self._wanted and self._in_flight < self.workers * 2:
+            batch = self._wanted[-self.batch_size:]
+            del self._wanted[-self.batch_size:]
+            try:
+                future = self._executor.submit(render_thumbnails, batch)
+            except (BrokenProcessPool, RuntimeError) as e:
+                # Without working workers the filmstrip keeps its placeholders.
+                print(f"Could not start thumbnail workers: {e}", file=sys.stderr)
+                self._broken = True
+                self.clear()
+                return
+            self._in_flight += 1
+            future.add_done_callback(lambda f, batch=batch: self._finished(f, batch))
+
+    def _finished(self, future, batch):
+        # Runs on an executor thread; the signal hands the result to the GUI thread.
+        if self._closed:
+            return
+        try:
+            results = future.result()
+        except Exception as e:
+            print(f"Could not render thumbnails: {e}", file=sys.stderr)
+            self._broken = self._broken or isinstance(e, BrokenProcessPool)
+            results = [(path, None, None, 0, 0, b"") for path in batch]
+        self.thumbnailsReady.emit(results)
+
+    def _onReady(self, results):
+        self._in_flight -= 1
+        for result in results:
+            self._queued.discard(result[0])
+        self._submit()
+
+    def shutdown(self):
+        self._closed = True
+        self.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+###############################################################################
+#                             FilmstripModel Class                            #
+###############################################################################
+class FilmstripModel(QAbstractListModel):
+    # One row per image of the current list. Thumbnails come from the dataset's
+    # ThumbnailPack and are only requested from the loader for rows the view
+    # shows; annotation counts are read from the sidecar files on demand.
+    MAX_PIXMAPS = 512
+
+    def __init__(self, count_text=None, parent=None):
+        super().__init__(parent)
+        self.image_list = []
+        self.requested = {}
+        self.counts = {}
+        self.pixmaps = OrderedDict()
+        self.pack = None
+        self.count_text = count_text or (lambda count: str(count))
+        self.loader = ThumbnailLoader(parent=self)
+        self.loader.thumbnailsReady.connect(self._onThumbnails)
+        self.placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.placeholder.fill(QColor(64, 64, 64))
+
+    def setImages(self, image_list, cache_root=None):
+        self.beginResetModel()
+        self.loader.clear()
+        if self.pack is not None:
+            self.pack.close()
+        self.image_list = image_list
+        self.requested = {}
+        self.counts = {}
+        self.pixmaps.clear()
+        self.pack = None
+        if len(image_list) or isinstance(image_list, ImageList):
+            self.pack = ThumbnailPack.for_dataset(image_list, cache_root)
+        self.endResetModel()
+
+    def extendImages(self, directory, names, annotated):
+        # Appends a chunk found by a directory scan to the ImageList shown by the model.
+        first = len(self.image_list)
+        self.beginInsertRows(QModelIndex(), first, first + len(names) - 1)
+        self.image_list.extend(directory, names, annotated)
+        self.endInsertRows()
+
+    def isAnnotated(self, row) -> bool:
+        # Whether the image has a sidecar.
+        if isinstance(self.image_list, ImageList):
+            return self.image_list.is_annotated(row)
+        return find_sidecar(self.image_list[row]) is not None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.image_list)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return f"{os.path.basename(self.image_list[row])}\n{self.count_text(self.count(row))}"
+        if role == Qt.DecorationRole:
+            return self.pixmap(row)
+        if role == Qt.ToolTipRole:
+            return self.image_list[row]
+        return None
+
+    def pixmap(self, row) -> QPixmap:
+        path = self.image_list[row]
+        pixmap = self.pixmaps.get(path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(path)
+            return pixmap
+        try:
+            st = os.stat(path)
+        except OSError:
+            return self.placeholder
+        cached = self.pack.lookup(path, st.st_mtime_ns, st.st_size)
+        if cached is None:
+            self.requested[path] = row
+            self.loader.request(path)
+            return self.placeholder
+        _, _, data = cached
+        image = QImage.fromData(data, "JPEG") if data else QImage()
+        pixmap = QPixmap.fromImage(image) if not image.isNull() else self.placeholder
+        self.pixmaps[path] = pixmap
+        while len(self.pixmaps) > self.MAX_PIXMAPS:
+            self.pixmaps.popitem(last=False)
+        return pixmap
+
+    def count(self, row) -> int:
+        # Number of boxes in the image's sidecar, read the first time the row is shown.
+        count = self.counts.get(row)
+        if count is None and isinstance(self.image_list, ImageList) and not self.image_list.is_annotated(row):
+            count = 0
+        if count is None:
+            path = find_sidecar(self.image_list[row])
+            try:
+                if path is None:
+                    count = 0
+                elif path.endswith(BINARY_EXTENSION):
+                    count = len(box_records(read_sidecar_content(path))[0])
+                else:
+                    with open(path, "r") as f:
+                        count = sum(1 for line in f if len(line.split()) >= 5)
+            except (OSError, ValueError):
+                count = 0
+            self.counts[row] = count
+        return count
+
+    def setCount(self, row, count):
+        # Updates the count of an image being edited, ahead of its sidecar being saved.
+        if self.counts.get(row) != count and 0 <= row < len(self.image_list):
+            self.counts[row] = count
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole])
+
+    def _onThumbnails(self, results):
+        for path, mtime_ns, size, width, height, data in results:
+            row = self.requested.pop(path, None)
+            if mtime_ns is None or row is None:
+                continue
+            self.pack.add(path, mtime_ns, size, width, height, data)
+            self.pixmaps.pop(path, None)
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def shutdown(self):
+        self.loader.shutdown()
+        if self.pack is not None:
+            self.pack.close()
+            self.pack = None
+
+
+class UnannotatedFilter(QSortFilterProxyModel):
+    # Optionally hides the images that already have a sidecar. The filter is
+    # only re-evaluated when toggled, so an image being annotated stays visible.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.unannotatedOnly = False
+        self.setDynamicSortFilter(False)
+
+    def setUnannotatedOnly(self, enabled):
+        self.unannotatedOnly = enabled
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, row, parent):
+        return not self.unannotatedOnly or not self.sourceModel().isAnnotated(row)
+
+
+class FilmstripView(QListView):
+    # Horizontal strip of thumbnails with their names and box counts underneath.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFlow(QListView.LeftToRight)
+        self.setWrapping(False)
+        self.setUniformItemSizes(True)
+        self.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.setGridSize(QSize(THUMBNAIL_SIZE + 24, THUMBNAIL_SIZE + 44))
+        self.setHorizontalScrollMode(QListView.ScrollPerPixel)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setEditTriggers(QListView.NoEditTriggers)
+        self.setTextElideMode(Qt.ElideMiddle)
+        self.setFixedHeight(THUMBNAIL_SIZE + 44 + self.horizontalScrollBar().sizeHint().height() + 6)
+
+    def viewOptions(self):
+        # Icon above the text, as in icon mode, while keeping list mode's cheap uniform layout.
+        option = super().viewOptions()
+        option.decorationPosition = option.Top
+        option.displayAlignment = Qt.AlignHCenter | Qt.AlignTop
+        return option
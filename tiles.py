@@ -0,0 +1,490 @@
+import hashlib
+import math
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5 import sip
+from PyQt5.QtWidgets import QGraphicsObject
+from PyQt5.QtGui import QImage, QImageReader, QImageIOHandler, QPainter, QPixmap
+from PyQt5.QtCore import Qt, QObject, QRect, QRectF, QSize, pyqtSignal
+
+TILE_SIZE = 256
+# Images with more pixels than this are shown through a tile pyramid.
+TILED_PIXEL_THRESHOLD = 8192 * 8192
+OVERVIEW_SIZE = 2048
+# LodPixmapItem stops halving once the longer side is at most this many pixels.
+LOD_MIN_SIZE = 256
+BAND_BYTES = 64 * 1024 * 1024
+# Qt 5 refuses images of 2 GiB or more, so larger images are decoded in regions.
+MAX_DECODE_BYTES = 2 ** 31 - 1
+
+
+def tile_cache_root() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "image-annotation-tool", "tiles")
+
+
+def needs_tiling(filename) -> bool:
+    # Reads only the file header to decide whether the image is too large to decode at once.
+    size = QImageReader(filename).size()
+    return size.width() * size.height() > TILED_PIXEL_THRESHOLD
+
+###############################################################################
+#                              TilePyramid Class                              #
+###############################################################################
+class TilePyramid:
+    # On-disk pyramid of TILE_SIZE tiles for one image. Level 0 is full
+    # resolution and every following level halves both dimensions until the
+    # image fits in a single tile. Tiles are keyed by path, mtime and size, so
+    # a finished pyramid is reused until the image changes.
+    def __init__(self, filename, cache_root=None):
+        self.filename = filename
+        reader = QImageReader(filename)
+        size = reader.size()
+        self.width = size.width()
+        self.height = size.height()
+        self.tile_format = "jpg" if bytes(reader.format()) == b"jpeg" else "png"
+        self.supports_regions = reader.supportsOption(QImageIOHandler.ClipRect)
+        self.image_format = reader.imageFormat()
+        depth = QImage(1, 1, self.image_format).depth() if self.image_format != QImage.Format_Invalid else 32
+        self.bytes_per_line = (self.width * depth + 31) // 32 * 4
+        st = os.stat(filename)
+        key = f"{os.path.abspath(filename)}|{st.st_mtime_ns}|{st.st_size}"
+        root = cache_root or tile_cache_root()
+        self.directory = os.path.join(root, hashlib.sha1(key.encode("utf-8")).hexdigest())
+        self.level_sizes = [(self.width, self.height)]
+        w, h = self.width, self.height
+        while max(w, h) > TILE_SIZE:
+            w, h = (w + 1) // 2, (h + 1) // 2
+            self.level_sizes.append((w, h))
+
+    @property
+    def levels(self) -> int:
+        return len(self.level_sizes)
+
+    def grid(self, level):
+        # Number of tile columns and rows at `level`.
+        w, h = self.level_sizes[level]
+        return math.ceil(w / TILE_SIZE), math.ceil(h / TILE_SIZE)
+
+    def tile_path(self, level, col, row) -> str:
+        return os.path.join(self.directory, str(level), f"{col}_{row}.{self.tile_format}")
+
+    def is_complete(self) -> bool:
+        return os.path.exists(os.path.join(self.directory, "complete"))
+
+    def regions(self):
+        # (top, height) of the parts of the image decoded one at a time, as few
+        # as Qt's image size limit allows, or None if Qt cannot decode it at all:
+        # readers that cannot decode a region need the whole image at once.
+        if not self.supports_regions:
+            return [(0, self.height)] if self.bytes_per_line * self.height <= MAX_DECODE_BYTES else None
+        rows = max(TILE_SIZE, MAX_DECODE_BYTES // self.bytes_per_line // TILE_SIZE * TILE_SIZE)
+        return [(top, min(rows, self.height - top)) for top in range(0, self.height, rows)]
+
+    def read_overview(self) -> QImage:
+        # A preview at most OVERVIEW_SIZE on a side, stitched from the pyramid
+        # once it is built. Before that JPEG readers scale while decoding, so
+        # this stays cheap; other formats get theirs from build() and return null.
+        if self.is_complete():
+            return self._stitch(next(level for level, size in enumerate(self.level_sizes)
+                                     if max(size) <= OVERVIEW_SIZE))
+        if not self.supports_regions:
+            return QImage()
+        reader = QImageReader(self.filename)
+        scale = min(1.0, OVERVIEW_SIZE / max(self.width, self.height, 1))
+        reader.setScaledSize(QSize(max(1, round(self.width * scale)), max(1, round(self.height * scale))))
+        return reader.read()
+
+    def _stitch(self, level) -> QImage:
+        w, h = self.level_sizes[level]
+        image = QImage(w, h, QImage.Format_ARGB32)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        cols, rows = self.grid(level)
+        for row in range(rows):
+            for col in range(cols):
+                painter.drawImage(col * TILE_SIZE, row * TILE_SIZE, QImage(self.tile_path(level, col, row)))
+        painter.end()
+        return image
+
+    def build(self, cancelled=None, on_tile=None, on_overview=None) -> bool:
+        # Decodes the image region by region into a scratch memory map next to
+        # the tiles and cuts every level's tiles from it band by band. Decoded
+        # pixels live in the page cache instead of process memory, and since a
+        # JPEG reader decodes every row above the region it is asked for, few
+        # large regions keep the file from being decoded once per band. For
+        # formats without region decoding, `on_overview` gets a preview made
+        # from the decoded image. Returns False if cancelled or if decoding failed.
+        regions = self.regions()
+        if regions is None:
+            return False
+        for level in range(self.levels):
+            os.makedirs(os.path.join(self.directory, str(level)), exist_ok=True)
+        state = _BuildState(self.levels)
+        band_height = TILE_SIZE
+        while band_height * 2 * self.width * 4 <= BAND_BYTES:
+            band_height *= 2
+        with tempfile.TemporaryFile(dir=self.directory, suffix=".scratch") as scratch:
+            buffer = np.memmap(scratch, dtype=np.uint8, mode="w+", shape=(regions[0][1] * self.bytes_per_line,))
+            for top, height in regions:
+                if cancelled is not None and cancelled():
+                    return False
+                region = self._decode(top, height, buffer)
+                if region is None:
+                    return False
+                if on_overview is not None and not self.supports_regions:
+                    on_overview(region.scaled(OVERVIEW_SIZE, OVERVIEW_SIZE, Qt.KeepAspectRatio,
+                                              Qt.SmoothTransformation))
+                for y in range(0, height, band_height):
+                    if cancelled is not None and cancelled():
+                        return False
+                    band = region.copy(0, y, self.width, min(band_height, height - y))
+                    band = band.convertToFormat(QImage.Format_ARGB32 if band.hasAlphaChannel() else QImage.Format_RGB32)
+                    self._feed(0, band, state, on_tile, top + y + band.height() >= self.height)
+        with open(os.path.join(self.directory, "complete"), "w"):
+            pass
+        return True
+
+    def _decode(self, top, height, buffer):
+        # Decodes rows top..top + height into a QImage over `buffer` (Qt's
+        # readers decode into the image they are given when its size and
+        # format match). Returns None if the image could not be decoded.
+        reader = QImageReader(self.filename)
+        if self.supports_regions:
+            reader.setClipRect(QRect(0, top, self.width, height))
+        image = QImage(sip.voidptr(buffer.ctypes.data), self.width, height, self.bytes_per_line, self.image_format)
+        if not reader.read(image) or image.isNull():
+            return None
+        return image
+
+    def _feed(self, level, strip, state, on_tile, last):
+        # Cuts finished tile rows out of `strip` and passes a half-size copy of
+        # every even number of rows on to the next level.
+        w, _ = self.level_sizes[level]
+        buffer = _stack(state.buffers[level], strip, w)
+        while buffer is not None and (buffer.height() >= TILE_SIZE or last):
+            rows = min(TILE_SIZE, buffer.height())
+            self._write_tile_row(level, state.next_rows[level], buffer.copy(0, 0, w, rows), on_tile)
+            state.next_rows[level] += 1
+            buffer = buffer.copy(0, rows, w, buffer.height() - rows) if rows < buffer.height() else None
+        state.buffers[level] = buffer
+        if level + 1 == self.levels:
+            return
+        carry = _stack(state.carry[level], strip, w)
+        height = carry.height() if carry is not None else 0
+        take = height if last else height - height % 2
+        scaled = None
+        if take:
+            next_w, next_h = self.level_sizes[level + 1]
+            half = next_h - state.fed[level + 1] if last else take // 2
+            scaled = carry.copy(0, 0, w, take).scaled(next_w, half, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            state.fed[level + 1] += half
+        state.carry[level] = carry.copy(0, take, w, height - take) if take < height else None
+        if scaled is not None or last:
+            self._feed(level + 1, scaled, state, on_tile, last)
+
+    def _write_tile_row(self, level, row, strip, on_tile):
+        # Tiles are written under a temporary name and renamed, so a reader, or
+        # a second builder started for the same image, never sees a partial tile.
+        cols, _ = self.grid(level)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        for col in range(cols):
+            x = col * TILE_SIZE
+            tile = strip.copy(x, 0, min(TILE_SIZE, strip.width() - x), strip.height())
+            path = self.tile_path(level, col, row)
+            if not tile.save(path + suffix, self.tile_format.upper(), 90):
+                raise OSError(f"could not write {path}")
+            os.replace(path + suffix, path)
+            if on_tile is not None:
+                on_tile(level, col, row)
+
+
+class _BuildState:
+    # Per-level rows waiting to be cut into tiles or downscaled during build().
+    def __init__(self, levels):
+        self.buffers = [None] * levels
+        self.carry = [None] * levels
+        self.next_rows = [0] * levels
+        self.fed = [0] * levels
+
+
+def _stack(top, bottom, width):
+    # Returns `top` with `bottom` appended below it; either may be None.
+    if top is None:
+        return bottom
+    if bottom is None:
+        return top
+    merged = QImage(width, top.height() + bottom.height(), top.format())
+    painter = QPainter(merged)
+    painter.drawImage(0, 0, top)
+    painter.drawImage(0, top.height(), bottom)
+    painter.end()
+    return merged
+
+###############################################################################
+#                             TiledImageItem Class                            #
+###############################################################################
+class _TileSignals(QObject):
+    # Worker threads emit through this object rather than the item: scene.clear()
+    # may delete the item at any time, while this lives as long as the threads
+    # refer to it, and its connections to a deleted item are simply dropped.
+    tileReady = pyqtSignal(int, int, int)
+    tileLoaded = pyqtSignal(int, int, int, QImage)
+    overviewLoaded = pyqtSignal(QImage)
+    failed = pyqtSignal(str)
+
+
+class TiledImageItem(QGraphicsObject):
+    # Scene item for very large images. It spans the full-resolution image
+    # rectangle, so annotation coordinates are unaffected, but only paints the
+    # tiles of the pyramid level matching the current zoom. Tiles are decoded
+    # off the GUI thread and kept in an LRU cache bounded by `max_bytes`.
+    # Images Qt cannot decode are reported in place of the image.
+    def __init__(self, filename, max_bytes=256 * 1024 * 1024, workers=2, cache_root=None):
+        super().__init__()
+        self.pyramid = TilePyramid(filename, cache_root)
+        self.bounds = QRectF(0, 0, self.pyramid.width, self.pyramid.height)
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.tile_bytes = 0
+        self.pending = {}
+        self.overview = None
+        self.error = None
+        self.moving = False
+        self.built = self.pyramid.is_complete()
+        self._available = set()
+        self._cancel = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile-load")
+        self.setFlag(QGraphicsObject.ItemUsesExtendedStyleOption)
+        self.signals = _TileSignals()
+        self.signals.tileReady.connect(self._onTileReady)
+        self.signals.tileLoaded.connect(self._onTileLoaded)
+        self.signals.overviewLoaded.connect(self._onOverviewLoaded)
+        self.signals.failed.connect(self._onFailed)
+        self._builder = threading.Thread(target=self._prepare, name="tile-build", daemon=True)
+        self._builder.start()
+
+    def boundingRect(self):
+        return self.bounds
+
+    def shutdown(self):
+        # Stops building and loading; call before the item is removed from the scene.
+        self._cancel.set()
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self._executor.shutdown(wait=False)
+
+    def _emit(self, signal, *args):
+        # Worker threads: nothing is delivered once shutdown() was called.
+        if not self._cancel.is_set():
+            signal.emit(*args)
+
+    def _prepare(self):
+        pyramid = self.pyramid
+        name = os.path.basename(pyramid.filename)
+        if pyramid.regions() is None:
+            self._emit(self.signals.failed, f"{name}: {pyramid.width}x{pyramid.height} is too large for Qt to "
+                                            f"decode in this format; convert it to JPEG to view it")
+            return
+        overview = pyramid.read_overview()
+        if not overview.isNull():
+            self._emit(self.signals.overviewLoaded, overview)
+        if self.built:
+            return
+        try:
+            built = pyramid.build(self._cancel.is_set, lambda *tile: self._emit(self.signals.tileReady, *tile),
+                                  lambda image: self._emit(self.signals.overviewLoaded, image))
+        except OSError as e:
+            self._emit(self.signals.failed, f"{name}: could not build tiles: {e}")
+            return
+        if built:
+            self.built = True
+        elif not self._cancel.is_set():
+            self._emit(self.signals.failed, f"{name}: could not decode the image")
+
+    def _onOverviewLoaded(self, image):
+        self.overview = image
+        self.update()
+
+    def _onFailed(self, message):
+        print(message, file=sys.stderr)
+        self.error = message
+        self.update()
+
+    def _onTileReady(self, level, col, row):
+        self._available.add((level, col, row))
+        self.update(self._tileRect(level, col, row))
+
+    def _onTileLoaded(self, level, col, row, image):
+        key = (level, col, row)
+        self.pending.pop(key, None)
+        if image.isNull():
+            return
+        self.tiles[key] = image
+        self.tile_bytes += image.sizeInBytes()
+        while self.tile_bytes > self.max_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.tile_bytes -= evicted.sizeInBytes()
+        self.update(self._tileRect(level, col, row))
+
+    def _loadTile(self, level, col, row):
+        if self._cancel.is_set():
+            return
+        self._emit(self.signals.tileLoaded, level, col, row, QImage(self.pyramid.tile_path(level, col, row)))
+
+    def _tileRect(self, level, col, row) -> QRectF:
+        span = TILE_SIZE * 2 ** level
+        return QRectF(col * span, row * span, span, span).intersected(self.bounds)
+
+    def levelFor(self, lod) -> int:
+        # Finest level whose resolution still covers the on-screen resolution.
+        if lod >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1 / lod))), self.pyramid.levels - 1)
+
+    def setMoving(self, moving):
+        # Tiles are drawn without smoothing while the view moves.
+        if moving != self.moving:
+            self.moving = moving
+            if not moving:
+                self.update()
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.intersected(self.bounds)
+        if exposed.isEmpty():
+            return
+        if self.error is not None:
+            # In device coordinates, so the message is legible at any zoom.
+            area = painter.worldTransform().mapRect(self.bounds)
+            painter.resetTransform()
+            painter.fillRect(area, Qt.darkGray)
+            painter.setPen(Qt.white)
+            painter.drawText(area, Qt.AlignCenter | Qt.TextWordWrap, self.error)
+            return
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, not self.moving)
+        painter.setClipRect(self.bounds)
+        if self.overview is not None and not self.overview.isNull():
+            sx = self.overview.width() / self.bounds.width()
+            sy = self.overview.height() / self.bounds.height()
+            source = QRectF(exposed.x() * sx, exposed.y() * sy, exposed.width() * sx, exposed.height() * sy)
+            painter.drawImage(exposed, self.overview, source)
+        level = self.levelFor(option.levelOfDetailFromTransform(painter.worldTransform()))
+        scale = 2 ** level
+        span = TILE_SIZE * scale
+        cols, rows = self.pyramid.grid(level)
+        col0, col1 = int(exposed.left() // span), min(int(exposed.right() // span), cols - 1)
+        row0, row1 = int(exposed.top() // span), min(int(exposed.bottom() // span), rows - 1)
+        visible = set()
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                key = (level, col, row)
+                tile = self.tiles.get(key)
+                if tile is not None:
+                    self.tiles.move_to_end(key)
+                    painter.drawImage(QRectF(col * span, row * span, tile.width() * scale, tile.height() * scale), tile)
+                elif self.built or key in self._available:
+                    visible.add(key)
+                    if key not in self.pending:
+                        self.pending[key] = self._executor.submit(self._loadTile, *key)
+        for key, future in list(self.pending.items()):
+            # Drop requests for tiles that scrolled out of view before they started.
+            if key not in visible and future.cancel():
+                del self.pending[key]
+
+###############################################################################
+#                              LodPixmapItem Class                            #
+###############################################################################
+class _LevelSignals(QObject):
+    # Emitted by the level builder; see _TileSignals.
+    levelBuilt = pyqtSignal(int, QImage)
+
+
+class LodPixmapItem(QGraphicsObject):
+    # Scene item for images decoded in full. Level 0 is the image itself and
+    # level k halves it k times. A level is built off the GUI thread the first
+    # time a zoom bracket needs it and kept afterwards (all levels together
+    # add a third of the image). While the view moves, paint() draws the
+    # nearest level that is ready, without smoothing; once the view settles,
+    # the level matching the zoom is drawn smoothly. Only the exposed part of
+    # a level is drawn.
+
+    def __init__(self, image):
+        super().__init__()
+        self.bounds = QRectF(0, 0, image.width(), image.height())
+        self.levels = {0: QPixmap.fromImage(image)}
+        self.max_level = 0
+        while max(image.width(), image.height()) >> (self.max_level + 1) >= LOD_MIN_SIZE:
+            self.max_level += 1
+        self.moving = False
+        # Finest level the builder has reached; only the builder thread touches it.
+        self._chain = (0, image)
+        self._requested = {0}
+        self._cancel = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lod-build")
+        self.setFlag(QGraphicsObject.ItemUsesExtendedStyleOption)
+        self.signals = _LevelSignals()
+        self.signals.levelBuilt.connect(self._onLevelBuilt)
+
+    def boundingRect(self):
+        return self.bounds
+
+    def shutdown(self):
+        # Stops building levels; call before the item is removed from the scene.
+        self._cancel.set()
+        self._executor.shutdown(wait=False)
+
+    def levelFor(self, lod) -> int:
+        # Coarsest level whose resolution still covers the on-screen resolution.
+        if lod >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1 / lod))), self.max_level)
+
+    def setMoving(self, moving):
+        # Switches between the fast preview and the smooth repaint.
+        if moving != self.moving:
+            self.moving = moving
+            if not moving:
+                self.update()
+
+    def _build(self, level):
+        # Builder thread: halves the finest level reached so far until `level`,
+        # handing every intermediate level to the GUI thread as well.
+        current, image = self._chain
+        while current < level and not self._cancel.is_set():
+            image = image.scaled((image.width() + 1) // 2, (image.height() + 1) // 2,
+                                 Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            current += 1
+            self._chain = (current, image)
+            if self._cancel.is_set():
+                return
+            self.signals.levelBuilt.emit(current, image)
+
+    def _onLevelBuilt(self, level, image):
+        self.levels[level] = QPixmap.fromImage(image)
+        self.update()
+
+    def nearestLevel(self, level) -> int:
+        # Closest level already built; finer wins a tie.
+        return min(self.levels, key=lambda built: (abs(built - level), built))
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.intersected(self.bounds)
+        if exposed.isEmpty():
+            return
+        wanted = self.levelFor(option.levelOfDetailFromTransform(painter.worldTransform()))
+        if wanted not in self._requested and not self._cancel.is_set():
+            self._requested.update(range(wanted + 1))
+            self._executor.submit(self._build, wanted)
+        level = wanted if wanted in self.levels else self.nearestLevel(wanted)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, not self.moving and level == wanted)
+        pixmap = self.levels[level]
+        sx = pixmap.width() / self.bounds.width()
+        sy = pixmap.height() / self.bounds.height()
+        painter.drawPixmap(exposed, pixmap, QRectF(exposed.x() * sx, exposed.y() * sy,
+                                                   exposed.width() * sx, exposed.height() * sy))
@@ -0,0 +1,279 @@
+import argparse
+import json
+import math
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from convert import batched, bounded_map, read_classes
+from dataset import scan_dataset
+from image_headers import read_image_size
+from persistence import atomic_write
+
+###############################################################################
+#                                 Line Checks                                 #
+###############################################################################
+# Headless QA for the label-first TXT sidecars. Nothing here imports Qt. Every
+# sidecar is checked in a worker process against the size read from its
+# image header. With --fix the worker rewrites the file atomically: lines
+# without issues are kept verbatim and only repaired lines are re-serialized.
+#
+# Issue kinds, and what --fix does with them:
+#   malformed     fewer than five fields or non-numeric geometry  -> line dropped
+#   non_finite    NaN or infinite geometry                        -> line dropped
+#   label_spaces  label split into several fields by spaces       -> spaces become "_"
+#   extra_fields  numbers after the four geometry fields          -> fields dropped
+#   out_of_bounds box reaching outside the image                  -> clipped to the image
+#   degenerate    zero or negative area, or below --min-size px   -> line dropped
+#   duplicate     same label and IoU >= --iou with an earlier box -> line dropped
+#   overlap       different labels and IoU >= --iou               -> reported only (a warning)
+#   unknown_label label missing from --classes                    -> reported only
+#   image         image missing or with an unreadable header      -> reported only
+#   unreadable    sidecar that is not valid UTF-8 text            -> reported only
+#
+# Warnings are reported but only set the exit status with --strict: two
+# labels on one object are often intended.
+FIXABLE = frozenset(("malformed", "non_finite", "label_spaces", "extra_fields", "out_of_bounds",
+                     "degenerate", "duplicate"))
+WARNINGS = frozenset(("overlap",))
+BOUNDS_EPSILON = 1e-6
+# Decimals written for repaired geometry: well below a pixel on any image
+# Qt can load, without the float noise of clipping arithmetic.
+DECIMALS = 8
+
+
+def format_value(value) -> str:
+    return f"{value:.{DECIMALS}f}".rstrip("0").rstrip(".")
+
+
+def parse_floats(tokens):
+    try:
+        return [float(token) for token in tokens]
+    except ValueError:
+        return None
+
+
+def parse_line(line):
+    # Returns (label, [cx, cy, w, h], issues); the label is None for an unusable line.
+    # `issues` holds (kind, message) pairs.
+    parts = line.split()
+    if len(parts) < 5:
+        return None, None, [("malformed", f"expected 5 fields, found {len(parts)}")]
+    values = parse_floats(parts[1:5])
+    if values is not None:
+        label, issues = parts[0], []
+        if len(parts) > 5:
+            issues.append(("extra_fields", f"{len(parts) - 5} field(s) after the geometry"))
+    else:
+        values = parse_floats(parts[-4:])
+        if values is None:
+            return None, None, [("malformed", "geometry is not numeric")]
+        label = "_".join(parts[:-4])
+        issues = [("label_spaces", f"label {' '.join(parts[:-4])!r} contains spaces")]
+    if not all(math.isfinite(v) for v in values):
+        return None, None, issues + [("non_finite", "geometry is not finite")]
+    return label, values, issues
+
+
+def check_geometry(values, width, height, min_size):
+    # Returns (repaired [cx, cy, w, h] or None to drop the box, issues).
+    cx, cy, w, h = values
+    if w <= 0 or h <= 0:
+        return None, [("degenerate", f"zero or negative size {w:g} x {h:g}")]
+    issues = []
+    x1, y1, x2, y2 = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+    if x1 < -BOUNDS_EPSILON or y1 < -BOUNDS_EPSILON or x2 > 1 + BOUNDS_EPSILON or y2 > 1 + BOUNDS_EPSILON:
+        issues.append(("out_of_bounds", f"box ({x1:.4f}, {y1:.4f})-({x2:.4f}, {y2:.4f}) leaves the image"))
+        x1, y1 = max(x1, 0.0), max(y1, 0.0)
+        x2, y2 = min(x2, 1.0), min(y2, 1.0)
+        if x2 <= x1 or y2 <= y1:
+            return None, issues + [("degenerate", "no area left inside the image")]
+        values = [(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]
+    if (x2 - x1) * width < min_size or (y2 - y1) * height < min_size:
+        return None, issues + [
+            ("degenerate", f"{(x2 - x1) * width:.2f} x {(y2 - y1) * height:.2f} px is below {min_size:g} px")
+        ]
+    return values, issues
+
+###############################################################################
+#                                 Duplicates                                  #
+###############################################################################
+def overlapping_pairs(normalized, threshold, block=512):
+    # (i, j) pairs with i < j whose IoU is at least `threshold`, in order of i.
+    # Boxes are sorted by their left edge, and each block of rows is compared
+    # only with the boxes after it whose left edge lies before the block's
+    # rightmost right edge, so the IoU matrices stay small on dense images.
+    boxes = np.asarray(normalized, dtype=np.float64).reshape(-1, 4)
+    n = len(boxes)
+    x1 = boxes[:, 0] - boxes[:, 2] / 2
+    order = np.argsort(x1, kind="stable")
+    x1 = x1[order]
+    boxes = boxes[order]
+    y1 = boxes[:, 1] - boxes[:, 3] / 2
+    x2 = x1 + boxes[:, 2]
+    y2 = y1 + boxes[:, 3]
+    area = boxes[:, 2] * boxes[:, 3]
+    pairs = []
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        end = max(stop, int(np.searchsorted(x1, x2[start:stop].max(), side="left")))
+        rows = slice(start, stop)
+        cols = slice(start, end)
+        iw = np.minimum(x2[rows, None], x2[None, cols]) - np.maximum(x1[rows, None], x1[None, cols])
+        ih = np.minimum(y2[rows, None], y2[None, cols]) - np.maximum(y1[rows, None], y1[None, cols])
+        inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+        iou = inter / (area[rows, None] + area[None, cols] - inter)
+        # Only pairs above the diagonal: each pair once, never a box with itself.
+        upper = np.arange(stop - start)[:, None] < np.arange(end - start)[None, :]
+        i, j = np.nonzero((iou >= threshold) & upper)
+        i = order[i + start]
+        j = order[j + start]
+        pairs.extend(zip(np.minimum(i, j).tolist(), np.maximum(i, j).tolist()))
+    pairs.sort()
+    return pairs
+
+###############################################################################
+#                                  Sidecars                                   #
+###############################################################################
+def validate_sidecar(image_path, classes=None, iou=0.9, min_size=1.0, fix=False):
+    # Worker: returns (image_path, [(line number, kind, message), ...], fixed).
+    # Line number 0 refers to the whole file.
+    txt_path = os.path.splitext(image_path)[0] + ".txt"
+    try:
+        size = read_image_size(image_path)
+    except OSError as e:
+        return image_path, [(0, "image", str(e))], False
+    if size is None:
+        return image_path, [(0, "image", "unknown image format")], False
+    width, height = size
+    try:
+        with open(txt_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return image_path, [], False
+    except (OSError, UnicodeDecodeError) as e:
+        return image_path, [(0, "unreadable", str(e))], False
+
+    issues = []
+    # Output lines: the original text, or None for a dropped line, or a repaired line.
+    output = list(lines)
+    boxes = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        label, values, line_issues = parse_line(line)
+        if label is not None:
+            values, geometry_issues = check_geometry(values, width, height, min_size)
+            line_issues += geometry_issues
+            if classes is not None and label not in classes:
+                line_issues.append(("unknown_label", f"unknown label {label!r}"))
+        issues.extend((number, kind, message) for kind, message in line_issues)
+        if label is None or values is None:
+            output[number - 1] = None
+            continue
+        if any(kind in FIXABLE for kind, _ in line_issues):
+            output[number - 1] = " ".join([label] + [format_value(v) for v in values])
+        boxes.append((number, label, values))
+
+    if len(boxes) > 1:
+        numbers = [number for number, _, _ in boxes]
+        labels = [label for _, label, _ in boxes]
+        duplicates = set()
+        for i, j in overlapping_pairs([values for _, _, values in boxes], iou):
+            if i in duplicates or j in duplicates:
+                continue
+            if labels[i] == labels[j]:
+                duplicates.add(j)
+                issues.append((numbers[j], "duplicate", f"duplicates line {numbers[i]} ({labels[j]!r})"))
+                output[numbers[j] - 1] = None
+            else:
+                issues.append((numbers[j], "overlap",
+                               f"overlaps line {numbers[i]} with a different label ({labels[i]!r} vs {labels[j]!r})"))
+
+    fixed = False
+    if fix and any(kind in FIXABLE for _, kind, _ in issues):
+        atomic_write(txt_path, "".join(line + "\n" for line in output if line is not None))
+        fixed = True
+    issues.sort(key=lambda issue: issue[0])
+    return image_path, issues, fixed
+
+
+def validate_sidecars(image_paths, **options):
+    # Worker entry point; batches keep inter-process traffic low.
+    return [validate_sidecar(path, **options) for path in image_paths]
+
+
+def annotated_images(root):
+    # Image paths under `root` that have a TXT file, in scan order.
+    for directory, names, annotated in scan_dataset(root):
+        for name, has_txt in zip(names, annotated):
+            if has_txt:
+                yield os.path.join(directory, name)
+
+
+def validate(source, workers=None, classes=None, iou=0.9, min_size=1.0, fix=False, batch_size=64, window=32):
+    # Yields (image_path, issues, fixed) for every annotated image under `source`, in scan order.
+    check = partial(validate_sidecars, classes=classes, iou=iou, min_size=min_size, fix=fix)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch in bounded_map(executor, check, batched(annotated_images(source), batch_size), window):
+            yield from batch
+
+###############################################################################
+#                                Command Line                                 #
+###############################################################################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="validate",
+        description="Check label-first TXT annotations for malformed, out-of-bounds, degenerate and "
+                    "duplicate boxes without Qt. Exits with status 1 while issues other than "
+                    "warnings (overlap) remain."
+    )
+    parser.add_argument("source", help="directory tree containing images and their .txt files")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--classes", help="file with one allowed label per line; other labels are reported")
+    parser.add_argument("--iou", type=float, default=0.9, help="IoU at which two boxes are duplicates (default 0.9)")
+    parser.add_argument("--min-size", type=float, default=1.0, help="smallest box side in pixels (default 1)")
+    parser.add_argument("--fix", action="store_true", help="repair fixable issues in place (atomic rewrite)")
+    parser.add_argument("--strict", action="store_true", help="also exit with status 1 for warnings (overlap)")
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of one line per issue")
+    args = parser.parse_args(argv)
+    classes = frozenset(read_classes(args.classes)) if args.classes else None
+
+    checked = 0
+    fixed_files = 0
+    counts = Counter()
+    remaining = Counter()
+    details = []
+    for image_path, issues, fixed in validate(args.source, args.workers, classes, args.iou, args.min_size, args.fix):
+        checked += 1
+        fixed_files += fixed
+        txt_path = os.path.splitext(image_path)[0] + ".txt"
+        for number, kind, message in issues:
+            repaired = fixed and kind in FIXABLE
+            counts[kind] += 1
+            if not repaired and (args.strict or kind not in WARNINGS):
+                remaining[kind] += 1
+            if args.json:
+                details.append({"file": txt_path, "line": number, "kind": kind, "message": message, "fixed": repaired})
+            else:
+                print(f"{txt_path}:{number}: {kind}: {message}{' [fixed]' if repaired else ''}")
+
+    if args.json:
+        print(json.dumps({
+            "checked": checked, "fixed_files": fixed_files,
+            "issues": dict(sorted(counts.items())), "remaining": dict(sorted(remaining.items())),
+            "details": details,
+        }, indent=2))
+    summary = ", ".join(f"{n} {kind}" for kind, n in sorted(counts.items())) or "no issues"
+    print(f"Checked {checked} sidecars: {summary}"
+          + (f"; fixed {fixed_files} files, {sum(remaining.values())} issues remain" if args.fix else ""),
+          file=sys.stderr)
+    return 1 if remaining else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())